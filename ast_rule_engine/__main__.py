@@ -1,15 +1,33 @@
+from __future__ import annotations
+
 import argparse
+import os
 from pathlib import Path
 import re
-from ast_rule_engine.cli import run_cli, Options
+import time
+from typing import TYPE_CHECKING, Tuple
+
+if TYPE_CHECKING:
+    from ast_rule_engine.cli import Options
+
+
+_started = time.perf_counter()
 
 
 _no_match = re.compile(r"^\b$")
 
 
+def _file_and_line(raw: str) -> Tuple[Path, int]:
+    path, sep, line = raw.rpartition(":")
+    if not sep or not line.isdigit():
+        raise argparse.ArgumentTypeError("Expected FILE:LINE, got {0!r}".format(raw))
+    return Path(path), int(line)
+
+
 parser = argparse.ArgumentParser("ast_rule_engine")
 parser.add_argument(
     "root",
+    nargs="?",
     default=Path("."),
     help="Root folder where to apply the glob pattern",
     type=Path,
@@ -28,9 +46,24 @@ parser.add_argument(
     "--exclude",
     "-x",
     default=_no_match,
-    help="Exceptions to the `include` pattern (regexp for the path)",
+    help=(
+        "Exceptions to the `include` pattern (regexp for the path). Directories "
+        "that it matches with anything after them are not searched at all"
+    ),
     type=re.compile,
 )
+parser.add_argument(
+    "--gitignore",
+    action="store_true",
+    help="Skip files and directories ignored by .gitignore files under the root",
+)
+parser.add_argument(
+    "--files-from",
+    metavar="FILE",
+    default=None,
+    help="Search the files listed in FILE, one per line, instead ('-' for stdin)",
+    type=Path,
+)
 parser.add_argument(
     "--select",
     default=re.compile(r"[A-Z].*"),
@@ -43,15 +76,164 @@ parser.add_argument(
     help="Rules to exclude from reporting (regexp)",
     type=re.compile,
 )
-
-args = parser.parse_args()
-options = Options(
-    spec_path=args.spec,
-    root_dir=args.root,
-    inclue_glob=args.include,
-    exclude_pattern=args.exclude,
-    select=args.select,
-    unselect=args.unselect,
+parser.add_argument(
+    "--format",
+    choices=["text", "jsonl", "sarif"],
+    default="text",
+    help=(
+        "Output format: grouped by rule, one JSON object per match as soon as "
+        "its file is done, or a SARIF log"
+    ),
 )
+parser.add_argument(
+    "--explain",
+    metavar="FILE:LINE",
+    default=None,
+    help="Instead of searching, explain why rules (don't) match nodes on this line",
+    type=_file_and_line,
+)
+parser.add_argument(
+    "--jobs",
+    "-j",
+    default=1,
+    help="Number of processes to scan files with (0 means one per CPU)",
+    type=int,
+)
+parser.add_argument(
+    "--cache-dir",
+    default=None,
+    help="Directory to cache the parsed spec and per-file results in between runs",
+    type=Path,
+)
+parser.add_argument(
+    "--cache-max-size",
+    default=256,
+    help="Size limit of the cache directory in megabytes",
+    type=int,
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help=(
+        "Print time and match statistics per rule to stderr (rules run as "
+        "written, without optimizations)"
+    ),
+)
+parser.add_argument(
+    "--profile-json",
+    default=None,
+    help="Write time and match statistics per rule to this JSON file",
+    type=Path,
+)
+parser.add_argument(
+    "--adaptive-order",
+    action="store_true",
+    help=(
+        "Reorder the branches of :or and :and from match statistics collected "
+        "during the scan"
+    ),
+)
+parser.add_argument(
+    "--first-match-per-rule",
+    action="store_true",
+    help="Report only the first match of each rule, and stop matching it after",
+)
+parser.add_argument(
+    "--max-matches",
+    metavar="N",
+    default=None,
+    help="Stop the scan after N matches",
+    type=int,
+)
+parser.add_argument(
+    "--fail-fast",
+    action="store_true",
+    help="Stop the scan at the first match, and exit with status 1 if there is one",
+)
+parser.add_argument(
+    "--file-timeout",
+    metavar="SECONDS",
+    default=None,
+    help="Skip files that take longer than this to scan, and report them as skipped",
+    type=float,
+)
+changed = parser.add_mutually_exclusive_group()
+changed.add_argument(
+    "--changed-since",
+    metavar="REF",
+    default=None,
+    help="Only search files that changed since this git ref, or are untracked",
+)
+changed.add_argument(
+    "--staged",
+    action="store_true",
+    help="Only search files with changes staged for commit",
+)
+parser.add_argument(
+    "--changed-lines-only",
+    action="store_true",
+    help="With --changed-since or --staged, only report matches on changed lines",
+)
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    help="Keep running and print matches that appear or disappear as files change",
+)
+parser.add_argument(
+    "--watch-interval",
+    metavar="SECONDS",
+    default=1.0,
+    help="How often to check for changes in --watch mode",
+    type=float,
+)
+
+
+def options_from_args(args: argparse.Namespace) -> Options:
+    # Imported here so that `--help` and argument errors don't pay for it
+    from ast_rule_engine.cli import Options
+
+    if args.changed_lines_only and args.changed_since is None and not args.staged:
+        parser.error("--changed-lines-only needs --changed-since or --staged")
+    if args.watch and args.format != "text":
+        parser.error("--watch only supports --format text")
+    limited = args.first_match_per_rule or args.max_matches is not None
+    if args.watch and (limited or args.fail_fast):
+        parser.error(
+            "--first-match-per-rule, --max-matches and --fail-fast don't work "
+            "with --watch"
+        )
+    return Options(
+        spec_path=args.spec,
+        root_dir=args.root,
+        inclue_glob=args.include,
+        exclude_pattern=args.exclude,
+        select=args.select,
+        unselect=args.unselect,
+        explain=args.explain,
+        jobs=args.jobs or os.cpu_count() or 1,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_size * 1024 * 1024,
+        profile=args.profile,
+        profile_json=args.profile_json,
+        gitignore=args.gitignore,
+        files_from=args.files_from,
+        changed_since=args.changed_since,
+        staged=args.staged,
+        changed_lines_only=args.changed_lines_only,
+        watch=args.watch,
+        watch_interval=args.watch_interval,
+        output_format=args.format,
+        first_match_per_rule=args.first_match_per_rule,
+        max_matches=args.max_matches,
+        fail_fast=args.fail_fast,
+        file_timeout=args.file_timeout,
+        adaptive_order=args.adaptive_order,
+    )
+
+
+if __name__ == "__main__":
+    options = options_from_args(parser.parse_args())
+
+    from ast_rule_engine.cli import run_cli
 
-run_cli(options)
+    run_cli(options, _started)
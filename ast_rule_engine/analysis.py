@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+import ast
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from ast_rule_engine.draft import (
+    AndRule,
+    BoxTypeRule,
+    BoxValueRule,
+    BoxValueSetRule,
+    ExistsRule,
+    FFIRule,
+    ForallRule,
+    HasRule,
+    InsideRule,
+    IsAnyRule,
+    IsRule,
+    NotRule,
+    OrRule,
+    Pattern,
+    RefRule,
+    TupleRule,
+    VarRule,
+)
+
+
+RootTypes = Optional[FrozenSet[type]]
+"""
+Classes that a node must be an instance of for a pattern to match it.
+`None` means that the pattern could match any node.
+"""
+
+
+def root_types(pattern: Pattern) -> RootTypes:
+    return _root_types(pattern, set())
+
+
+def _root_types(pattern: Pattern, visiting: Set[str]) -> RootTypes:
+    if isinstance(pattern, IsRule):
+        node_cls = getattr(ast, pattern.class_name, None)
+        if node_cls is None:
+            return frozenset()
+        if not isinstance(node_cls, type):
+            return None
+        return frozenset([node_cls])
+
+    elif isinstance(pattern, IsAnyRule):
+        return frozenset(getattr(ast, name) for name in pattern.class_names)
+
+    elif isinstance(pattern, (HasRule, InsideRule)):
+        return frozenset([ast.AST])
+
+    elif isinstance(pattern, OrRule):
+        result: Set[type] = set()
+        for subpattern in pattern.patterns:
+            types = _root_types(subpattern, visiting)
+            if types is None:
+                return None
+            result.update(types)
+        return frozenset(result)
+
+    elif isinstance(pattern, AndRule):
+        intersection: RootTypes = None
+        for subpattern in pattern.patterns:
+            types = _root_types(subpattern, visiting)
+            if types is None:
+                continue
+            if intersection is None:
+                intersection = types
+            else:
+                intersection = _intersect(intersection, types)
+        return intersection
+
+    elif isinstance(pattern, RefRule):
+        if pattern.name in visiting:
+            return None
+        try:
+            target = pattern.get_pattern(pattern.name)
+        except KeyError:
+            return None
+        visiting.add(pattern.name)
+        try:
+            return _root_types(target, visiting)
+        finally:
+            visiting.remove(pattern.name)
+
+    elif isinstance(
+        pattern,
+        (
+            BoxTypeRule,
+            BoxValueRule,
+            BoxValueSetRule,
+            TupleRule,
+            ForallRule,
+            ExistsRule,
+        ),
+    ):
+        # These never accept an AST node
+        return frozenset()
+
+    else:
+        # `:not`, `$var`, FFI and whatever else can match anything
+        return None
+
+
+Requirement = FrozenSet[FrozenSet[type]]
+"""
+Node classes that must occur in the subtree of a node for a pattern to match
+it, as a conjunction of alternatives: from every inner set, at least one
+class has to be present (as a subclass). An empty inner set can never be
+satisfied.
+"""
+
+
+def required_types(pattern: Pattern) -> Requirement:
+    return _required_types(pattern, set())
+
+
+def _required_types(pattern: Pattern, visiting: Set[str]) -> Requirement:
+    if isinstance(pattern, IsRule):
+        node_cls = getattr(ast, pattern.class_name, None)
+        if node_cls is None:
+            return frozenset([frozenset()])
+        result: Set[FrozenSet[type]] = set()
+        if isinstance(node_cls, type):
+            result.add(frozenset([node_cls]))
+        for subpattern in pattern.attribute_rules.values():
+            result.update(_required_types(subpattern, visiting))
+        return frozenset(result)
+
+    elif isinstance(pattern, IsAnyRule):
+        return frozenset(
+            [frozenset(getattr(ast, name) for name in pattern.class_names)]
+        )
+
+    elif isinstance(pattern, OrRule):
+        # Any clause of each branch will do; the smallest keeps it tight
+        clause: Set[type] = set()
+        for subpattern in pattern.patterns:
+            requirement = _required_types(subpattern, visiting)
+            if not requirement:
+                return frozenset()
+            clause.update(
+                min(requirement, key=lambda c: (len(c), sorted(t.__name__ for t in c)))
+            )
+        return frozenset([frozenset(clause)])
+
+    elif isinstance(pattern, (AndRule, TupleRule)):
+        result = set()
+        for subpattern in pattern.patterns:
+            result.update(_required_types(subpattern, visiting))
+        return frozenset(result)
+
+    elif isinstance(pattern, ExistsRule):
+        return _required_types(pattern.predicate, visiting)
+
+    elif isinstance(pattern, HasRule):
+        # The descendant is part of the subtree, and so is what it needs
+        result = set(_required_types(pattern.pattern, visiting))
+        types = root_types(pattern.pattern)
+        if types is not None:
+            result.add(types)
+        return frozenset(result)
+
+    elif isinstance(pattern, RefRule):
+        if pattern.name in visiting:
+            return frozenset()
+        try:
+            target = pattern.get_pattern(pattern.name)
+        except KeyError:
+            return frozenset()
+        visiting.add(pattern.name)
+        try:
+            return _required_types(target, visiting)
+        finally:
+            visiting.remove(pattern.name)
+
+    else:
+        # `:not`, `:forall` (which holds for an empty list), `$var`, FFI and
+        # constants don't need any node to be there, and what `:inside` needs
+        # is outside of the subtree
+        return frozenset()
+
+
+# Text that every node of a class has in its source. Substrings are fine,
+# the filter only needs to be conservative.
+_NODE_TOKENS: Dict[str, Tuple[str, ...]] = {
+    "Assert": ("assert",),
+    "AsyncFor": ("async", "for"),
+    "AsyncFunctionDef": ("async", "def"),
+    "AsyncWith": ("async", "with"),
+    "Attribute": (".",),
+    "Await": ("await",),
+    "Break": ("break",),
+    "Call": ("(",),
+    "ClassDef": ("class",),
+    "Continue": ("continue",),
+    "Delete": ("del",),
+    "DictComp": ("for",),
+    "ExceptHandler": ("except",),
+    "For": ("for",),
+    "FunctionDef": ("def",),
+    "GeneratorExp": ("for",),
+    "Global": ("global",),
+    "If": ("if",),
+    "IfExp": ("if", "else"),
+    "Import": ("import",),
+    "ImportFrom": ("from", "import"),
+    "Lambda": ("lambda",),
+    "ListComp": ("for",),
+    "NamedExpr": (":=",),
+    "Nonlocal": ("nonlocal",),
+    "Pass": ("pass",),
+    "Raise": ("raise",),
+    "Return": ("return",),
+    "SetComp": ("for",),
+    "Starred": ("*",),
+    "Subscript": ("[",),
+    "Try": ("try",),
+    "TryStar": ("try",),
+    "While": ("while",),
+    "With": ("with",),
+    "Yield": ("yield",),
+    "YieldFrom": ("yield",),
+    "comprehension": ("for",),
+}
+
+# Attributes that hold identifiers, which are written out literally in the
+# source. Dotted names can have whitespace around their dots.
+_IDENTIFIER_ATTRS = {
+    ("Attribute", "attr"),
+    ("ClassDef", "name"),
+    ("AsyncFunctionDef", "name"),
+    ("FunctionDef", "name"),
+    ("Global", "names"),
+    ("ImportFrom", "module"),
+    ("Name", "id"),
+    ("Nonlocal", "names"),
+    ("alias", "name"),
+    ("alias", "asname"),
+    ("arg", "arg"),
+    ("keyword", "arg"),
+}
+
+
+TokenRequirement = FrozenSet[FrozenSet[str]]
+"""
+Text that must occur in the source of a file for a pattern to match any
+node in it, in the same conjunction-of-alternatives form as `Requirement`.
+This assumes ASCII source, since identifiers are NFKC-normalized.
+"""
+
+
+def required_tokens(pattern: Pattern) -> TokenRequirement:
+    return _required_tokens(pattern, False, set())
+
+
+def _identifier_tokens(values: Iterable[object]) -> TokenRequirement:
+    parts: List[List[str]] = []
+    for value in values:
+        if not isinstance(value, str):
+            return frozenset()
+        parts.append([part for part in value.split(".") if part])
+    if not all(parts):
+        return frozenset()
+    if len(parts) == 1:
+        return frozenset(frozenset([part]) for part in parts[0])
+    # Any one of the names will do, so only their first parts are needed
+    return frozenset([frozenset(part[0] for part in parts)])
+
+
+def _required_tokens(
+    pattern: Pattern, identifier: bool, visiting: Set[str]
+) -> TokenRequirement:
+    if isinstance(pattern, IsRule):
+        result: Set[FrozenSet[str]] = set(
+            frozenset([token]) for token in _NODE_TOKENS.get(pattern.class_name, ())
+        )
+        for attr, subpattern in pattern.attribute_rules.items():
+            result.update(
+                _required_tokens(
+                    subpattern,
+                    (pattern.class_name, attr) in _IDENTIFIER_ATTRS,
+                    visiting,
+                )
+            )
+        return frozenset(result)
+
+    elif isinstance(pattern, BoxValueRule):
+        return _identifier_tokens([pattern.value]) if identifier else frozenset()
+
+    elif isinstance(pattern, BoxValueSetRule):
+        return _identifier_tokens(pattern.values) if identifier else frozenset()
+
+    elif isinstance(pattern, OrRule):
+        clause: Set[str] = set()
+        for subpattern in pattern.patterns:
+            requirement = _required_tokens(subpattern, identifier, visiting)
+            if not requirement:
+                return frozenset()
+            clause.update(min(requirement, key=lambda c: (len(c), sorted(c))))
+        return frozenset([frozenset(clause)])
+
+    elif isinstance(pattern, (AndRule, TupleRule)):
+        result = set()
+        for subpattern in pattern.patterns:
+            result.update(_required_tokens(subpattern, identifier, visiting))
+        return frozenset(result)
+
+    elif isinstance(pattern, ExistsRule):
+        return _required_tokens(pattern.predicate, identifier, visiting)
+
+    elif isinstance(pattern, (HasRule, InsideRule)):
+        # The other node is somewhere else in the same file
+        return _required_tokens(pattern.pattern, False, visiting)
+
+    elif isinstance(pattern, RefRule):
+        if pattern.name in visiting:
+            return frozenset()
+        try:
+            target = pattern.get_pattern(pattern.name)
+        except KeyError:
+            return frozenset()
+        visiting.add(pattern.name)
+        try:
+            return _required_tokens(target, identifier, visiting)
+        finally:
+            visiting.remove(pattern.name)
+
+    else:
+        # Text can't be required for what `:not`, `$var`, FFI and the like
+        # accept, nor for a constant, which can be spelt in many ways
+        return frozenset()
+
+
+def _intersect(left: FrozenSet[type], right: FrozenSet[type]) -> FrozenSet[type]:
+    result: Set[type] = set()
+    for a in left:
+        for b in right:
+            if issubclass(a, b):
+                result.add(a)
+            elif issubclass(b, a):
+                result.add(b)
+    return frozenset(result)
+
+
+def has_captures(pattern: Pattern) -> bool:
+    """
+    Whether matching `pattern` can produce a non-empty capture dict. FFI
+    functions are opaque, so they are assumed to capture something.
+    """
+    stack = [pattern]
+    seen_refs: Set[str] = set()
+    while stack:
+        current = stack.pop()
+        if isinstance(current, (VarRule, FFIRule)):
+            return True
+        elif isinstance(current, IsRule):
+            stack.extend(current.attribute_rules.values())
+        elif isinstance(current, (OrRule, AndRule, TupleRule)):
+            stack.extend(current.patterns)
+        elif isinstance(current, (ForallRule, ExistsRule)):
+            stack.append(current.predicate)
+        elif isinstance(current, (HasRule, InsideRule)):
+            stack.append(current.pattern)
+        elif isinstance(current, RefRule):
+            if current.name in seen_refs:
+                continue
+            seen_refs.add(current.name)
+            try:
+                stack.append(current.get_pattern(current.name))
+            except KeyError:
+                pass
+        # Captures under `:not` are always thrown away
+    return False
+
+
+def has_ffi(pattern: Pattern) -> bool:
+    """
+    Whether matching `pattern` can call an FFI function, which might have
+    side effects.
+    """
+    stack = [pattern]
+    seen_refs: Set[str] = set()
+    while stack:
+        current = stack.pop()
+        if isinstance(current, FFIRule):
+            return True
+        elif isinstance(current, IsRule):
+            stack.extend(current.attribute_rules.values())
+        elif isinstance(current, (OrRule, AndRule, TupleRule)):
+            stack.extend(current.patterns)
+        elif isinstance(current, (ForallRule, ExistsRule)):
+            stack.append(current.predicate)
+        elif isinstance(current, (HasRule, InsideRule)):
+            stack.append(current.pattern)
+        elif isinstance(current, NotRule):
+            stack.append(current.wrapped)
+        elif isinstance(current, RefRule):
+            if current.name in seen_refs:
+                continue
+            seen_refs.add(current.name)
+            try:
+                stack.append(current.get_pattern(current.name))
+            except KeyError:
+                pass
+    return False
+
+
+def has_bare_refs(pattern: Pattern) -> bool:
+    """
+    Whether `pattern` applies a reference to the term itself rather than to
+    a part of it. Only those can run into left recursion.
+    """
+    stack = [pattern]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, RefRule):
+            return True
+        elif isinstance(current, (OrRule, AndRule)):
+            stack.extend(current.patterns)
+        elif isinstance(current, NotRule):
+            stack.append(current.wrapped)
+    return False
+
+
+# Rough relative costs of matching, for ordering `:or` and `:and` branches
+_TYPE_CHECK_COST = 1.0
+_VALUE_CHECK_COST = 2.0
+_REF_COST = 10.0
+_LIST_COST = 4.0
+_TREE_COST = 8.0
+
+
+def estimated_cost(pattern: Pattern) -> float:
+    """
+    A static guess of how expensive matching `pattern` is. Parts that are
+    only matched once a type check passed count for half, references count
+    as expensive without looking into them.
+    """
+    if isinstance(pattern, (IsAnyRule, BoxTypeRule, VarRule)):
+        return _TYPE_CHECK_COST
+    elif isinstance(pattern, (BoxValueRule, BoxValueSetRule)):
+        return _VALUE_CHECK_COST
+    elif isinstance(pattern, IsRule):
+        attributes = pattern.attribute_rules.values()
+        return _TYPE_CHECK_COST + sum(map(estimated_cost, attributes)) / 2
+    elif isinstance(pattern, (OrRule, AndRule)):
+        return sum(estimated_cost(subpattern) for subpattern in pattern.patterns)
+    elif isinstance(pattern, TupleRule):
+        return _TYPE_CHECK_COST + sum(
+            estimated_cost(subpattern) for subpattern in pattern.patterns
+        )
+    elif isinstance(pattern, (ForallRule, ExistsRule)):
+        return _TYPE_CHECK_COST + _LIST_COST * estimated_cost(pattern.predicate)
+    elif isinstance(pattern, (HasRule, InsideRule)):
+        return _TYPE_CHECK_COST + _TREE_COST * estimated_cost(pattern.pattern)
+    elif isinstance(pattern, NotRule):
+        return estimated_cost(pattern.wrapped)
+    else:
+        return _REF_COST
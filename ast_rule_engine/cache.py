@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from ast_rule_engine.scan import MatchRecord
+
+
+# Bump this whenever the meaning of cached results changes
+_CACHE_FORMAT = 2
+
+# Temporary files older than this are left over from runs that died while
+# writing them; younger ones may still be renamed into place
+_ORPHAN_AGE = 3600.0
+
+CachedMatch = Tuple[
+    str, int, int, str, Tuple[Tuple[str, str], ...], Optional[int], Optional[int]
+]
+
+
+def spec_hash(raw_spec: object, rule_names: Iterable[str]) -> str:
+    normalized = json.dumps(
+        {"spec": raw_spec, "rules": sorted(rule_names)},
+        sort_keys=True,
+        default=repr,
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of per-file match results. An entry is keyed by the file
+    contents, the spec and the interpreter version (the AST differs between
+    Python versions). Entries are written atomically, so several runs can
+    share one directory. Least recently used entries are evicted once the
+    directory, cached specs included, grows over `max_bytes`.
+    """
+
+    def __init__(self, directory: Path, spec_key: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.spec_key = spec_key
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._salt = "{0}:{1}:{2}:{3}".format(
+            _CACHE_FORMAT,
+            sys.implementation.name,
+            sys.version_info[:3],
+            spec_key,
+        ).encode("utf-8")
+
+    def key(self, data: bytes) -> str:
+        digest = hashlib.sha256(self._salt)
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / "{0}.json".format(key)
+
+    def get(self, key: str, path: str) -> Optional[List[MatchRecord]]:
+        entry = self._entry_path(key)
+        try:
+            raw = entry.read_text("utf-8")
+            os.utime(entry)
+            matches = json.loads(raw)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return [
+            MatchRecord(
+                rule,
+                path,
+                line,
+                col,
+                node_type,
+                tuple((k, v) for k, v in captures),
+                end_line,
+                end_col,
+            )
+            for rule, line, col, node_type, captures, end_line, end_col in matches
+        ]
+
+    def put(self, key: str, records: Iterable[MatchRecord]) -> None:
+        matches: List[CachedMatch] = [
+            (r.rule, r.line, r.col, r.node_type, r.captures, r.end_line, r.end_col)
+            for r in records
+        ]
+        entry = self._entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(matches, f)
+            os.replace(tmp_name, entry)
+        except BaseException:
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+            raise
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the whole directory fits
+        into `max_bytes`. Temporary files that are still being written count
+        towards the size, but are only deleted once they are orphaned.
+        Returns the number of deleted files.
+        """
+        entries: List[Tuple[float, int, str]] = []
+        total = 0
+        orphaned_before = time.time() - _ORPHAN_AGE
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                total += stat.st_size
+                if filename.endswith(".tmp") and stat.st_mtime > orphaned_before:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, full))
+
+        deleted = 0
+        entries.sort()
+        for _, size, full in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(full)
+            except OSError:
+                continue
+            total -= size
+            deleted += 1
+        return deleted
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import codecs
+from pathlib import Path
+import re
+import subprocess
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ast_rule_engine.scan import MatchRecord
+
+
+LineRanges = Optional[List[Tuple[int, int]]]
+"""
+Inclusive ranges of changed lines of a file, or `None` if the whole file is
+new.
+"""
+
+
+class GitError(Exception):
+    pass
+
+
+_HUNK = re.compile(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def _git(cwd: Path, args: Sequence[str]) -> str:
+    try:
+        result = subprocess.run(
+            ["git", "-c", "core.quotePath=false"] + list(args),
+            cwd=str(cwd),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        raise GitError("Could not run git: {0}".format(e))
+    if result.returncode != 0:
+        raise GitError(
+            "git {0} failed: {1}".format(
+                " ".join(args), result.stderr.decode("utf-8", "replace").strip()
+            )
+        )
+    return result.stdout.decode("utf-8", "surrogateescape")
+
+
+def _unquote(name: str) -> str:
+    if name.startswith('"') and name.endswith('"'):
+        raw = codecs.escape_decode(name[1:-1].encode("utf-8", "surrogateescape"))[0]
+        return raw.decode("utf-8", "surrogateescape")  # type: ignore
+    return name
+
+
+def parse_diff(diff: str) -> Dict[str, LineRanges]:
+    """
+    Changed line ranges per file from the output of `git diff -U0`, keyed by
+    the path after the change. Deleted files are left out.
+    """
+    changes: Dict[str, LineRanges] = {}
+    current: Optional[List[Tuple[int, int]]] = None
+
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            name = _unquote(line[4:].rstrip("\t"))
+            if name == "/dev/null":
+                current = None
+            else:
+                current = changes.setdefault(name[2:], [])  # type: ignore
+        elif line.startswith("@@") and current is not None:
+            match = _HUNK.match(line)
+            if match is None:
+                continue
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            # Pure deletions don't leave any changed lines behind
+            if count:
+                current.append((start, start + count - 1))
+
+    return changes
+
+
+def parse_name_status(output: str) -> List[str]:
+    """
+    Paths after the change from the output of `git diff --name-status -z`.
+    Renames and copies name both paths, the new one last.
+    """
+    fields = output.split("\0")
+    names: List[str] = []
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i]
+        if status[0] in "RC":
+            names.append(fields[i + 2])
+            i += 3
+        else:
+            names.append(fields[i + 1])
+            i += 2
+    return names
+
+
+def changed_files(
+    root: Path, since: Optional[str] = None, staged: bool = False
+) -> Dict[Path, LineRanges]:
+    """
+    Files that changed in the git repository around `root`: compared to the
+    index with `staged`, otherwise the working tree compared to `since`
+    (which can be anything `git diff` takes, like `origin/main...`). With
+    `since`, untracked files count as new. Paths are absolute.
+    """
+    toplevel = Path(_git(root, ["rev-parse", "--show-toplevel"]).strip())
+    # Whatever the user's diff.noprefix, diff.mnemonicPrefix and
+    # diff.relative say, paths are relative to the top level and prefixed
+    args = [
+        "diff",
+        "--no-ext-diff",
+        "--no-color",
+        "--src-prefix=a/",
+        "--dst-prefix=b/",
+        "--no-relative",
+        "-M",
+        "--diff-filter=ACMR",
+    ]
+    if staged:
+        args.append("--cached")
+    elif since is not None:
+        args += [since, "--"]
+
+    # Pure renames and mode changes have no hunks, so the files come from
+    # the name status and only the line ranges from the diff
+    ranges = parse_diff(_git(root, args[:1] + ["-U0"] + args[1:]))
+    names = parse_name_status(_git(root, args[:1] + ["--name-status", "-z"] + args[1:]))
+    changes: Dict[Path, LineRanges] = {
+        toplevel / name: ranges.get(name, []) for name in names
+    }
+
+    if not staged:
+        untracked = _git(toplevel, ["ls-files", "-z", "--others", "--exclude-standard"])
+        for name in untracked.split("\0"):
+            if name:
+                changes[toplevel / name] = None
+
+    return changes
+
+
+def in_changed_lines(
+    records: Iterable[MatchRecord], changes: Dict[Path, LineRanges]
+) -> Iterator[MatchRecord]:
+    by_path = {str(path.resolve()): ranges for path, ranges in changes.items()}
+    for record in records:
+        ranges = by_path.get(str(Path(record.path).resolve()))
+        if ranges is None or any(start <= record.line <= end for start, end in ranges):
+            yield record
@@ -1,13 +1,33 @@
+from __future__ import annotations
+
 import ast
 from dataclasses import dataclass
 from pathlib import Path
 import re
-from typing import Callable, List, NoReturn, Pattern
+import sys
+import time
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    Mapping,
+    NoReturn,
+    Optional,
+    Pattern,
+    Tuple,
+)
 
-import yaml
+from ast_rule_engine.draft import Pattern as RulePattern
+from ast_rule_engine.spec_cache import load_patterns
 
-from ast_rule_engine.parse import parse
-from ast_rule_engine.patch_const import LegacyConstantRewriter
+# Everything else is imported where it's used, so that runs which don't need
+# it (and a spec cache hit) don't pay for importing it
+if TYPE_CHECKING:
+    from ast_rule_engine.cache import ResultCache
+    from ast_rule_engine.changes import LineRanges
+    from ast_rule_engine.dispatch import DispatchTable
+    from ast_rule_engine.scan import FileTimeout, MatchLimits, MatchRecord, Scanner
 
 
 @dataclass(frozen=True)
@@ -18,65 +38,342 @@ class Options:
     select: Pattern[str]
     unselect: Pattern[str]
     exclude_pattern: Pattern[str]
+    explain: Optional[Tuple[Path, int]] = None
+    jobs: int = 1
+    cache_dir: Optional[Path] = None
+    cache_max_bytes: int = 256 * 1024 * 1024
+    profile: bool = False
+    profile_json: Optional[Path] = None
+    gitignore: bool = False
+    files_from: Optional[Path] = None
+    changed_since: Optional[str] = None
+    staged: bool = False
+    changed_lines_only: bool = False
+    watch: bool = False
+    watch_interval: float = 1.0
+    output_format: str = "text"
+    first_match_per_rule: bool = False
+    max_matches: Optional[int] = None
+    fail_fast: bool = False
+    file_timeout: Optional[float] = None
+    adaptive_order: bool = False
 
 
 def _dummy_get_ffi(_key: str) -> NoReturn:
     raise NotImplementedError("FFI is not supported yet")
 
 
-class _NodeCollector(ast.NodeVisitor):
-    def __init__(self, callback: Callable[[ast.AST], None]) -> None:
-        self._callback = callback
+def _explain(
+    path: Path,
+    line: int,
+    patterns: Mapping[str, RulePattern],
+    table: DispatchTable,
+) -> None:
+    from ast_rule_engine.compile import compile_patterns
+    from ast_rule_engine.structure import TreeIndex
+
+    trees = TreeIndex()
+    trees.load_tree(ast.parse(path.read_text("utf-8")))
+    matchers = compile_patterns(patterns, trees)
+    nodes = trees.nodes
+
+    print(f"Explaining line {line} of {path}:")
+    for node in nodes:
+        if getattr(node, "lineno", None) != line:
+            continue
+
+        for pattern_name in table.rules_for(type(node)):
+            result = matchers[pattern_name](node)
+            verdict = "matched" if not isinstance(result, str) else result
+            print(
+                f"  {pattern_name!r} on {type(node).__name__} at col {node.col_offset}: {verdict}"
+            )
+
+
+def find_paths(
+    options: Options,
+    changes: Optional[Dict[Path, LineRanges]],
+    cwd: Optional[Path] = None,
+) -> Iterator[Path]:
+    from ast_rule_engine.discover import discover, read_file_list, select_paths
+
+    if changes is not None:
+        return select_paths(
+            options.root_dir.expanduser(),
+            options.inclue_glob,
+            options.exclude_pattern,
+            changes,
+            cwd,
+        )
 
-    def visit(self, node: ast.AST) -> None:
-        self._callback(node)
-        super().visit(node)
+    if options.files_from is None:
+        return discover(
+            options.root_dir.expanduser(),
+            options.inclue_glob,
+            options.exclude_pattern,
+            options.gitignore,
+            cwd,
+        )
 
+    if str(options.files_from) == "-":
+        return read_file_list(sys.stdin, options.exclude_pattern)
 
-def _get_all_nodes(node: ast.AST) -> List[ast.AST]:
-    LegacyConstantRewriter().visit(node)
-    nodes: List[ast.AST] = []
-    _NodeCollector(nodes.append).visit(node)
-    return nodes
+    with options.files_from.open(encoding="utf-8") as f:
+        return iter(list(read_file_list(f, options.exclude_pattern)))
 
 
-def run_cli(options: Options) -> None:
-    raw_spec = yaml.safe_load(options.spec_path.read_text("utf-8"))
+def git_changes(
+    options: Options, cwd: Optional[Path] = None
+) -> Optional[Dict[Path, LineRanges]]:
+    if options.changed_since is None and not options.staged:
+        return None
+    from ast_rule_engine.changes import changed_files
 
-    patterns = parse(raw_spec, _dummy_get_ffi)
+    root = options.root_dir.expanduser()
+    return changed_files(
+        root if cwd is None else cwd / root, options.changed_since, options.staged
+    )
+
+
+def load_spec(
+    spec_path: Path,
+    select: Pattern[str],
+    unselect: Pattern[str],
+    cache_dir: Optional[Path] = None,
+    optimized: bool = True,
+) -> Tuple[object, Dict[str, RulePattern]]:
+    raw_spec, patterns = load_patterns(spec_path, _dummy_get_ffi, cache_dir, optimized)
     patterns = {
         name: pattern
         for name, pattern in patterns.items()
-        if options.select.fullmatch(name) and not options.unselect.fullmatch(name)
+        if select.fullmatch(name) and not unselect.fullmatch(name)
     }
+    return raw_spec, patterns
 
-    root = options.root_dir.expanduser()
-    path_to_nodes = {
-        path: _get_all_nodes(ast.parse(path.read_text("utf-8")))
-        for path in root.glob(options.inclue_glob)
-        if not options.exclude_pattern.fullmatch(str(path)) and path.is_file()
-    }
 
-    for pattern_name, pattern in patterns.items():
-        pattern_printed = False
-        for path, nodes in path_to_nodes.items():
-            path_printed = False
-            for node in nodes:
-                captures = pattern.match(node)
-                if isinstance(captures, str):
-                    continue
-
-                if not pattern_printed:
-                    print(f"Matches for {pattern_name!r}:")
-                    pattern_printed = True
-
-                if not path_printed:
-                    print(f"  In {path}:")
-                    path_printed = True
-
-                print(
-                    f"    at line {node.lineno}, col {node.col_offset}: {type(node).__name__}"
-                )
-                if captures:
-                    for k, v in captures.items():
-                        print(f"      - {k}: {v}")
+def _open_cache(
+    options: Options, raw_spec: object, patterns: Mapping[str, RulePattern]
+) -> Optional[ResultCache]:
+    if options.cache_dir is None:
+        return None
+    from ast_rule_engine.cache import ResultCache, spec_hash
+
+    return ResultCache(
+        options.cache_dir.expanduser(),
+        spec_hash(raw_spec, patterns),
+        options.cache_max_bytes,
+    )
+
+
+def _print_change(sign: str, record: MatchRecord) -> None:
+    print(
+        f"{sign} {record.rule!r} in {record.path} "
+        f"at line {record.line}, col {record.col}: {record.node_type}"
+    )
+    for k, v in record.captures:
+        print(f"      - {k}: {v}")
+
+
+def _match_limits(options: Options) -> Optional[MatchLimits]:
+    max_matches = 1 if options.fail_fast else options.max_matches
+    if not options.first_match_per_rule and max_matches is None:
+        return None
+    from ast_rule_engine.scan import MatchLimits
+
+    return MatchLimits(options.first_match_per_rule, max_matches)
+
+
+def _spec_cache_dir(options: Options) -> Optional[Path]:
+    return None if options.cache_dir is None else options.cache_dir.expanduser()
+
+
+def _watch(options: Options) -> None:
+    import yaml
+
+    from ast_rule_engine.changes import GitError
+    from ast_rule_engine.compile import LeftRecursionError
+    from ast_rule_engine.output import print_matches
+    from ast_rule_engine.parse import ParseError
+    from ast_rule_engine.scan import Scanner, group_by_rule
+    from ast_rule_engine.watch import Watcher
+
+    def load_scanner() -> Scanner:
+        raw_spec, patterns = load_spec(
+            options.spec_path,
+            options.select,
+            options.unselect,
+            _spec_cache_dir(options),
+        )
+        return Scanner(
+            patterns,
+            _open_cache(options, raw_spec, patterns),
+            file_timeout=options.file_timeout,
+            adaptive_order=options.adaptive_order,
+        )
+
+    # A list of files can only be read once
+    files = None
+    if options.files_from is not None:
+        files = list(find_paths(options, None))
+
+    def watched_paths() -> Iterable[Path]:
+        if files is not None:
+            return files
+        return find_paths(options, git_changes(options))
+
+    def on_error(path: Path, error: Exception) -> None:
+        print(f"Error in {path}: {error}", file=sys.stderr)
+
+    watcher = Watcher(load_scanner, watched_paths, options.spec_path, on_error)
+    first = True
+    try:
+        while True:
+            try:
+                added, removed = watcher.refresh()
+            except (GitError, LeftRecursionError, ParseError, yaml.YAMLError) as e:
+                print(f"Error: {e}", file=sys.stderr)
+            else:
+                if first:
+                    assert watcher.scanner is not None
+                    print_matches(group_by_rule(added, watcher.scanner.rules))
+                    first = False
+                else:
+                    for record in removed:
+                        _print_change("-", record)
+                    for record in added:
+                        _print_change("+", record)
+                sys.stdout.flush()
+            time.sleep(options.watch_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_cli(options: Options, started: Optional[float] = None) -> None:
+    """
+    `started` is the `time.perf_counter()` of when the program started, for
+    the startup time in the profile.
+    """
+    if options.watch:
+        _watch(options)
+        return
+
+    from ast_rule_engine.compile import LeftRecursionError
+    from ast_rule_engine.output import make_renderer
+    from ast_rule_engine.scan import Scanner, limit_matches
+
+    profiling = options.profile or options.profile_json is not None
+
+    # Profiles count `:or` branches by where they are in the spec, which
+    # optimizing merges and reorders
+    loading = time.perf_counter()
+    raw_spec, patterns = load_spec(
+        options.spec_path,
+        options.select,
+        options.unselect,
+        _spec_cache_dir(options),
+        optimized=not profiling,
+    )
+    cache = _open_cache(options, raw_spec, patterns)
+
+    profiler = None
+    if profiling:
+        from ast_rule_engine.profiling import Profiler
+
+        profiler = Profiler()
+
+    compiling = time.perf_counter()
+    scanner = Scanner(
+        patterns, cache, profiler, options.file_timeout, options.adaptive_order
+    )
+
+    if profiler is not None:
+        if started is not None:
+            profiler.record_startup("imports", loading - started)
+        profiler.record_startup("spec", compiling - loading)
+        profiler.record_startup("compile", time.perf_counter() - compiling)
+
+    if options.explain is not None:
+        path, line = options.explain
+        _explain(path, line, patterns, scanner.table)
+        return
+
+    changes = None
+    if options.changed_since is not None or options.staged:
+        from ast_rule_engine.changes import GitError
+
+        try:
+            changes = git_changes(options)
+        except GitError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    paths = find_paths(options, changes)
+    if options.jobs > 1 and profiler is not None:
+        print(
+            "Profiling only works with a single job, ignoring --jobs",
+            file=sys.stderr,
+        )
+
+    def on_timeout(error: FileTimeout) -> None:
+        print(f"Skipped {error}", file=sys.stderr)
+
+    renderer = make_renderer(options.output_format, sys.stdout, patterns)
+
+    def on_file_done(path: Path) -> None:
+        renderer.file_done(str(path))
+
+    if options.jobs > 1 and profiler is None:
+        from ast_rule_engine.parallel import scan_paths_parallel
+
+        records = scan_paths_parallel(
+            raw_spec,
+            list(patterns),
+            _dummy_get_ffi,
+            paths,
+            options.jobs,
+            cache,
+            file_timeout=options.file_timeout,
+            on_timeout=on_timeout,
+            adaptive_order=options.adaptive_order,
+            on_file_done=on_file_done,
+        )
+    else:
+        records = scanner.scan_paths(paths, on_timeout, on_file_done)
+    if changes is not None and options.changed_lines_only:
+        from ast_rule_engine.changes import in_changed_lines
+
+        records = in_changed_lines(records, changes)
+    limits = _match_limits(options)
+    if limits is not None:
+        records = limit_matches(records, limits, scanner.disabled.add)
+
+    matched = False
+    try:
+        for record in records:
+            renderer.add(record)
+            matched = True
+    except LeftRecursionError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if cache is not None:
+        evicted = cache.evict()
+        print(
+            f"Cache: {cache.hits} hits, {cache.misses} misses, {evicted} evicted",
+            file=sys.stderr,
+        )
+
+    renderer.close()
+
+    if profiler is not None:
+        if options.profile:
+            print(profiler.format_report(), file=sys.stderr)
+        if options.profile_json is not None:
+            import json
+
+            options.profile_json.write_text(
+                json.dumps(profiler.to_json(), indent=2), "utf-8"
+            )
+
+    if options.fail_fast and matched:
+        sys.exit(1)
@@ -0,0 +1,65 @@
+"""
+Thin client for `python -m ast_rule_engine.daemon`. Takes the same
+arguments as `python -m ast_rule_engine`, has the daemon run them and
+prints what it answers. Only the standard library is imported, so that
+starting it is cheap.
+"""
+
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List
+
+
+def default_socket_path() -> str:
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR", "/tmp")
+    return os.path.join(directory, "ast_rule_engine-{0}.sock".format(os.getuid()))
+
+
+def request(socket_path: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send one JSON request to the daemon and return its JSON response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        chunks: List[bytes] = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(b"\n"):
+                break
+    return json.loads(b"".join(chunks).decode("utf-8"))
+
+
+def main(argv: List[str]) -> int:
+    socket_path = default_socket_path()
+    if argv[:1] == ["--socket"]:
+        socket_path = argv[1]
+        argv = argv[2:]
+
+    try:
+        response = request(
+            socket_path, {"command": "cli", "args": argv, "cwd": os.getcwd()}
+        )
+    except (OSError, ValueError) as e:
+        print(
+            "Error: no daemon at {0} ({1}), start one with "
+            "`python -m ast_rule_engine.daemon`".format(socket_path, e),
+            file=sys.stderr,
+        )
+        return 2
+
+    if "error" in response:
+        print("Error: {0}".format(response["error"]), file=sys.stderr)
+        return 2
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["status"]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
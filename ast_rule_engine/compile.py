@@ -0,0 +1,1110 @@
+from __future__ import annotations
+
+import ast
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from ast_rule_engine.analysis import (
+    estimated_cost,
+    has_bare_refs,
+    has_captures,
+    has_ffi,
+    root_types,
+)
+from ast_rule_engine.draft import (
+    AndRule,
+    Box,
+    BoxTypeRule,
+    BoxValueRule,
+    BoxValueSetRule,
+    Captures,
+    ExistsRule,
+    ForallRule,
+    HasRule,
+    InsideRule,
+    IsAnyRule,
+    IsRule,
+    Match,
+    NotRule,
+    OrRule,
+    Pattern,
+    RefRule,
+    Term,
+    TupleRule,
+    VarRule,
+    to_term,
+)
+from ast_rule_engine.structure import TreeIndex
+
+if TYPE_CHECKING:
+    from ast_rule_engine.profiling import Profiler
+
+
+Matcher = Callable[[Term], Match]
+
+
+class _Missing:
+    pass
+
+
+def compile_patterns(
+    patterns: Mapping[str, Pattern], trees: Optional[TreeIndex] = None
+) -> Dict[str, Matcher]:
+    """
+    Turn parsed patterns into plain closures with the same `Match` semantics
+    as `Pattern.match`. AST classes, attribute names and referenced rules are
+    resolved once, here, instead of on every call. `:inside` can only match
+    nodes of the tree loaded into `trees`.
+    """
+    compiler = _Compiler(trees)
+    return {
+        name: compiler.compile_named(name, pattern)
+        for name, pattern in patterns.items()
+    }
+
+
+class _Compiler:
+    def __init__(self, trees: Optional[TreeIndex] = None) -> None:
+        self._trees = TreeIndex() if trees is None else trees
+        self._named: Dict[str, Matcher] = {}
+        # A rule that is still being compiled can only be referenced
+        # through a cell that gets filled in once it is done.
+        self._pending: Dict[str, List[Matcher]] = {}
+
+    def compile_named(self, name: str, pattern: Pattern) -> Matcher:
+        if name in self._named:
+            return self._named[name]
+
+        self._pending[name] = []
+        matcher = self.compile(pattern)
+        self._pending.pop(name).append(matcher)
+        self._named[name] = matcher
+        return matcher
+
+    def compile(self, pattern: Pattern) -> Matcher:
+        if isinstance(pattern, IsRule):
+            return self._compile_is(pattern)
+        elif isinstance(pattern, OrRule):
+            return self._compile_or(pattern)
+        elif isinstance(pattern, AndRule):
+            return self._compile_and(pattern)
+        elif isinstance(pattern, NotRule):
+            return self._compile_not(pattern)
+        elif isinstance(pattern, RefRule):
+            return self._compile_ref(pattern)
+        elif isinstance(pattern, VarRule):
+            return self._compile_var(pattern)
+        elif isinstance(pattern, BoxTypeRule):
+            return self._compile_box_type(pattern)
+        elif isinstance(pattern, BoxValueRule):
+            return self._compile_box_value(pattern)
+        elif isinstance(pattern, TupleRule):
+            return self._compile_tuple(pattern)
+        elif isinstance(pattern, ForallRule):
+            return self._compile_forall(pattern)
+        elif isinstance(pattern, ExistsRule):
+            return self._compile_exists(pattern)
+        elif isinstance(pattern, HasRule):
+            return self._compile_has(pattern)
+        elif isinstance(pattern, InsideRule):
+            return self._compile_inside(pattern)
+        else:
+            # FFI rules and anything unknown keep their own lookup semantics
+            return pattern.match
+
+    def _compile_is(self, rule: IsRule) -> Matcher:
+        class_name = rule.class_name
+        node_cls = getattr(ast, class_name, _Missing)
+        attrs: Tuple[Tuple[str, Matcher], ...] = tuple(
+            (name, self.compile(pattern))
+            for name, pattern in rule.attribute_rules.items()
+        )
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, ast.AST):
+                return "Cannot match a {0}".format(class_name)
+
+            if not isinstance(term, node_cls):
+                return "{0} is not a {1}".format(type(term).__name__, class_name)
+
+            captures: Captures = {}
+            for name, matcher in attrs:
+                attr = to_term(getattr(term, name, None))
+                submatch = matcher(attr)
+                if isinstance(submatch, str):
+                    return "In attr {0}: {1}".format(attr, submatch)
+                captures.update(submatch)
+            return captures
+
+        return match
+
+    def _compile_or(self, rule: OrRule) -> Matcher:
+        matchers = tuple(self.compile(pattern) for pattern in rule.patterns)
+
+        def match(term: Term) -> Match:
+            failed: List[str] = []
+            for matcher in matchers:
+                submatch = matcher(term)
+                if isinstance(submatch, str):
+                    failed.append(submatch)
+                else:
+                    return submatch
+            return "No patterns matched because: [{0}]".format(", ".join(failed))
+
+        return match
+
+    def _compile_and(self, rule: AndRule) -> Matcher:
+        matchers = tuple(self.compile(pattern) for pattern in rule.patterns)
+
+        def match(term: Term) -> Match:
+            result: Captures = {}
+            for matcher in matchers:
+                submatch = matcher(term)
+                if isinstance(submatch, str):
+                    return submatch
+                result.update(submatch)
+            return result
+
+        return match
+
+    def _compile_not(self, rule: NotRule) -> Matcher:
+        wrapped = self.compile(rule.wrapped)
+
+        def match(term: Term) -> Match:
+            if not isinstance(wrapped(term), str):
+                return "Shouldn't have matched"
+            return {}
+
+        return match
+
+    def _compile_ref(self, rule: RefRule) -> Matcher:
+        name = rule.name
+        if name in self._named:
+            return self._named[name]
+
+        if name in self._pending:
+            cell = self._pending[name]
+
+            def match(term: Term) -> Match:
+                return cell[0](term)
+
+            return match
+
+        try:
+            target = rule.get_pattern(name)
+        except KeyError:
+            # Unknown rules only blow up when they are actually reached
+            return rule.match
+
+        return self.compile_named(name, target)
+
+    def _compile_var(self, rule: VarRule) -> Matcher:
+        name = rule.name
+
+        def match(term: Term) -> Match:
+            return {name: term}
+
+        return match
+
+    def _compile_box_type(self, rule: BoxTypeRule) -> Matcher:
+        cls = rule.cls
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, Box):
+                return "Not a box"
+
+            if not isinstance(term.value, cls):
+                return "Expected a {0}, got {1}".format(
+                    cls.__name__,
+                    type(term.value).__name__,
+                )
+
+            return {}
+
+        return match
+
+    def _compile_box_value(self, rule: BoxValueRule) -> Matcher:
+        value = rule.value
+        value_cls = type(value)
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, Box):
+                return "Not a box"
+
+            if not isinstance(term.value, value_cls):
+                return "Expected a {0}, got {1}".format(
+                    value_cls.__name__,
+                    type(term.value).__name__,
+                )
+
+            if term.value != value:
+                return "Expected {0!r}, got {1!r}".format(value, term.value)
+
+            return {}
+
+        return match
+
+    def _compile_tuple(self, rule: TupleRule) -> Matcher:
+        matchers = tuple(self.compile(pattern) for pattern in rule.patterns)
+        length = len(matchers)
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, list):
+                return "Not a list"
+
+            if len(term) != length:
+                return "Pattern is {0} elements long, got {1}".format(
+                    length,
+                    len(term),
+                )
+
+            result: Captures = {}
+            for i, (subterm, matcher) in enumerate(zip(term, matchers)):
+                submatch = matcher(subterm)
+                if isinstance(submatch, str):
+                    return "At pattern #{0}: {1}".format(i, submatch)
+                result.update(submatch)
+            return result
+
+        return match
+
+    def _compile_forall(self, rule: ForallRule) -> Matcher:
+        predicate = self.compile(rule.predicate)
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, list):
+                return "Not a list"
+
+            result: Captures = {}
+            for i, subterm in enumerate(term):
+                submatch = predicate(subterm)
+                if isinstance(submatch, str):
+                    return "At item #{0}: {1}".format(i, submatch)
+                result.update(submatch)
+            return result
+
+        return match
+
+    def _compile_exists(self, rule: ExistsRule) -> Matcher:
+        predicate = self.compile(rule.predicate)
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, list):
+                return "Not a list"
+
+            if not term:
+                return "Empty list"
+
+            errors: List[str] = []
+            for subterm in term:
+                submatch = predicate(subterm)
+                if not isinstance(submatch, str):
+                    return submatch
+                errors.append(submatch)
+            return "; ".join(errors)
+
+        return match
+
+    def _compile_has(self, rule: HasRule) -> Matcher:
+        matcher = self.compile(rule.pattern)
+        descendants = self._trees.descendants
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, ast.AST):
+                return "Cannot look into a non-node"
+
+            for node in descendants(term):
+                submatch = matcher(node)
+                if not isinstance(submatch, str):
+                    return submatch
+            return "No descendant of {0} matched".format(type(term).__name__)
+
+        return match
+
+    def _compile_inside(self, rule: InsideRule) -> Matcher:
+        matcher = self.compile(rule.pattern)
+        ancestors = self._trees.ancestors
+
+        def match(term: Term) -> Match:
+            if not isinstance(term, ast.AST):
+                return "Cannot look around a non-node"
+
+            for node in ancestors(term):
+                submatch = matcher(node)
+                if not isinstance(submatch, str):
+                    return submatch
+            return "No ancestor of {0} matched".format(type(term).__name__)
+
+        return match
+
+
+# The fast path works on raw attribute values: AST nodes, the lists stored
+# on them and plain scalars. Values only become `Term`s once captured.
+Predicate = Callable[[object], bool]
+Capturer = Callable[[object], Optional[Captures]]
+
+_NOT_SCALAR = (ast.AST, list, tuple)
+
+# Calls of an adaptive `:or`/`:and` to collect statistics from
+_SAMPLE_WINDOW = 1000
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """
+    A rule compiled for scanning. `test` only answers yes/no and never
+    builds failure messages; `capture` is only there when the rule can
+    actually capture something. Use `compile_patterns` to find out why a
+    term didn't match.
+    """
+
+    name: str
+    pattern: Pattern
+    test: Predicate
+    capture: Optional[Capturer]
+
+    def match(self, term: Term) -> Optional[Captures]:
+        if self.capture is not None:
+            return self.capture(term)
+        return {} if self.test(term) else None
+
+
+class LeftRecursionError(Exception):
+    def __init__(self, rule: str, node_type: str, line: Optional[int]) -> None:
+        super().__init__(rule, node_type, line)
+        self.rule = rule
+        self.node_type = node_type
+        self.line = line
+
+    def __str__(self) -> str:
+        return (
+            "Rule {0!r} is left-recursive: it refers to itself "
+            "on the same {1} node (line {2})".format(
+                self.rule, self.node_type, self.line
+            )
+        )
+
+
+class Memo:
+    """
+    Results of referenced rules, keyed by node identity. Node ids are only
+    meaningful while their tree is alive, so `clear` has to be called
+    between files. A table that grows over `max_size` entries starts over,
+    except for the matches that are still running.
+    """
+
+    def __init__(self, max_size: int = 100_000) -> None:
+        self.max_size = max_size
+        self._tables: List[Dict[int, object]] = []
+
+    def table(self) -> Dict[int, object]:
+        table: Dict[int, object] = {}
+        self._tables.append(table)
+        return table
+
+    def clear(self) -> None:
+        for table in self._tables:
+            table.clear()
+
+
+_NOT_FOUND = object()
+_IN_PROGRESS = object()
+
+
+def _memoize(name: str, fn: Callable[[Term], Any], memo: Memo) -> Callable[[Term], Any]:
+    table = memo.table()
+    max_size = memo.max_size
+
+    def memoized(term: object) -> Any:
+        if not isinstance(term, ast.AST):
+            return fn(term)
+
+        key = id(term)
+        result = table.get(key, _NOT_FOUND)
+        if result is _IN_PROGRESS:
+            raise LeftRecursionError(
+                name, type(term).__name__, getattr(term, "lineno", None)
+            )
+        if result is not _NOT_FOUND:
+            return result
+
+        if len(table) >= max_size:
+            # Matches that are still running stay marked, or left recursion
+            # through them would go unnoticed
+            running = {k: v for k, v in table.items() if v is _IN_PROGRESS}
+            table.clear()
+            table.update(running)
+        table[key] = _IN_PROGRESS
+        try:
+            result = fn(term)
+        except BaseException:
+            table.pop(key, None)
+            raise
+        table[key] = result
+        return result
+
+    return memoized
+
+
+def compile_rules(
+    patterns: Mapping[str, Pattern],
+    memo: Optional[Memo] = None,
+    profiler: Optional[Profiler] = None,
+) -> Dict[str, CompiledRule]:
+    """
+    Compile rules for scanning. With a `memo`, the results of referenced
+    rules are remembered per node, and a rule that recurses into itself on
+    the same node raises `LeftRecursionError`. With a `profiler`, the
+    compiled rules report their statistics to it; without one they carry
+    no instrumentation at all.
+    """
+    return RuleCompiler(memo, profiler).compile_rules(patterns)
+
+
+def _only_scalars(cls: type) -> bool:
+    return not any(
+        issubclass(cls, other) or issubclass(other, cls) for other in _NOT_SCALAR
+    )
+
+
+def _adaptive(
+    tests: Sequence[Predicate], costs: Sequence[float], decisive: bool
+) -> Predicate:
+    """
+    Tries `tests` until one returns `decisive` (`True` for an `:or`, `False`
+    for an `:and`). For the first `_SAMPLE_WINDOW` calls it counts how often
+    each test decides, then it settles on the order that decides soonest
+    for the least estimated cost.
+    """
+    tried = [0] * len(tests)
+    decided = [0] * len(tests)
+    remaining = [_SAMPLE_WINDOW]
+    # A call that's still running keeps the order it started with
+    ordered = [tuple(tests)]
+
+    def reorder() -> None:
+        def score(i: int) -> float:
+            return (decided[i] + 1) / (tried[i] + 2) / costs[i]
+
+        ranked = sorted(range(len(tests)), key=score, reverse=True)
+        ordered[0] = tuple(tests[i] for i in ranked)
+
+    def sample(term: object) -> bool:
+        remaining[0] -= 1
+        result = not decisive
+        for i, subtest in enumerate(tests):
+            tried[i] += 1
+            if bool(subtest(term)) is decisive:
+                decided[i] += 1
+                result = decisive
+                break
+        if not remaining[0]:
+            reorder()
+        return result
+
+    if decisive:
+
+        def test(term: object) -> bool:
+            if remaining[0]:
+                return sample(term)
+            for subtest in ordered[0]:
+                if subtest(term):
+                    return True
+            return False
+
+    else:
+
+        def test(term: object) -> bool:
+            if remaining[0]:
+                return sample(term)
+            for subtest in ordered[0]:
+                if not subtest(term):
+                    return False
+            return True
+
+    return test
+
+
+def _is_node_of(node_cls: object) -> Predicate:
+    if isinstance(node_cls, type) and issubclass(node_cls, ast.AST):
+        return lambda term: isinstance(term, node_cls)
+    return lambda term: (
+        isinstance(term, ast.AST) and isinstance(term, node_cls)  # type: ignore
+    )
+
+
+def _descendant_types(pattern: Pattern) -> Optional[Tuple[type, ...]]:
+    # Only the descendants that could match are looked at
+    types = root_types(pattern)
+    if types is None or ast.AST in types:
+        return None
+    return tuple(types)
+
+
+class RuleCompiler:
+    """
+    Compiles patterns into predicates and capturers (see `compile_rules`).
+    Everything compiled by one instance shares its memo and profiler. With
+    `adaptive_order`, `:or` and `:and` predicates reorder their branches
+    from statistics collected at runtime (unless profiling, which reports
+    branches by position). `:has` and `:inside` look the tree up in
+    `trees`; without one, nodes have no known ancestors.
+    """
+
+    def __init__(
+        self,
+        memo: Optional[Memo] = None,
+        profiler: Optional[Profiler] = None,
+        adaptive_order: bool = False,
+        trees: Optional[TreeIndex] = None,
+    ) -> None:
+        self._memo = memo
+        self._trees = TreeIndex() if trees is None else trees
+        self._profiler = profiler
+        self._adaptive_order = adaptive_order and profiler is None
+        self._rule_stack: List[str] = []
+        self._or_labels: Dict[int, str] = {}
+        self._memoized_refs: Dict[Tuple[str, str], Callable] = {}
+        self._tests: Dict[str, Predicate] = {}
+        self._pending_tests: Dict[str, List[Predicate]] = {}
+        self._captures: Dict[str, Capturer] = {}
+        self._pending_captures: Dict[str, List[Capturer]] = {}
+        self._has_captures: Dict[int, bool] = {}
+
+    def compile_rules(self, patterns: Mapping[str, Pattern]) -> Dict[str, CompiledRule]:
+        rules: Dict[str, CompiledRule] = {}
+        for name, pattern in patterns.items():
+            test = self.test_named(name, pattern)
+            capture = (
+                self.capture_named(name, pattern)
+                if self.has_captures(pattern)
+                else None
+            )
+            if self._profiler is not None:
+                if capture is not None:
+                    capture = self._profiler.instrument(name, capture)
+                else:
+                    test = self._profiler.instrument(name, test)
+            rules[name] = CompiledRule(name, pattern, test, capture)
+        return rules
+
+    def has_captures(self, pattern: Pattern) -> bool:
+        key = id(pattern)
+        if key not in self._has_captures:
+            self._has_captures[key] = has_captures(pattern)
+        return self._has_captures[key]
+
+    def test_named(self, name: str, pattern: Pattern) -> Predicate:
+        if name in self._tests:
+            return self._tests[name]
+
+        self._pending_tests[name] = []
+        self._rule_stack.append(name)
+        test = self.test(pattern)
+        self._rule_stack.pop()
+        self._pending_tests.pop(name).append(test)
+        self._tests[name] = test
+        return test
+
+    def capture_named(self, name: str, pattern: Pattern) -> Capturer:
+        if name in self._captures:
+            return self._captures[name]
+
+        self._pending_captures[name] = []
+        self._rule_stack.append(name)
+        capture = self.capture(pattern)
+        self._rule_stack.pop()
+        self._pending_captures.pop(name).append(capture)
+        self._captures[name] = capture
+        return capture
+
+    def test(self, pattern: Pattern) -> Predicate:
+        if isinstance(pattern, IsRule):
+            return self._test_is(pattern)
+        elif isinstance(pattern, OrRule):
+            return self._test_or(pattern)
+        elif isinstance(pattern, AndRule):
+            return self._test_and(pattern)
+        elif isinstance(pattern, NotRule):
+            wrapped = self.test(pattern.wrapped)
+            return lambda term: not wrapped(term)
+        elif isinstance(pattern, RefRule):
+            return self._test_ref(pattern)
+        elif isinstance(pattern, VarRule):
+            return lambda term: True
+        elif isinstance(pattern, BoxTypeRule):
+            return self._test_box_type(pattern)
+        elif isinstance(pattern, BoxValueRule):
+            return self._test_box_value(pattern)
+        elif isinstance(pattern, BoxValueSetRule):
+            return self._test_box_value_set(pattern)
+        elif isinstance(pattern, IsAnyRule):
+            return self._test_is_any(pattern)
+        elif isinstance(pattern, TupleRule):
+            return self._test_tuple(pattern)
+        elif isinstance(pattern, ForallRule):
+            return self._test_forall(pattern)
+        elif isinstance(pattern, ExistsRule):
+            return self._test_exists(pattern)
+        elif isinstance(pattern, HasRule):
+            return self._test_has(pattern)
+        elif isinstance(pattern, InsideRule):
+            return self._test_inside(pattern)
+        else:
+            match = pattern.match
+            return lambda term: not isinstance(match(to_term(term)), str)
+
+    def _test_is(self, rule: IsRule) -> Predicate:
+        is_node = _is_node_of(getattr(ast, rule.class_name, _Missing))
+        attrs: Tuple[Tuple[str, Predicate], ...] = tuple(
+            (name, self.test(pattern)) for name, pattern in rule.attribute_rules.items()
+        )
+
+        if not attrs:
+            return is_node
+
+        def test(term: object) -> bool:
+            if not is_node(term):
+                return False
+            for name, attr_test in attrs:
+                if not attr_test(getattr(term, name, None)):
+                    return False
+            return True
+
+        return test
+
+    def _test_or(self, rule: OrRule) -> Predicate:
+        counts = self._branch_counts(rule, len(rule.patterns))
+        tests = tuple(self.test(pattern) for pattern in rule.patterns)
+
+        if counts is not None:
+
+            def counted_test(term: object) -> bool:
+                for i, subtest in enumerate(tests):
+                    if subtest(term):
+                        counts[i] += 1
+                        return True
+                counts[-1] += 1
+                return False
+
+            return counted_test
+
+        tests = self._branch_tests(rule.patterns, tests, True)
+
+        def test(term: object) -> bool:
+            for subtest in tests:
+                if subtest(term):
+                    return True
+            return False
+
+        return test
+
+    def _test_and(self, rule: AndRule) -> Predicate:
+        tests = tuple(self.test(pattern) for pattern in rule.patterns)
+        tests = self._branch_tests(rule.patterns, tests, False)
+
+        def test(term: object) -> bool:
+            for subtest in tests:
+                if not subtest(term):
+                    return False
+            return True
+
+        return test
+
+    def _branch_tests(
+        self,
+        patterns: Sequence[Pattern],
+        tests: Tuple[Predicate, ...],
+        decisive: bool,
+    ) -> Tuple[Predicate, ...]:
+        """
+        With adaptive ordering, the leading branches that can run in any
+        order (no FFI calls, no references on the same term) become a single
+        adaptive test.
+        """
+        if not self._adaptive_order:
+            return tests
+
+        run = 0
+        while run < len(patterns) and not (
+            has_ffi(patterns[run]) or has_bare_refs(patterns[run])
+        ):
+            run += 1
+        if run < 2:
+            return tests
+
+        costs = [estimated_cost(pattern) for pattern in patterns[:run]]
+        return (_adaptive(tests[:run], costs, decisive),) + tests[run:]
+
+    def _test_ref(self, rule: RefRule) -> Predicate:
+        name = rule.name
+        if name not in self._tests and name not in self._pending_tests:
+            try:
+                target = rule.get_pattern(name)
+            except KeyError:
+                match = rule.match
+                return lambda term: not isinstance(match(to_term(term)), str)
+            self.test_named(name, target)
+
+        if name in self._tests:
+            test = self._tests[name]
+        else:
+            cell = self._pending_tests[name]
+            test = lambda term: cell[0](term)  # noqa: E731
+        return self._memoized(name, "test", test)
+
+    def _memoized(self, name: str, mode: str, fn: Callable) -> Callable:
+        key = (name, mode)
+        if key in self._memoized_refs:
+            return self._memoized_refs[key]
+
+        if self._profiler is not None:
+            fn = self._profiler.instrument("~" + name, fn)
+        if self._memo is not None:
+            fn = _memoize(name, fn, self._memo)
+        self._memoized_refs[key] = fn
+        return fn
+
+    def _branch_counts(self, rule: Pattern, branches: int) -> Optional[List[int]]:
+        if self._profiler is None:
+            return None
+
+        key = id(rule)
+        if key not in self._or_labels:
+            owner = self._rule_stack[-1] if self._rule_stack else "?"
+            index = sum(
+                label.startswith(owner + ":or#") for label in self._or_labels.values()
+            )
+            self._or_labels[key] = "{0}:or#{1}".format(owner, index)
+        return self._profiler.branch_counts(self._or_labels[key], branches)
+
+    def _test_box_type(self, rule: BoxTypeRule) -> Predicate:
+        cls = rule.cls
+        if issubclass(cls, _NOT_SCALAR):
+            return lambda term: False
+        if _only_scalars(cls):
+            return lambda term: isinstance(term, cls)
+        return lambda term: isinstance(term, cls) and not isinstance(term, _NOT_SCALAR)
+
+    def _test_box_value(self, rule: BoxValueRule) -> Predicate:
+        value = rule.value
+        value_cls = type(value)
+        if issubclass(value_cls, _NOT_SCALAR):
+            # Lists and tuples are never boxed, so they can't be compared
+            return lambda term: False
+
+        if _only_scalars(value_cls):
+
+            def test(term: object) -> bool:
+                return isinstance(term, value_cls) and not term != value
+
+        else:
+
+            def test(term: object) -> bool:
+                return (
+                    isinstance(term, value_cls)
+                    and not isinstance(term, _NOT_SCALAR)
+                    and not term != value
+                )
+
+        return test
+
+    def _test_box_value_set(self, rule: BoxValueSetRule) -> Predicate:
+        cls = rule.cls
+        values = rule.values
+        if _only_scalars(cls):
+            return lambda term: isinstance(term, cls) and term in values
+        return lambda term: (
+            isinstance(term, cls)
+            and not isinstance(term, _NOT_SCALAR)
+            and term in values
+        )
+
+    def _test_is_any(self, rule: IsAnyRule) -> Predicate:
+        node_classes = tuple(getattr(ast, name) for name in rule.class_names)
+        return lambda term: isinstance(term, node_classes)
+
+    def _test_tuple(self, rule: TupleRule) -> Predicate:
+        tests = tuple(self.test(pattern) for pattern in rule.patterns)
+        length = len(tests)
+
+        def test(term: object) -> bool:
+            if not isinstance(term, (list, tuple)) or len(term) != length:
+                return False
+            for subterm, subtest in zip(term, tests):
+                if not subtest(subterm):
+                    return False
+            return True
+
+        return test
+
+    def _test_forall(self, rule: ForallRule) -> Predicate:
+        predicate = self.test(rule.predicate)
+
+        def test(term: object) -> bool:
+            if not isinstance(term, (list, tuple)):
+                return False
+            for subterm in term:
+                if not predicate(subterm):
+                    return False
+            return True
+
+        return test
+
+    def _test_exists(self, rule: ExistsRule) -> Predicate:
+        predicate = self.test(rule.predicate)
+
+        def test(term: object) -> bool:
+            if not isinstance(term, (list, tuple)):
+                return False
+            for subterm in term:
+                if predicate(subterm):
+                    return True
+            return False
+
+        return test
+
+    def _test_has(self, rule: HasRule) -> Predicate:
+        predicate = self.test(rule.pattern)
+        node_types = _descendant_types(rule.pattern)
+        descendants = self._trees.descendants
+
+        def test(term: object) -> bool:
+            if not isinstance(term, ast.AST):
+                return False
+            for node in descendants(term, node_types):
+                if predicate(node):
+                    return True
+            return False
+
+        return test
+
+    def _test_inside(self, rule: InsideRule) -> Predicate:
+        predicate = self.test(rule.pattern)
+        ancestors = self._trees.ancestors
+
+        def test(term: object) -> bool:
+            if not isinstance(term, ast.AST):
+                return False
+            for node in ancestors(term):
+                if predicate(node):
+                    return True
+            return False
+
+        return test
+
+    def capture(self, pattern: Pattern) -> Capturer:
+        if not self.has_captures(pattern):
+            test = self.test(pattern)
+            return lambda term: {} if test(term) else None
+
+        if isinstance(pattern, IsRule):
+            return self._capture_is(pattern)
+        elif isinstance(pattern, OrRule):
+            return self._capture_any(pattern)
+        elif isinstance(pattern, AndRule):
+            return self._capture_all(pattern.patterns)
+        elif isinstance(pattern, RefRule):
+            return self._capture_ref(pattern)
+        elif isinstance(pattern, VarRule):
+            name = pattern.name
+            return lambda term: {name: to_term(term)}
+        elif isinstance(pattern, TupleRule):
+            return self._capture_tuple(pattern)
+        elif isinstance(pattern, ForallRule):
+            return self._capture_forall(pattern)
+        elif isinstance(pattern, ExistsRule):
+            return self._capture_exists(pattern)
+        elif isinstance(pattern, HasRule):
+            return self._capture_has(pattern)
+        elif isinstance(pattern, InsideRule):
+            return self._capture_inside(pattern)
+        else:
+            match = pattern.match
+
+            def capture(term: object) -> Optional[Captures]:
+                result = match(to_term(term))
+                return None if isinstance(result, str) else result
+
+            return capture
+
+    def _capture_or_test(self, pattern: Pattern) -> Tuple[bool, Callable]:
+        if self.has_captures(pattern):
+            return True, self.capture(pattern)
+        return False, self.test(pattern)
+
+    def _capture_is(self, rule: IsRule) -> Capturer:
+        is_node = _is_node_of(getattr(ast, rule.class_name, _Missing))
+        attrs = tuple(
+            (name,) + self._capture_or_test(pattern)
+            for name, pattern in rule.attribute_rules.items()
+        )
+
+        def capture(term: object) -> Optional[Captures]:
+            if not is_node(term):
+                return None
+            captures: Captures = {}
+            for name, captures_something, submatch in attrs:
+                attr = getattr(term, name, None)
+                if captures_something:
+                    subcaptures = submatch(attr)
+                    if subcaptures is None:
+                        return None
+                    captures.update(subcaptures)
+                elif not submatch(attr):
+                    return None
+            return captures
+
+        return capture
+
+    def _capture_any(self, rule: OrRule) -> Capturer:
+        counts = self._branch_counts(rule, len(rule.patterns))
+        branches = tuple(self._capture_or_test(pattern) for pattern in rule.patterns)
+
+        def capture(term: object) -> Optional[Captures]:
+            for i, (captures_something, submatch) in enumerate(branches):
+                if captures_something:
+                    subcaptures = submatch(term)
+                    if subcaptures is not None:
+                        if counts is not None:
+                            counts[i] += 1
+                        return subcaptures
+                elif submatch(term):
+                    if counts is not None:
+                        counts[i] += 1
+                    return {}
+            if counts is not None:
+                counts[-1] += 1
+            return None
+
+        return capture
+
+    def _capture_all(self, patterns: Sequence[Pattern]) -> Capturer:
+        branches = tuple(self._capture_or_test(pattern) for pattern in patterns)
+
+        def capture(term: object) -> Optional[Captures]:
+            captures: Captures = {}
+            for captures_something, submatch in branches:
+                if captures_something:
+                    subcaptures = submatch(term)
+                    if subcaptures is None:
+                        return None
+                    captures.update(subcaptures)
+                elif not submatch(term):
+                    return None
+            return captures
+
+        return capture
+
+    def _capture_ref(self, rule: RefRule) -> Capturer:
+        name = rule.name
+        if name not in self._captures and name not in self._pending_captures:
+            try:
+                target = rule.get_pattern(name)
+            except KeyError:
+                match = rule.match
+
+                def capture_later(term: object) -> Optional[Captures]:
+                    result = match(to_term(term))
+                    return None if isinstance(result, str) else result
+
+                return capture_later
+            self.capture_named(name, target)
+
+        if name in self._captures:
+            capture = self._captures[name]
+        else:
+            cell = self._pending_captures[name]
+            capture = lambda term: cell[0](term)  # noqa: E731
+        return self._memoized(name, "capture", capture)
+
+    def _capture_tuple(self, rule: TupleRule) -> Capturer:
+        items = tuple(self._capture_or_test(pattern) for pattern in rule.patterns)
+        length = len(items)
+
+        def capture(term: object) -> Optional[Captures]:
+            if not isinstance(term, (list, tuple)) or len(term) != length:
+                return None
+            captures: Captures = {}
+            for subterm, (captures_something, submatch) in zip(term, items):
+                if captures_something:
+                    subcaptures = submatch(subterm)
+                    if subcaptures is None:
+                        return None
+                    captures.update(subcaptures)
+                elif not submatch(subterm):
+                    return None
+            return captures
+
+        return capture
+
+    def _capture_forall(self, rule: ForallRule) -> Capturer:
+        predicate = self.capture(rule.predicate)
+
+        def capture(term: object) -> Optional[Captures]:
+            if not isinstance(term, (list, tuple)):
+                return None
+            captures: Captures = {}
+            for subterm in term:
+                subcaptures = predicate(subterm)
+                if subcaptures is None:
+                    return None
+                captures.update(subcaptures)
+            return captures
+
+        return capture
+
+    def _capture_exists(self, rule: ExistsRule) -> Capturer:
+        predicate = self.capture(rule.predicate)
+
+        def capture(term: object) -> Optional[Captures]:
+            if not isinstance(term, (list, tuple)):
+                return None
+            for subterm in term:
+                subcaptures = predicate(subterm)
+                if subcaptures is not None:
+                    return subcaptures
+            return None
+
+        return capture
+
+    def _capture_has(self, rule: HasRule) -> Capturer:
+        predicate = self.capture(rule.pattern)
+        node_types = _descendant_types(rule.pattern)
+        descendants = self._trees.descendants
+
+        def capture(term: object) -> Optional[Captures]:
+            if not isinstance(term, ast.AST):
+                return None
+            for node in descendants(term, node_types):
+                subcaptures = predicate(node)
+                if subcaptures is not None:
+                    return subcaptures
+            return None
+
+        return capture
+
+    def _capture_inside(self, rule: InsideRule) -> Capturer:
+        predicate = self.capture(rule.pattern)
+        ancestors = self._trees.ancestors
+
+        def capture(term: object) -> Optional[Captures]:
+            if not isinstance(term, ast.AST):
+                return None
+            for node in ancestors(term):
+                subcaptures = predicate(node)
+                if subcaptures is not None:
+                    return subcaptures
+            return None
+
+        return capture
@@ -0,0 +1,258 @@
+"""
+Keeps compiled rules and per-file results in memory and answers requests
+on a Unix domain socket, one JSON object per line. Requests:
+
+- `{"command": "scan", "spec": ..., "paths": [...]}` and
+  `{"command": "scan_source", "spec": ..., "path": ..., "source": ...}`
+  return `{"records": [...]}`; both take optional `select`/`unselect`
+  regexps like the CLI;
+- `{"command": "cli", "args": [...], "cwd": ...}` runs CLI arguments and
+  returns `{"stdout": ..., "stderr": ..., "status": ...}` (this is what
+  `ast_rule_engine.client` sends);
+- `{"command": "ping"}` and `{"command": "shutdown"}`.
+
+Failures come back as `{"error": ...}`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+import io
+import json
+import os
+from pathlib import Path
+import re
+import socket
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ast_rule_engine.__main__ import options_from_args, parser as cli_parser
+from ast_rule_engine.changes import GitError, in_changed_lines
+from ast_rule_engine.cli import find_paths, git_changes, load_spec
+from ast_rule_engine.client import default_socket_path
+from ast_rule_engine.compile import LeftRecursionError
+from ast_rule_engine.output import make_renderer, record_to_json
+from ast_rule_engine.scan import MatchLimits, MatchRecord, Scanner, limit_matches
+from ast_rule_engine.watch import FileState, file_state
+
+
+_NO_MATCH = r"^\b$"
+_DEFAULT_SELECT = r"[A-Z].*"
+
+
+class _ArgumentsError(Exception):
+    pass
+
+
+def _raise_arguments_error(message: str) -> None:
+    raise _ArgumentsError(message)
+
+
+@dataclass
+class _RuleSet:
+    scanner: Scanner
+    spec_state: Optional[FileState]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    results: Dict[str, Tuple[FileState, List[MatchRecord]]] = field(
+        default_factory=dict
+    )
+
+
+class Daemon:
+    """
+    Serves scan requests from memory. Rule sets are keyed by spec path and
+    selection, and are reloaded when the spec file changes. Each rule set
+    scans one file at a time; different rule sets scan concurrently.
+    """
+
+    def __init__(self) -> None:
+        self._rule_sets: Dict[Tuple[str, str, str], _RuleSet] = {}
+        self._lock = threading.Lock()
+        self.running = True
+
+    def _rule_set(self, spec_path: Path, select: str, unselect: str) -> _RuleSet:
+        key = (str(spec_path), select, unselect)
+        state = file_state(spec_path)
+        with self._lock:
+            rule_set = self._rule_sets.get(key)
+            if rule_set is None or rule_set.spec_state != state:
+                _, patterns = load_spec(
+                    spec_path, re.compile(select), re.compile(unselect)
+                )
+                rule_set = _RuleSet(Scanner(patterns), state)
+                self._rule_sets[key] = rule_set
+            return rule_set
+
+    def _scan_paths(self, rule_set: _RuleSet, paths: List[Path]) -> List[MatchRecord]:
+        records: List[MatchRecord] = []
+        with rule_set.lock:
+            for path in paths:
+                state = file_state(path)
+                if state is None:
+                    continue
+                cached = rule_set.results.get(str(path))
+                if cached is not None and cached[0] == state:
+                    records.extend(cached[1])
+                    continue
+                file_records = rule_set.scanner.scan_file(path)
+                rule_set.results[str(path)] = (state, file_records)
+                records.extend(file_records)
+        return records
+
+    def handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self._handle(message)
+        except Exception as e:
+            # Rules can raise anything (FFI checks, deep recursion), and a
+            # client that gets no reply would take the daemon for gone
+            return {"error": "{0}: {1}".format(type(e).__name__, e)}
+
+    def _handle(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        command = message.get("command")
+        if command == "ping":
+            return {"ok": True}
+        elif command == "shutdown":
+            self.running = False
+            return {"ok": True}
+        elif command == "cli":
+            return self._run_cli(message["args"], Path(message["cwd"]))
+
+        rule_set = self._rule_set(
+            Path(message["spec"]).resolve(),
+            message.get("select", _DEFAULT_SELECT),
+            message.get("unselect", _NO_MATCH),
+        )
+        if command == "scan":
+            records = self._scan_paths(
+                rule_set, [Path(path) for path in message["paths"]]
+            )
+        elif command == "scan_source":
+            tree = ast.parse(message["source"])
+            with rule_set.lock:
+                records = list(rule_set.scanner.scan_tree(message["path"], tree))
+        else:
+            return {"error": "Unknown command: {0!r}".format(command)}
+        return {"records": [record_to_json(record) for record in records]}
+
+    def _run_cli(self, argv: List[str], cwd: Path) -> Dict[str, Any]:
+        try:
+            options = options_from_args(cli_parser.parse_args(argv))
+        except _ArgumentsError as e:
+            return {"stdout": "", "stderr": "error: {0}\n".format(e), "status": 2}
+        except SystemExit as e:
+            # `--help` and friends
+            return {"stdout": "", "stderr": "", "status": e.code or 0}
+        if options.watch or options.explain is not None or options.profile:
+            return {
+                "stdout": "",
+                "stderr": "error: --watch, --explain and --profile need the "
+                "plain CLI\n",
+                "status": 2,
+            }
+        if options.files_from is not None or options.file_timeout is not None:
+            return {
+                "stdout": "",
+                "stderr": "error: --files-from and --file-timeout need the plain CLI\n",
+                "status": 2,
+            }
+
+        # Paths are relative to the client, and reported the way it gave them
+        stdout = io.StringIO()
+        try:
+            rule_set = self._rule_set(
+                (cwd / options.spec_path).resolve(),
+                options.select.pattern,
+                options.unselect.pattern,
+            )
+            changes = git_changes(options, cwd)
+            paths = {cwd / path: path for path in find_paths(options, changes, cwd)}
+            records = self._scan_paths(rule_set, list(paths))
+        except (GitError, LeftRecursionError) as e:
+            return {"stdout": "", "stderr": "Error: {0}\n".format(e), "status": 1}
+        if changes is not None and options.changed_lines_only:
+            records = list(in_changed_lines(records, changes))
+        limits = MatchLimits(
+            options.first_match_per_rule,
+            1 if options.fail_fast else options.max_matches,
+        )
+        # Results are cached for every rule, so nothing is disabled
+        records = list(limit_matches(records, limits, lambda rule: None))
+
+        records = [
+            replace(record, path=str(paths[Path(record.path)])) for record in records
+        ]
+        renderer = make_renderer(options.output_format, stdout, rule_set.scanner.rules)
+        for record in records:
+            renderer.add(record)
+        renderer.close()
+        status = 1 if options.fail_fast and records else 0
+        return {"stdout": stdout.getvalue(), "stderr": "", "status": status}
+
+    def serve(self, socket_path: str, workers: int) -> None:
+        if os.path.exists(socket_path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(socket_path)
+                except OSError:
+                    os.unlink(socket_path)
+                else:
+                    raise OSError("A daemon is already listening on " + socket_path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(socket_path)
+            os.chmod(socket_path, 0o600)
+            server.listen()
+            # Wake up now and then to notice a shutdown request
+            server.settimeout(0.5)
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    while self.running:
+                        try:
+                            connection, _ = server.accept()
+                        except socket.timeout:
+                            continue
+                        connection.settimeout(None)
+                        pool.submit(self._serve_connection, connection)
+            finally:
+                os.unlink(socket_path)
+
+    def _serve_connection(self, connection: socket.socket) -> None:
+        with connection, connection.makefile("rwb") as stream:
+            for line in stream:
+                try:
+                    message = json.loads(line.decode("utf-8"))
+                    response = self.handle(message)
+                except ValueError as e:
+                    response = {"error": "Invalid request: {0}".format(e)}
+                stream.write(json.dumps(response).encode("utf-8") + b"\n")
+                stream.flush()
+
+
+parser = argparse.ArgumentParser("ast_rule_engine.daemon")
+parser.add_argument(
+    "--socket",
+    default=default_socket_path(),
+    help="Path of the Unix domain socket to listen on",
+)
+parser.add_argument(
+    "--workers",
+    default=4,
+    help="Number of requests to serve at the same time",
+    type=int,
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    cli_parser.error = _raise_arguments_error  # type: ignore
+    try:
+        Daemon().serve(args.socket, args.workers)
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print("Error: {0}".format(e), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+from functools import lru_cache
+import os
+from pathlib import Path
+import re
+from typing import IO, Any, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+try:
+    from re import _parser as sre_parse  # type: ignore[attr-defined]
+except ImportError:  # Python < 3.11
+    import sre_parse  # type: ignore[no-redef]
+
+
+def _translate_segment(segment: str) -> str:
+    """
+    Regex for one path segment of a glob: `*` and `?` don't match `/`.
+    """
+    result: List[str] = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        i += 1
+        if char == "*":
+            result.append("[^/]*")
+        elif char == "?":
+            result.append("[^/]")
+        elif char == "[":
+            start = i + 1 if segment[i : i + 1] == "!" else i
+            start = start + 1 if segment[start : start + 1] == "]" else start
+            end = segment.find("]", start)
+            if end == -1:
+                result.append(re.escape(char))
+                continue
+            body = segment[i:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            result.append("[{0}]".format(body.replace("\\", "\\\\")))
+            i = end + 1
+        else:
+            result.append(re.escape(char))
+    return "".join(result)
+
+
+def _translate(segments: List[str]) -> str:
+    result: List[str] = []
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            result.append(".*" if last else "(?:[^/]+/)*")
+        else:
+            result.append(_translate_segment(segment) + ("" if last else "/"))
+    return "".join(result)
+
+
+class _Glob:
+    """
+    A `Path.glob` pattern, matched against paths relative to the root.
+    """
+
+    def __init__(self, pattern: str) -> None:
+        self.segments = [segment for segment in pattern.split("/") if segment]
+        self.regex = re.compile(_translate(self.segments))
+        self._segment_regexes = [
+            None if segment == "**" else re.compile(_translate_segment(segment))
+            for segment in self.segments
+        ]
+
+    def may_match_below(self, dir_parts: List[str]) -> bool:
+        """
+        Whether the pattern could match anything in the directory made of
+        `dir_parts`.
+        """
+        for i, part in enumerate(dir_parts):
+            if i >= len(self.segments):
+                return False
+            regex = self._segment_regexes[i]
+            if regex is None:
+                return True
+            # The last segment is for the files themselves
+            if i == len(self.segments) - 1 or not regex.fullmatch(part):
+                return False
+        return True
+
+
+class _IgnoreRule:
+    def __init__(self, line: str) -> None:
+        self.negate = line.startswith("!")
+        if self.negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        self.dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        segments = [segment for segment in line.split("/") if segment]
+        pattern = _translate(segments)
+        if not anchored and segments != ["**"]:
+            pattern = "(?:.*/)?" + pattern
+        self.regex = re.compile(pattern)
+
+
+def _read_gitignore(path: str) -> List[_IgnoreRule]:
+    rules: List[_IgnoreRule] = []
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return rules
+
+    for line in lines:
+        if not line.endswith("\\ "):
+            line = line.rstrip(" ")
+        if not line or line.startswith("#"):
+            continue
+        rules.append(_IgnoreRule(line))
+    return rules
+
+
+# .gitignore rules together with the path of their directory relative to
+# the root ("" for the root, otherwise ending in "/")
+_Ignores = Tuple[Tuple[str, List[_IgnoreRule]], ...]
+
+
+def _is_ignored(rel_path: str, is_dir: bool, ignores: _Ignores) -> bool:
+    ignored = False
+    for base, rules in ignores:
+        relative = rel_path[len(base) :]
+        for rule in rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.fullmatch(relative):
+                ignored = not rule.negate
+    return ignored
+
+
+def _looks_around(items: Any) -> bool:
+    """
+    Whether a parsed regex has assertions, which could look at more of the
+    path than the part they are matched at.
+    """
+    for op, av in items:
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return True
+        if op is sre_parse.AT and av not in (
+            sre_parse.AT_BEGINNING,
+            sre_parse.AT_BEGINNING_STRING,
+        ):
+            return True
+        for arg in av if isinstance(av, (tuple, list)) else (av,):
+            if isinstance(arg, sre_parse.SubPattern) and _looks_around(arg):
+                return True
+            if isinstance(arg, list) and any(
+                isinstance(sub, sre_parse.SubPattern) and _looks_around(sub)
+                for sub in arg
+            ):
+                return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def _ends_in_anything(exclude: Pattern[str]) -> bool:
+    """
+    Whether `exclude` is something followed by `.*`, where the something
+    matches the same however the path goes on. If such a pattern matches a
+    path, it matches the path with anything (but newlines) after it.
+    """
+    try:
+        parsed = sre_parse.parse(exclude.pattern, exclude.flags)
+    except Exception:
+        return False
+    if not len(parsed):
+        return False
+    op, av = parsed[-1]
+    if op not in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+        return False
+    low, high, repeated = av
+    if low != 0 or high != sre_parse.MAXREPEAT or len(repeated) != 1:
+        return False
+    if repeated[0][0] is not sre_parse.ANY:
+        return False
+    return not _looks_around(parsed)
+
+
+def _prunes(exclude: Pattern[str], dir_path: str) -> bool:
+    # Only skip a directory if the pattern excludes everything in it, and
+    # not just some particular paths in it
+    return _ends_in_anything(exclude) and exclude.fullmatch(dir_path + "/") is not None
+
+
+def _prefix(root: Path) -> str:
+    root_str = str(root)
+    if root_str == ".":
+        return ""
+    elif root_str.endswith(os.sep):
+        return root_str
+    else:
+        return root_str + os.sep
+
+
+def discover(
+    root: Path,
+    include_glob: str,
+    exclude: Pattern[str],
+    gitignore: bool = False,
+    cwd: Optional[Path] = None,
+) -> Iterator[Path]:
+    """
+    Files under `root` that match `include_glob` and whose path doesn't
+    fully match `exclude`, in the same order as `Path.glob`. Directories
+    are not descended into when the include pattern can't match anything
+    in them, when `exclude` matches the directory with anything after it,
+    or, with `gitignore`, when a `.gitignore` under `root` ignores them.
+    A relative `root` is taken relative to `cwd` (if given), but paths are
+    still spelt relative.
+    """
+    base = "" if cwd is None else str(cwd)
+    return _walk(_Glob(include_glob), exclude, gitignore, base, _prefix(root), [], ())
+
+
+def select_paths(
+    root: Path,
+    include_glob: str,
+    exclude: Pattern[str],
+    candidates: Iterable[Path],
+    cwd: Optional[Path] = None,
+) -> Iterator[Path]:
+    """
+    The files among `candidates` (absolute paths) that `discover` would
+    find, in sorted order, spelt the way `discover` would spell them.
+    """
+    glob = _Glob(include_glob)
+    prefix = _prefix(root)
+    base = "" if cwd is None else str(cwd)
+    resolved_root = Path(base, root).resolve()
+    for candidate in sorted(candidates):
+        try:
+            rel_path = candidate.resolve().relative_to(resolved_root).as_posix()
+        except ValueError:
+            continue
+        path = prefix + rel_path.replace("/", os.sep)
+        if (
+            glob.regex.fullmatch(rel_path)
+            and not exclude.fullmatch(path)
+            and os.path.isfile(os.path.join(base, path))
+        ):
+            yield Path(path)
+
+
+def _walk(
+    glob: _Glob,
+    exclude: Pattern[str],
+    gitignore: bool,
+    base: str,
+    prefix: str,
+    dir_parts: List[str],
+    ignores: _Ignores,
+) -> Iterator[Path]:
+    rel_dir = "".join(part + "/" for part in dir_parts)
+    dir_path = prefix + rel_dir.replace("/", os.sep)
+    try:
+        with os.scandir(os.path.join(base, dir_path or ".")) as it:
+            entries = list(it)
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        return
+
+    if gitignore:
+        for entry in entries:
+            if entry.name == ".gitignore":
+                ignores += ((rel_dir, _read_gitignore(entry.path)),)
+                break
+
+    for entry in entries:
+        rel_path = rel_dir + entry.name
+        if not glob.regex.fullmatch(rel_path):
+            continue
+        try:
+            if not entry.is_file():
+                continue
+        except OSError:
+            continue
+        if ignores and _is_ignored(rel_path, False, ignores):
+            continue
+        path = dir_path + entry.name
+        if not exclude.fullmatch(path):
+            yield Path(path)
+
+    for entry in entries:
+        try:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+        except OSError:
+            continue
+        if gitignore and entry.name == ".git":
+            continue
+        parts = dir_parts + [entry.name]
+        if not glob.may_match_below(parts):
+            continue
+        if ignores and _is_ignored(rel_dir + entry.name, True, ignores):
+            continue
+        if _prunes(exclude, dir_path + entry.name):
+            continue
+        yield from _walk(glob, exclude, gitignore, base, prefix, parts, ignores)
+
+
+def read_file_list(
+    stream: IO[str], exclude: Optional[Pattern[str]] = None
+) -> Iterator[Path]:
+    """
+    Files listed in `stream`, one per line, except those whose path fully
+    matches `exclude`. Lines that aren't files (anymore) are skipped.
+    """
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        path = Path(line)
+        if exclude is not None and exclude.fullmatch(str(path)):
+            continue
+        if path.is_file():
+            yield path
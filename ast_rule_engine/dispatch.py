@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from ast_rule_engine.analysis import RootTypes
+
+
+def _as_classes(types: RootTypes) -> Optional[Tuple[type, ...]]:
+    if types is None or any(type(cls) is not type for cls in types):
+        # The deprecated `Num`, `Str` & co. fake their isinstance checks, so
+        # the type of a node can't tell whether they match it
+        return None
+    return tuple(types)
+
+
+class DispatchTable:
+    """
+    Maps a node type to the names of the rules that could match a node of
+    that type, in the original rule order.
+    """
+
+    def __init__(self, rule_root_types: Mapping[str, RootTypes]) -> None:
+        self._rules: List[Tuple[str, Optional[Tuple[type, ...]]]] = [
+            (name, _as_classes(types)) for name, types in rule_root_types.items()
+        ]
+        self._by_type: Dict[type, Tuple[str, ...]] = {}
+
+    def rules_for(self, node_type: type) -> Tuple[str, ...]:
+        try:
+            return self._by_type[node_type]
+        except KeyError:
+            pass
+
+        rules = tuple(
+            name
+            for name, types in self._rules
+            if types is None or issubclass(node_type, types)
+        )
+        self._by_type[node_type] = rules
+        return rules
@@ -3,7 +3,7 @@ from __future__ import annotations
 from abc import ABC
 import ast
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Sequence, Union
+from typing import Callable, Dict, FrozenSet, List, Sequence, Tuple, Union
 
 
 @dataclass
@@ -154,6 +154,54 @@ class BoxValueRule(Pattern):
         return {}
 
 
+@dataclass(frozen=True)
+class BoxValueSetRule(Pattern):
+    """
+    Same as an `:or` of `BoxValueRule`s whose values are all of type `cls`.
+    """
+
+    cls: type
+    values: FrozenSet[object]
+
+    def match(self, term: Term) -> Match:
+        if not isinstance(term, Box):
+            return "Not a box"
+
+        if not isinstance(term.value, self.cls):
+            return "Expected a {0}, got {1}".format(
+                self.cls.__name__,
+                type(term.value).__name__,
+            )
+
+        if term.value not in self.values:
+            return "{0!r} is not one of {1} {2} values".format(
+                term.value, len(self.values), self.cls.__name__
+            )
+
+        return {}
+
+
+@dataclass(frozen=True)
+class IsAnyRule(Pattern):
+    """
+    Same as an `:or` of `IsRule`s without attribute rules.
+    """
+
+    class_names: Tuple[str, ...]
+
+    def match(self, term: Term) -> Match:
+        if not isinstance(term, ast.AST):
+            return "Cannot match any of {0}".format(", ".join(self.class_names))
+
+        node_classes = tuple(getattr(ast, name) for name in self.class_names)
+        if not isinstance(term, node_classes):
+            return "{0} is not any of {1}".format(
+                type(term).__name__, ", ".join(self.class_names)
+            )
+
+        return {}
+
+
 @dataclass(frozen=True)
 class FFIRule(Pattern):
     name: str
@@ -222,3 +270,41 @@ class ExistsRule(Pattern):
                 return match
             errors.append(match)
         return "; ".join(errors)
+
+
+@dataclass(frozen=True)
+class HasRule(Pattern):
+    """
+    Matches a node with a descendant that matches `pattern`, giving the
+    captures of the first such descendant in source order.
+    """
+
+    pattern: Pattern
+
+    def match(self, term: Term) -> Match:
+        if not isinstance(term, ast.AST):
+            return "Cannot look into a non-node"
+
+        # Children are pushed last one first, so they come off in order
+        stack = list(reversed(list(ast.iter_child_nodes(term))))
+        while stack:
+            node = stack.pop()
+            match = self.pattern.match(node)
+            if not isinstance(match, str):
+                return match
+            stack.extend(reversed(list(ast.iter_child_nodes(node))))
+        return "No descendant of {0} matched".format(type(term).__name__)
+
+
+@dataclass(frozen=True)
+class InsideRule(Pattern):
+    """
+    Matches a node with an ancestor that matches `pattern`, giving the
+    captures of the nearest such ancestor. A lone node doesn't know its
+    ancestors, so only compiled rules with a `TreeIndex` can match this.
+    """
+
+    pattern: Pattern
+
+    def match(self, term: Term) -> Match:
+        return "Ancestors are only known while scanning a tree"
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import ast
+from pathlib import Path
+import re
+from typing import Iterable, Iterator, Mapping, NoReturn, Optional, Pattern
+
+from ast_rule_engine.draft import Pattern as RulePattern
+from ast_rule_engine.optimize import optimize
+from ast_rule_engine.parse import GetFFI, parse
+from ast_rule_engine.scan import MatchRecord, Scanner
+from ast_rule_engine.spec_cache import load_patterns
+
+
+_DEFAULT_SELECT = re.compile(r"[A-Z].*")
+
+
+def _no_ffi(name: str) -> NoReturn:
+    raise NotImplementedError("FFI is not supported yet")
+
+
+class Engine:
+    """
+    A spec, parsed, optimized and compiled once, for scanning any number of
+    trees, sources or files. Like the CLI, it only reports the rules whose
+    names fully match `select` and don't fully match `unselect`; the other
+    rules can still be referenced.
+    """
+
+    def __init__(
+        self,
+        patterns: Mapping[str, RulePattern],
+        select: Pattern[str] = _DEFAULT_SELECT,
+        unselect: Optional[Pattern[str]] = None,
+    ) -> None:
+        self.patterns = {
+            name: pattern
+            for name, pattern in patterns.items()
+            if select.fullmatch(name)
+            and (unselect is None or not unselect.fullmatch(name))
+        }
+        self.scanner = Scanner(self.patterns)
+
+    @classmethod
+    def from_spec(
+        cls,
+        raw_spec: object,
+        get_ffi: GetFFI = _no_ffi,
+        select: Pattern[str] = _DEFAULT_SELECT,
+        unselect: Optional[Pattern[str]] = None,
+    ) -> Engine:
+        """
+        An engine for an already loaded spec, like the result of
+        `yaml.safe_load`.
+        """
+        return cls(optimize(parse(raw_spec, get_ffi)), select, unselect)
+
+    @classmethod
+    def from_file(
+        cls,
+        spec_path: Path,
+        get_ffi: GetFFI = _no_ffi,
+        select: Pattern[str] = _DEFAULT_SELECT,
+        unselect: Optional[Pattern[str]] = None,
+        cache_dir: Optional[Path] = None,
+    ) -> Engine:
+        """
+        An engine for a YAML spec file. With `cache_dir`, the parsed spec is
+        cached there like with the CLI's `--cache-dir`.
+        """
+        _, patterns = load_patterns(spec_path, get_ffi, cache_dir)
+        return cls(patterns, select, unselect)
+
+    def scan_tree(
+        self, tree: ast.AST, path: str = "<unknown>"
+    ) -> Iterator[MatchRecord]:
+        """
+        Matches in an already parsed tree. `path` only ends up in the records.
+        """
+        return self.scanner.scan_tree(path, tree)
+
+    def scan_source(
+        self, source: str, path: str = "<unknown>"
+    ) -> Iterator[MatchRecord]:
+        return self.scanner.scan_tree(path, ast.parse(source, path))
+
+    def scan_paths(self, paths: Iterable[Path]) -> Iterator[MatchRecord]:
+        return self.scanner.scan_paths(paths)
@@ -0,0 +1,80 @@
+"""
+A flake8 plugin that runs the rules of a spec on the tree flake8 has
+already parsed. Enable it with `--ast-rule-spec PATH` (or `ast-rule-spec`
+in the flake8 config). Rule names are reported as error codes, so they
+should look like flake8 codes, e.g. `ULA001`; codes that don't start with
+`ULA` need `--extend-select`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import copy
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from ast_rule_engine.engine import Engine
+from ast_rule_engine.patch_const import NEEDS_REWRITE
+
+
+# One engine per spec and process: flake8 creates a plugin per file
+_engines: Dict[Tuple[Path, Optional[Path]], Engine] = {}
+
+
+def _engine(spec_path: Path, cache_dir: Optional[Path]) -> Engine:
+    key = (spec_path, cache_dir)
+    if key not in _engines:
+        _engines[key] = Engine.from_file(spec_path, cache_dir=cache_dir)
+    return _engines[key]
+
+
+class Plugin:
+    name = "ast_rule_engine"
+    version = "0.1.0"
+
+    spec_path: Optional[Path] = None
+    cache_dir: Optional[Path] = None
+
+    def __init__(self, tree: ast.AST, filename: str) -> None:
+        self.tree = tree
+        self.filename = filename
+
+    @classmethod
+    def add_options(cls, option_manager: Any) -> None:
+        option_manager.add_option(
+            "--ast-rule-spec",
+            default=None,
+            parse_from_config=True,
+            help="YAML search specification whose rules to report",
+        )
+        option_manager.add_option(
+            "--ast-rule-cache-dir",
+            default=None,
+            parse_from_config=True,
+            help="Directory to cache the parsed specification in",
+        )
+
+    @classmethod
+    def parse_options(cls, options: argparse.Namespace) -> None:
+        spec = options.ast_rule_spec
+        cache_dir = options.ast_rule_cache_dir
+        cls.spec_path = None if spec is None else Path(spec).expanduser().resolve()
+        cls.cache_dir = None if cache_dir is None else Path(cache_dir).expanduser()
+
+    def run(self) -> Iterator[Tuple[int, int, str, type]]:
+        if self.spec_path is None:
+            return
+        engine = _engine(self.spec_path, self.cache_dir)
+        tree = self.tree
+        if NEEDS_REWRITE:
+            # Scanning replaces deprecated constant nodes in place, and the
+            # tree is flake8's, shared with every other plugin
+            tree = copy.deepcopy(tree)
+        for record in engine.scan_tree(tree, self.filename):
+            message = "{0} {1} matches this rule".format(record.rule, record.node_type)
+            if record.captures:
+                message += " ({0})".format(
+                    ", ".join("{0}={1}".format(k, v) for k, v in record.captures)
+                )
+            yield record.line, record.col, message, type(self)
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import ast
+from typing import Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from ast_rule_engine.analysis import RootTypes, root_types
+from ast_rule_engine.compile import Capturer, CompiledRule, Predicate, RuleCompiler
+from ast_rule_engine.dispatch import DispatchTable
+from ast_rule_engine.draft import AndRule, Captures, IsRule, Pattern, RefRule
+
+
+AttrPath = Tuple[str, ...]
+Check = Tuple[AttrPath, type]
+
+
+Walker = Callable[
+    [ast.AST, Dict[AttrPath, object], List[Tuple[str, Captures]]],
+    None,
+]
+
+
+class _TrieNode:
+    __slots__ = ("children", "rules")
+
+    def __init__(self) -> None:
+        self.children: Dict[Check, _TrieNode] = {}
+        self.rules: List[
+            Tuple[str, List[Tuple[AttrPath, Predicate]], Optional[Capturer]]
+        ] = []
+
+
+def _decompose(
+    pattern: Pattern,
+    path: AttrPath,
+    checks: List[Check],
+    residuals: List[Tuple[AttrPath, Pattern]],
+    visiting: Set[str],
+) -> None:
+    """
+    Split a pattern into type checks on attribute paths and leftover
+    sub-patterns. The pattern matches iff all checks and leftovers do.
+    """
+    if isinstance(pattern, IsRule):
+        node_cls = getattr(ast, pattern.class_name, None)
+        if isinstance(node_cls, type) and issubclass(node_cls, ast.AST):
+            checks.append((path, node_cls))
+            for attr, subpattern in pattern.attribute_rules.items():
+                _decompose(subpattern, path + (attr,), checks, residuals, visiting)
+            return
+
+    elif isinstance(pattern, AndRule):
+        for subpattern in pattern.patterns:
+            _decompose(subpattern, path, checks, residuals, visiting)
+        return
+
+    elif isinstance(pattern, RefRule) and pattern.name not in visiting:
+        try:
+            target = pattern.get_pattern(pattern.name)
+        except KeyError:
+            target = None
+        if isinstance(target, (IsRule, AndRule)):
+            visiting.add(pattern.name)
+            _decompose(target, path, checks, residuals, visiting)
+            visiting.remove(pattern.name)
+            return
+
+    residuals.append((path, pattern))
+
+
+def _check_order(check: Check) -> Tuple[int, AttrPath, str]:
+    path, node_cls = check
+    return len(path), path, node_cls.__name__
+
+
+def _getter(path: AttrPath) -> Callable[[ast.AST, Dict[AttrPath, object]], object]:
+    """
+    Fetch the value at `path`, remembering every attribute along the way in
+    `values` so that it is only fetched once per node.
+    """
+    if not path:
+        return lambda node, values: node
+
+    parent = _getter(path[:-1])
+    attr = path[-1]
+
+    def get(node: ast.AST, values: Dict[AttrPath, object]) -> object:
+        try:
+            return values[path]
+        except KeyError:
+            value = values[path] = getattr(parent(node, values), attr, None)
+            return value
+
+    return get
+
+
+def _compile_trie(trie: _TrieNode) -> Walker:
+    rules = tuple(
+        (
+            name,
+            tuple((_getter(path), test) for path, test in residuals),
+            capture,
+        )
+        for name, residuals, capture in trie.rules
+    )
+
+    by_path: Dict[AttrPath, List[Tuple[type, Walker]]] = {}
+    for (path, node_cls), child in trie.children.items():
+        by_path.setdefault(path, []).append((node_cls, _compile_trie(child)))
+    groups = tuple(
+        (_getter(path), tuple(children)) for path, children in by_path.items()
+    )
+
+    def walk(
+        node: ast.AST,
+        values: Dict[AttrPath, object],
+        found: List[Tuple[str, Captures]],
+    ) -> None:
+        for name, residuals, capture in rules:
+            for get, test in residuals:
+                if not test(get(node, values)):
+                    break
+            else:
+                if capture is None:
+                    found.append((name, {}))
+                else:
+                    captures = capture(node)
+                    if captures is not None:
+                        found.append((name, captures))
+
+        for get, children in groups:
+            value = get(node, values)
+            for node_cls, child in children:
+                if isinstance(value, node_cls):
+                    child(node, values, found)
+
+    return walk
+
+
+def _guarded(node_cls: type, walker: Walker) -> Walker:
+    """
+    The deprecated `Num`, `Str` & co. fake their isinstance checks, so the
+    type of a node can't tell whether they match it. Walkers rooted at them
+    check every node instead.
+    """
+    if type(node_cls) is type:
+        return walker
+
+    def walk(
+        node: ast.AST,
+        values: Dict[AttrPath, object],
+        found: List[Tuple[str, Captures]],
+    ) -> None:
+        if isinstance(node, node_cls):
+            walker(node, values, found)
+
+    return walk
+
+
+class MultiMatcher:
+    """
+    Matches all rules against a node in one walk. The type checks of all
+    rules are merged into a trie keyed on (attribute path, class), so a
+    check that several rules start with is done once per node, and each
+    attribute is fetched once per node. Rules that don't start with
+    `is(...)` fall back to being matched on their own.
+    """
+
+    def __init__(
+        self,
+        patterns: Mapping[str, Pattern],
+        rules: Mapping[str, CompiledRule],
+        compiler: RuleCompiler,
+    ) -> None:
+        root = _TrieNode()
+        fallback: Dict[str, RootTypes] = {}
+        # Identical leftovers on the same path are compiled once
+        residual_tests: Dict[Tuple[AttrPath, str], Predicate] = {}
+
+        for name, pattern in patterns.items():
+            checks: List[Check] = []
+            raw_residuals: List[Tuple[AttrPath, Pattern]] = []
+            _decompose(pattern, (), checks, raw_residuals, {name})
+
+            if not any(path == () for path, _ in checks):
+                fallback[name] = root_types(pattern)
+                continue
+
+            residuals: List[Tuple[AttrPath, Predicate]] = []
+            for path, subpattern in raw_residuals:
+                key = (path, repr(subpattern))
+                if key not in residual_tests:
+                    residual_tests[key] = compiler.test(subpattern)
+                residuals.append((path, residual_tests[key]))
+
+            trie = root
+            for check in sorted(set(checks), key=_check_order):
+                trie = trie.children.setdefault(check, _TrieNode())
+            trie.rules.append((name, residuals, rules[name].capture))
+
+        self._rules = rules
+        self._roots = [
+            (node_cls, _guarded(node_cls, _compile_trie(child)))
+            for (_, node_cls), child in root.children.items()
+        ]
+        self._fallback = DispatchTable(fallback)
+        self._by_type: Dict[type, Tuple[Tuple[Walker, ...], Tuple[str, ...]]] = {}
+
+    def _plan(self, node_type: type) -> Tuple[Tuple[Walker, ...], Tuple[str, ...]]:
+        walkers = tuple(
+            walker
+            for node_cls, walker in self._roots
+            if type(node_cls) is not type or issubclass(node_type, node_cls)
+        )
+        plan = (walkers, self._fallback.rules_for(node_type))
+        self._by_type[node_type] = plan
+        return plan
+
+    def match(self, node: ast.AST) -> List[Tuple[str, Captures]]:
+        """
+        Names and captures of all rules that match `node`.
+        """
+        try:
+            walkers, fallback = self._by_type[type(node)]
+        except KeyError:
+            walkers, fallback = self._plan(type(node))
+
+        found: List[Tuple[str, Captures]] = []
+        if walkers:
+            values: Dict[AttrPath, object] = {}
+            for walker in walkers:
+                walker(node, values, found)
+
+        for name in fallback:
+            captures = self._rules[name].match(node)
+            if captures is not None:
+                found.append((name, captures))
+
+        return found
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import ast
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+from ast_rule_engine.analysis import (
+    estimated_cost,
+    has_bare_refs,
+    has_captures,
+    has_ffi,
+)
+from ast_rule_engine.draft import (
+    AndRule,
+    BoxValueRule,
+    BoxValueSetRule,
+    ExistsRule,
+    ForallRule,
+    HasRule,
+    InsideRule,
+    IsAnyRule,
+    IsRule,
+    NotRule,
+    OrRule,
+    Pattern,
+    RefRule,
+    TupleRule,
+)
+
+
+# Only values whose equality agrees with hashing can go into a set. Floats
+# are left out because of NaN.
+_SET_TYPES = (str, bytes, int, bool, type(None))
+
+
+def optimize(patterns: Mapping[str, Pattern]) -> Dict[str, Pattern]:
+    """
+    Rewrite parsed patterns into equivalent ones that are cheaper to match.
+    Wide `:or`s of constants become a single set lookup, `:or`s of bare
+    `is(...)` a single `isinstance` call, and cheap branches of `:or` and
+    `:and` are tried first. References are rebound to the optimized rules,
+    so this has to be given every rule of a spec.
+    """
+    # Until a rule is optimized, references to it (which the analyses follow)
+    # get the original
+    optimized: Dict[str, Pattern] = dict(patterns)
+    look_up_rule = optimized.__getitem__
+    for name, pattern in patterns.items():
+        optimized[name] = _optimize(pattern, look_up_rule)
+    return optimized
+
+
+def _optimize(pattern: Pattern, look_up_rule: Callable[[str], Pattern]) -> Pattern:
+    if isinstance(pattern, IsRule):
+        return IsRule(
+            pattern.class_name,
+            {
+                attr: _optimize(subpattern, look_up_rule)
+                for attr, subpattern in pattern.attribute_rules.items()
+            },
+        )
+    elif isinstance(pattern, OrRule):
+        return _optimize_or(
+            [_optimize(subpattern, look_up_rule) for subpattern in pattern.patterns]
+        )
+    elif isinstance(pattern, AndRule):
+        branches = [
+            _optimize(subpattern, look_up_rule) for subpattern in pattern.patterns
+        ]
+        return AndRule(reorder_branches(branches, keep_captures_in_place=False))
+    elif isinstance(pattern, NotRule):
+        return NotRule(_optimize(pattern.wrapped, look_up_rule))
+    elif isinstance(pattern, RefRule):
+        return RefRule(pattern.name, look_up_rule)
+    elif isinstance(pattern, TupleRule):
+        return TupleRule(
+            [_optimize(subpattern, look_up_rule) for subpattern in pattern.patterns]
+        )
+    elif isinstance(pattern, ForallRule):
+        return ForallRule(_optimize(pattern.predicate, look_up_rule))
+    elif isinstance(pattern, ExistsRule):
+        return ExistsRule(_optimize(pattern.predicate, look_up_rule))
+    elif isinstance(pattern, HasRule):
+        return HasRule(_optimize(pattern.pattern, look_up_rule))
+    elif isinstance(pattern, InsideRule):
+        return InsideRule(_optimize(pattern.pattern, look_up_rule))
+    else:
+        return pattern
+
+
+def _set_type(pattern: Pattern) -> Optional[type]:
+    if isinstance(pattern, BoxValueRule) and type(pattern.value) in _SET_TYPES:
+        return type(pattern.value)
+    return None
+
+
+def _is_bare_node_check(pattern: Pattern) -> bool:
+    if not isinstance(pattern, IsRule) or pattern.attribute_rules:
+        return False
+    node_cls = getattr(ast, pattern.class_name, None)
+    return isinstance(node_cls, type) and issubclass(node_cls, ast.AST)
+
+
+def _optimize_or(branches: Sequence[Pattern]) -> Pattern:
+    """
+    Merge each set-able branch into the first earlier branch of the same
+    kind. A branch is only moved past branches that can't capture, since
+    any of them matching gives the same `{}` as the moved branch would,
+    and never past FFI calls, which must keep running on the same terms.
+    """
+    merged: List[object] = []
+    # Index in `merged` of the open group for each kind of branch
+    groups: Dict[object, int] = {}
+
+    for branch in branches:
+        value_cls = _set_type(branch)
+        if value_cls is not None:
+            kind: object = value_cls
+        elif _is_bare_node_check(branch):
+            kind = IsRule
+        else:
+            kind = None
+
+        if kind is None:
+            if has_captures(branch) or has_ffi(branch):
+                groups.clear()
+            merged.append(branch)
+        elif kind in groups:
+            merged[groups[kind]].append(branch)  # type: ignore
+        else:
+            groups[kind] = len(merged)
+            merged.append([branch])
+
+    result: List[Pattern] = []
+    for item in merged:
+        if not isinstance(item, list):
+            result.append(item)  # type: ignore
+        elif len(item) == 1:
+            result.append(item[0])
+        elif isinstance(item[0], IsRule):
+            result.append(IsAnyRule(tuple(rule.class_name for rule in item)))
+        else:
+            result.append(
+                BoxValueSetRule(
+                    type(item[0].value), frozenset(rule.value for rule in item)
+                )
+            )
+
+    if len(result) == 1:
+        return result[0]
+    return OrRule(reorder_branches(result, keep_captures_in_place=True))
+
+
+def reorder_branches(
+    branches: Sequence[Pattern], keep_captures_in_place: bool
+) -> List[Pattern]:
+    """
+    Move the branches that are cheap and can't be told apart by the order
+    they run in to the front, cheapest first. Branches with FFI calls (and,
+    for `:or`, branches that capture) stay where they are, and nothing moves
+    past them. Branches that capture or refer to other rules on the same
+    term keep their relative order and only ever move back, so they run on
+    fewer terms than before but never on new ones.
+    """
+    result: List[Pattern] = []
+    movable: List[Pattern] = []
+    rest: List[Pattern] = []
+
+    def flush() -> None:
+        movable.sort(key=estimated_cost)
+        result.extend(movable)
+        result.extend(rest)
+        del movable[:], rest[:]
+
+    for branch in branches:
+        captures = has_captures(branch)
+        if has_ffi(branch) or (captures and keep_captures_in_place):
+            flush()
+            result.append(branch)
+        elif captures or has_bare_refs(branch):
+            rest.append(branch)
+        else:
+            movable.append(branch)
+    flush()
+    return result
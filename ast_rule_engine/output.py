@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+from pathlib import PurePath
+import sys
+from typing import IO, Any, Dict, Iterable, List, Mapping, Optional
+
+from ast_rule_engine.scan import MatchRecord, group_by_rule
+
+
+_SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+
+def print_matches(
+    grouped: Mapping[str, Mapping[str, List[MatchRecord]]],
+    file: Optional[IO[str]] = None,
+) -> None:
+    lines: List[str] = []
+    for pattern_name, by_path in grouped.items():
+        if by_path:
+            lines.append(f"Matches for {pattern_name!r}:\n")
+
+        for path, records in by_path.items():
+            lines.append(f"  In {path}:\n")
+            for record in records:
+                lines.append(
+                    f"    at line {record.line}, col {record.col}: {record.node_type}\n"
+                )
+                for k, v in record.captures:
+                    lines.append(f"      - {k}: {v}\n")
+
+    (sys.stdout if file is None else file).write("".join(lines))
+
+
+def record_to_json(record: MatchRecord) -> Dict[str, Any]:
+    return {
+        "path": record.path,
+        "rule": record.rule,
+        "line": record.line,
+        "col": record.col,
+        "end_line": record.end_line,
+        "end_col": record.end_col,
+        "node_type": record.node_type,
+        "captures": dict(record.captures),
+    }
+
+
+class Renderer:
+    """
+    Writes match records to `stream` as they come in, or all at once on
+    `close` for formats that need to see every record first.
+    """
+
+    def __init__(self, stream: IO[str], rule_names: Iterable[str]) -> None:
+        self.stream = stream
+        self.rule_names = list(rule_names)
+
+    def add(self, record: MatchRecord) -> None:
+        raise NotImplementedError
+
+    def file_done(self, path: str) -> None:
+        """
+        Called once `path` has been scanned, whether it had matches or not.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class TextRenderer(Renderer):
+    """
+    The human-readable output, grouped by rule and then by file.
+    """
+
+    def __init__(self, stream: IO[str], rule_names: Iterable[str]) -> None:
+        super().__init__(stream, rule_names)
+        self._records: List[MatchRecord] = []
+
+    def add(self, record: MatchRecord) -> None:
+        self._records.append(record)
+
+    def close(self) -> None:
+        print_matches(group_by_rule(self._records, self.rule_names), self.stream)
+
+
+class JsonLinesRenderer(Renderer):
+    """
+    One JSON object per match. The stream is flushed whenever a file is done,
+    so that consumers can process the results of a file right away.
+    """
+
+    def add(self, record: MatchRecord) -> None:
+        self.stream.write(json.dumps(record_to_json(record)) + "\n")
+
+    def file_done(self, path: str) -> None:
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class SarifRenderer(Renderer):
+    """
+    A SARIF 2.1.0 log with a single run. Columns are 1-based, as SARIF
+    wants them.
+    """
+
+    def __init__(self, stream: IO[str], rule_names: Iterable[str]) -> None:
+        super().__init__(stream, rule_names)
+        self._results: List[Dict[str, Any]] = []
+
+    def add(self, record: MatchRecord) -> None:
+        region: Dict[str, Any] = {
+            "startLine": record.line,
+            "startColumn": record.col + 1,
+        }
+        if record.end_line is not None and record.end_col is not None:
+            region["endLine"] = record.end_line
+            region["endColumn"] = record.end_col + 1
+
+        self._results.append(
+            {
+                "ruleId": record.rule,
+                "message": {"text": f"{record.node_type} matches {record.rule}"},
+                "locations": [
+                    {
+                        "physicalLocation": {
+                            "artifactLocation": {
+                                "uri": PurePath(record.path).as_posix()
+                            },
+                            "region": region,
+                        }
+                    }
+                ],
+                "properties": {
+                    "nodeType": record.node_type,
+                    "captures": dict(record.captures),
+                },
+            }
+        )
+
+    def close(self) -> None:
+        log = {
+            "$schema": _SARIF_SCHEMA,
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {
+                        "driver": {
+                            "name": "ast_rule_engine",
+                            "rules": [{"id": name} for name in self.rule_names],
+                        }
+                    },
+                    "results": self._results,
+                }
+            ],
+        }
+        json.dump(log, self.stream, indent=2)
+        self.stream.write("\n")
+
+
+def make_renderer(
+    output_format: str, stream: IO[str], rule_names: Iterable[str]
+) -> Renderer:
+    if output_format == "jsonl":
+        return JsonLinesRenderer(stream, rule_names)
+    elif output_format == "sarif":
+        return SarifRenderer(stream, rule_names)
+    else:
+        return TextRenderer(stream, rule_names)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import sys
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ast_rule_engine.cache import ResultCache
+from ast_rule_engine.optimize import optimize
+from ast_rule_engine.parse import GetFFI, parse
+from ast_rule_engine.scan import FileTimeout, MatchRecord, Scanner
+
+
+_scanner: Optional[Scanner] = None
+
+
+def _init_worker(
+    raw_spec: object,
+    rule_names: Sequence[str],
+    get_ffi: GetFFI,
+    cache_config: Optional[Tuple[Path, str, int]],
+    file_timeout: Optional[float],
+    adaptive_order: bool,
+) -> None:
+    global _scanner
+    patterns = optimize(parse(raw_spec, get_ffi))
+    cache = None if cache_config is None else ResultCache(*cache_config)
+    _scanner = Scanner(
+        {name: patterns[name] for name in rule_names},
+        cache,
+        file_timeout=file_timeout,
+        adaptive_order=adaptive_order,
+    )
+
+
+def _scan_file(
+    path: Path,
+) -> Tuple[List[MatchRecord], int, int, Optional[FileTimeout]]:
+    assert _scanner is not None
+    cache = _scanner.cache
+    hits, misses = (0, 0) if cache is None else (cache.hits, cache.misses)
+    try:
+        records = _scanner.scan_file(path)
+    except FileTimeout as e:
+        records, timeout = [], e
+    else:
+        timeout = None
+    if cache is None:
+        return records, 0, 0, timeout
+    return records, cache.hits - hits, cache.misses - misses, timeout
+
+
+def scan_paths_parallel(
+    raw_spec: object,
+    rule_names: Sequence[str],
+    get_ffi: GetFFI,
+    paths: Iterable[Path],
+    jobs: int,
+    cache: Optional[ResultCache] = None,
+    chunksize: int = 16,
+    file_timeout: Optional[float] = None,
+    on_timeout: Optional[Callable[[FileTimeout], None]] = None,
+    adaptive_order: bool = False,
+    on_file_done: Optional[Callable[[Path], None]] = None,
+) -> Iterator[MatchRecord]:
+    """
+    Like `Scanner.scan_paths`, but spread over `jobs` processes. Every worker
+    parses and optimizes the spec itself. Records come back in the order of
+    `paths`, so the output is the same as with a single process. Cache hits
+    and misses in the workers are added to the statistics of `cache`. If
+    the caller stops early, files that haven't been started are dropped.
+    """
+    cache_config = (
+        None if cache is None else (cache.directory, cache.spec_key, cache.max_bytes)
+    )
+    executor = ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(
+            raw_spec,
+            list(rule_names),
+            get_ffi,
+            cache_config,
+            file_timeout,
+            adaptive_order,
+        ),
+    )
+    paths = list(paths)
+    try:
+        results = executor.map(_scan_file, paths, chunksize=chunksize)
+        for path, (records, hits, misses, timeout) in zip(paths, results):
+            if cache is not None:
+                cache.hits += hits
+                cache.misses += misses
+            if timeout is not None:
+                if on_timeout is None:
+                    raise timeout
+                on_timeout(timeout)
+            yield from records
+            if on_file_done is not None:
+                on_file_done(path)
+    finally:
+        if sys.version_info >= (3, 9):
+            executor.shutdown(cancel_futures=True)
+        else:
+            executor.shutdown()
@@ -1,7 +1,7 @@
 import re
 import ast
 from dataclasses import dataclass
-from typing import Callable, Mapping
+from typing import Callable, Dict, Mapping
 
 from ast_rule_engine.draft import (
     BoxTypeRule,
@@ -9,6 +9,8 @@ from ast_rule_engine.draft import (
     ExistsRule,
     FFIRule,
     ForallRule,
+    HasRule,
+    InsideRule,
     IsRule,
     Match,
     NotRule,
@@ -45,16 +47,15 @@ def parse(source: object, get_ffi: GetFFI) -> Mapping[str, Pattern]:
         if not isinstance(rule_name, str):
             raise ParseError((rule_name,), "Expected key to be a string")
 
-    def look_up_rule(name: str) -> Pattern:
-        return patterns[name]
-
-    patterns = {}
+    # A bound method rather than a closure, so that the result can be pickled
+    patterns: Dict[str, Pattern] = {}
+    look_up_rule = patterns.__getitem__
 
     for rule_name, raw_rule in stmt_rules.items():
         pattern = parse_rule(raw_rule, (rule_name,), look_up_rule, get_ffi)
         patterns[rule_name] = pattern
 
-    return dict(patterns)
+    return patterns
 
 
 def parse_rule(
@@ -94,6 +95,16 @@ def parse_rule(
                 parse_rule(raw_rule[":exists"], path, look_up_rule, get_ffi)
             )
 
+        elif ":has" in raw_rule:
+            path += (":has",)
+            return HasRule(parse_rule(raw_rule[":has"], path, look_up_rule, get_ffi))
+
+        elif ":inside" in raw_rule:
+            path += (":inside",)
+            return InsideRule(
+                parse_rule(raw_rule[":inside"], path, look_up_rule, get_ffi)
+            )
+
         elif ":or" in raw_rule:
             variants = raw_rule[":or"]
             path += (":or",)
@@ -1,4 +1,6 @@
 import ast
+import sys
+from typing import Any, Callable, Dict
 
 
 class LegacyConstantRewriter(ast.NodeTransformer):
@@ -26,3 +28,27 @@ class LegacyConstantRewriter(ast.NodeTransformer):
         const_node = ast.Constant(value=...)
         ast.copy_location(const_node, node)
         return const_node
+
+
+# Only these versions' parsers produce the deprecated nodes
+NEEDS_REWRITE = sys.version_info < (3, 8)
+
+_LEGACY_VALUES: Dict[str, Callable[[Any], object]] = {
+    "Str": lambda node: node.s,
+    "Num": lambda node: node.n,
+    "NameConstant": lambda node: node.value,
+    "Ellipsis": lambda node: ...,
+}
+
+
+def to_constant(node: ast.AST) -> ast.AST:
+    """
+    `node` as a `Constant` if it is one of the deprecated constant nodes,
+    otherwise `node` itself.
+    """
+    get_value = _LEGACY_VALUES.get(type(node).__name__)
+    if get_value is None:
+        return node
+    const_node = ast.Constant(value=get_value(node))
+    ast.copy_location(const_node, node)
+    return const_node
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import mmap
+from pathlib import Path
+import re
+from typing import Dict, Mapping, Optional, Tuple, Union
+
+from ast_rule_engine.analysis import required_tokens
+from ast_rule_engine.draft import Pattern
+
+
+_NON_ASCII = re.compile(rb"[\x80-\xff]")
+
+Source = Union[bytes, mmap.mmap]
+
+
+class TokenFilter:
+    """
+    Decides from the raw bytes of a file whether any rule could match in it,
+    so that files that can't match don't have to be parsed. Files that
+    aren't pure ASCII always pass.
+    """
+
+    def __init__(self, rules: Mapping[str, Tuple[Tuple[bytes, ...], ...]]) -> None:
+        self.rules = rules
+
+    @classmethod
+    def for_patterns(cls, patterns: Mapping[str, Pattern]) -> Optional[TokenFilter]:
+        """
+        A filter for `patterns`, or `None` if one of them doesn't need any
+        particular text and the filter would let every file through.
+        """
+        rules: Dict[str, Tuple[Tuple[bytes, ...], ...]] = {}
+        for name, pattern in patterns.items():
+            requirement = required_tokens(pattern)
+            if not requirement:
+                return None
+            rules[name] = tuple(
+                sorted(
+                    tuple(sorted(token.encode("utf-8") for token in clause))
+                    for clause in requirement
+                )
+            )
+        return cls(rules)
+
+    def might_match(self, data: Source) -> bool:
+        if _NON_ASCII.search(data) is not None:
+            return True
+
+        found: Dict[bytes, bool] = {}
+        for clauses in self.rules.values():
+            for clause in clauses:
+                for token in clause:
+                    if token not in found:
+                        found[token] = data.find(token) != -1
+                    if found[token]:
+                        break
+                else:
+                    break
+            else:
+                return True
+        return False
+
+    def might_match_file(self, path: Path) -> bool:
+        with path.open("rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                return self.might_match(b"")
+            with data:
+                return self.might_match(data)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+
+@dataclass
+class RuleStats:
+    attempts: int = 0
+    successes: int = 0
+    failures: int = 0
+    total_time: float = 0.0
+    self_time: float = 0.0
+
+
+class Profiler:
+    """
+    Collects statistics from rules compiled with instrumentation: attempts,
+    outcomes and time per top-level rule (keyed by name) and per referenced
+    rule (keyed by `~name`), which branch of each `:or` matched, how long
+    each file took to parse and traverse, and how long the phases before the
+    first file took.
+    """
+
+    def __init__(self) -> None:
+        self.rules: Dict[str, RuleStats] = {}
+        self.branches: Dict[str, List[int]] = {}
+        self.files: Dict[str, Tuple[float, float]] = {}
+        self.startup: Dict[str, float] = {}
+        # Time spent in instrumented callees, one slot per active call
+        self._child_time: List[float] = []
+
+    def instrument(self, key: str, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        stats = self.rules.setdefault(key, RuleStats())
+        child_time = self._child_time
+
+        def instrumented(term: Any) -> Any:
+            child_time.append(0.0)
+            start = perf_counter()
+            try:
+                result = fn(term)
+            finally:
+                elapsed = perf_counter() - start
+                stats.total_time += elapsed
+                stats.self_time += elapsed - child_time.pop()
+                if child_time:
+                    child_time[-1] += elapsed
+
+            stats.attempts += 1
+            if result is None or result is False:
+                stats.failures += 1
+            else:
+                stats.successes += 1
+            return result
+
+        return instrumented
+
+    def branch_counts(self, label: str, branches: int) -> List[int]:
+        """
+        Counters for an `:or` with `branches` alternatives. The extra last
+        counter is for terms that no branch matched.
+        """
+        return self.branches.setdefault(label, [0] * (branches + 1))
+
+    def record_file(self, path: str, parse_time: float, traverse_time: float) -> None:
+        self.files[path] = (parse_time, traverse_time)
+
+    def record_startup(self, phase: str, seconds: float) -> None:
+        self.startup[phase] = seconds
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "startup": dict(self.startup),
+            "rules": {key: asdict(stats) for key, stats in self.rules.items()},
+            "branches": dict(self.branches),
+            "files": {
+                path: {"parse_time": parse_time, "traverse_time": traverse_time}
+                for path, (parse_time, traverse_time) in self.files.items()
+            },
+        }
+
+    def format_report(self, top_files: int = 10) -> str:
+        lines = [
+            "{0:<32} {1:>10} {2:>10} {3:>10} {4:>12} {5:>12}".format(
+                "rule", "attempts", "matched", "failed", "total s", "self s"
+            )
+        ]
+        for key, stats in sorted(
+            self.rules.items(), key=lambda item: item[1].self_time, reverse=True
+        ):
+            lines.append(
+                "{0:<32} {1:>10} {2:>10} {3:>10} {4:>12.4f} {5:>12.4f}".format(
+                    key,
+                    stats.attempts,
+                    stats.successes,
+                    stats.failures,
+                    stats.total_time,
+                    stats.self_time,
+                )
+            )
+
+        if self.branches:
+            lines.append("")
+            lines.append(":or branches that matched (last column: none did):")
+            for label, counts in sorted(self.branches.items()):
+                lines.append(
+                    "  {0}: {1}".format(label, " ".join(str(c) for c in counts))
+                )
+
+        if self.files:
+            total_parse = sum(parse for parse, _ in self.files.values())
+            total_traverse = sum(traverse for _, traverse in self.files.values())
+            lines.append("")
+            lines.append(
+                "{0} files: {1:.4f}s parsing, {2:.4f}s traversing".format(
+                    len(self.files), total_parse, total_traverse
+                )
+            )
+            slowest = sorted(
+                self.files.items(), key=lambda item: sum(item[1]), reverse=True
+            )
+            for path, (parse_time, traverse_time) in slowest[:top_files]:
+                lines.append(
+                    "  {0}: {1:.4f}s parsing, {2:.4f}s traversing".format(
+                        path, parse_time, traverse_time
+                    )
+                )
+
+        if self.startup:
+            lines.append("")
+            lines.append(
+                "Startup: {0:.4f}s ({1})".format(
+                    sum(self.startup.values()),
+                    ", ".join(
+                        "{0} {1:.4f}s".format(phase, seconds)
+                        for phase, seconds in self.startup.items()
+                    ),
+                )
+            )
+
+        return "\n".join(lines)
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import ast
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ast_rule_engine.analysis import required_types, root_types
+from ast_rule_engine.compile import Memo, RuleCompiler
+from ast_rule_engine.dispatch import DispatchTable
+from ast_rule_engine.multi import MultiMatcher
+from ast_rule_engine.draft import Box, Captures, Pattern as RulePattern, Term
+from ast_rule_engine.prefilter import TokenFilter
+from ast_rule_engine.structure import TreeIndex
+from ast_rule_engine.summary import NodeClassIndex
+from ast_rule_engine.traverse import preorder
+
+if TYPE_CHECKING:
+    from ast_rule_engine.cache import ResultCache
+    from ast_rule_engine.profiling import Profiler
+
+
+@dataclass(frozen=True)
+class MatchRecord:
+    """
+    A single match, detached from the tree it was found in. The end of the
+    node is unknown before Python 3.8.
+    """
+
+    rule: str
+    path: str
+    line: int
+    col: int
+    node_type: str
+    captures: Tuple[Tuple[str, str], ...]
+    end_line: Optional[int] = None
+    end_col: Optional[int] = None
+
+
+class FileTimeout(Exception):
+    """
+    Scanning a file took longer than the scanner's `file_timeout`.
+    """
+
+    def __init__(self, path: str, timeout: float) -> None:
+        super().__init__(path, timeout)
+        self.path = path
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        return "{0}: scanning took longer than {1}s".format(self.path, self.timeout)
+
+
+@dataclass(frozen=True)
+class MatchLimits:
+    """
+    When to stop reporting matches: after the first match of each rule,
+    and/or after `max_matches` matches in total.
+    """
+
+    first_match_per_rule: bool = False
+    max_matches: Optional[int] = None
+
+
+def render_term(term: Term) -> str:
+    if isinstance(term, Box):
+        return repr(term.value)
+    elif isinstance(term, list):
+        return "[{0}]".format(", ".join(render_term(item) for item in term))
+    elif hasattr(ast, "unparse"):
+        return ast.unparse(term)
+    else:
+        return ast.dump(term)
+
+
+def get_all_nodes(node: ast.AST) -> List[ast.AST]:
+    nodes, _ = preorder(node)
+    return nodes
+
+
+class Scanner:
+    """
+    Compiled rules plus everything needed to run them over one file at a time.
+    Rules in `disabled` aren't matched anymore. A file whose scan takes longer
+    than `file_timeout` seconds raises `FileTimeout`; the time is checked
+    between nodes, so a single parse or match isn't interrupted. See
+    `RuleCompiler` for `adaptive_order`.
+    """
+
+    def __init__(
+        self,
+        patterns: Mapping[str, RulePattern],
+        cache: Optional[ResultCache] = None,
+        profiler: Optional[Profiler] = None,
+        file_timeout: Optional[float] = None,
+        adaptive_order: bool = False,
+    ) -> None:
+        self.cache = cache
+        self.profiler = profiler
+        self.file_timeout = file_timeout
+        self.disabled: Set[str] = set()
+        self.memo = Memo()
+        self.trees = TreeIndex()
+        self._patterns = patterns
+        self._compiler = RuleCompiler(self.memo, profiler, adaptive_order, self.trees)
+        self.rules = self._compiler.compile_rules(patterns)
+        self._parse_time = 0.0
+        types = {name: root_types(pattern) for name, pattern in patterns.items()}
+        self.table = DispatchTable(types)
+
+        self.prefilter = TokenFilter.for_patterns(patterns)
+        self.index = NodeClassIndex()
+        self._needs = {
+            name: self.index.clauses(required_types(pattern))
+            for name, pattern in patterns.items()
+        }
+        self._root_masks = {
+            name: self.index.root_mask(node_types) for name, node_types in types.items()
+        }
+        self._matchers: Dict[
+            Tuple[str, ...], Callable[[ast.AST], List[Tuple[str, Captures]]]
+        ] = {}
+
+    def _matcher_for(
+        self, rule_names: Tuple[str, ...]
+    ) -> Callable[[ast.AST], List[Tuple[str, Captures]]]:
+        """
+        A function that matches just `rule_names` against a node. There are
+        only a few different sets of rules that can match in a file, so the
+        functions are kept around.
+        """
+        if rule_names in self._matchers:
+            return self._matchers[rule_names]
+
+        patterns = {name: self._patterns[name] for name in rule_names}
+        if self.profiler is None:
+            match_node = MultiMatcher(patterns, self.rules, self._compiler).match
+        else:
+            # Profiling is per rule, so it needs every rule to be run on its own
+            table = DispatchTable(
+                {name: root_types(pattern) for name, pattern in patterns.items()}
+            )
+
+            def match_node(node: ast.AST) -> List[Tuple[str, Captures]]:
+                found: List[Tuple[str, Captures]] = []
+                for rule_name in table.rules_for(type(node)):
+                    captures = self.rules[rule_name].match(node)
+                    if captures is not None:
+                        found.append((rule_name, captures))
+                return found
+
+        self._matchers[rule_names] = match_node
+        return match_node
+
+    def scan_tree(
+        self, path: str, tree: ast.AST, deadline: Optional[float] = None
+    ) -> Iterator[MatchRecord]:
+        """
+        Matches in `tree`. Raises `FileTimeout` once `perf_counter()` is past
+        `deadline`. The memo and tree index only hold one tree at a time, so
+        all matches are found before the first one is returned.
+        """
+        return iter(list(self._scan_tree(path, tree, deadline)))
+
+    def _scan_tree(
+        self, path: str, tree: ast.AST, deadline: Optional[float]
+    ) -> Iterator[MatchRecord]:
+        start = perf_counter()
+        nodes, parents, masks, ends = self.index.summarize(tree)
+        if self.profiler is not None:
+            self.profiler.record_file(path, self._parse_time, perf_counter() - start)
+            self._parse_time = 0.0
+
+        # Rules whose required node classes aren't all in the file are out
+        file_mask = masks[0]
+        disabled = self.disabled
+        active = tuple(
+            name
+            for name, clauses in self._needs.items()
+            if name not in disabled and all(clause & file_mask for clause in clauses)
+        )
+        if not active:
+            return
+        match_node = self._matcher_for(active)
+
+        # A node's summary covers every node below it, so a subtree is
+        # skipped when no rule could start at any node in it, or when none
+        # of the rules that could has the node classes it needs in there.
+        # Most rules need nothing but what they start at (`plain_roots`),
+        # which is cheap to check; the others are checked once per
+        # distinct summary.
+        plain_roots: Optional[int] = 0
+        any_roots: Optional[int] = 0
+        needs: List[Tuple[Optional[int], Tuple[int, ...]]] = []
+        for name in active:
+            root_mask = self._root_masks[name]
+            if root_mask is None or any_roots is None:
+                any_roots = None
+            else:
+                any_roots |= root_mask
+            clauses = tuple(
+                clause
+                for clause in self._needs[name]
+                if root_mask is None or root_mask & ~clause
+            )
+            if clauses:
+                needs.append((root_mask, clauses))
+            elif root_mask is None or plain_roots is None:
+                plain_roots = None
+            else:
+                plain_roots |= root_mask
+        wanted: Dict[int, bool] = {}
+
+        self.trees.load(nodes, parents, ends)
+        try:
+            i = 0
+            count = len(nodes)
+            while i < count:
+                mask = masks[i]
+                if any_roots is not None and not mask & any_roots:
+                    i = ends[i]
+                    continue
+                if plain_roots is not None and not mask & plain_roots:
+                    keep = wanted.get(mask)
+                    if keep is None:
+                        keep = wanted[mask] = any(
+                            (root is None or mask & root)
+                            and all(clause & mask for clause in clauses)
+                            for root, clauses in needs
+                        )
+                    if not keep:
+                        i = ends[i]
+                        continue
+                if deadline is not None and perf_counter() > deadline:
+                    raise FileTimeout(path, self.file_timeout or 0.0)
+                node = nodes[i]
+                i += 1
+                for rule_name, captures in match_node(node):
+                    yield MatchRecord(
+                        rule_name,
+                        path,
+                        node.lineno,  # type: ignore
+                        node.col_offset,  # type: ignore
+                        type(node).__name__,
+                        tuple((k, render_term(v)) for k, v in captures.items()),
+                        getattr(node, "end_lineno", None),
+                        getattr(node, "end_col_offset", None),
+                    )
+        finally:
+            self.memo.clear()
+            self.trees.clear()
+
+    def scan_file(self, path: Path) -> List[MatchRecord]:
+        if len(self.disabled) >= len(self.rules):
+            return []
+        if self.prefilter is not None and not self.prefilter.might_match_file(path):
+            return []
+
+        data = path.read_bytes()
+
+        if self.cache is None:
+            return self._scan_bytes(str(path), data)
+
+        key = self.cache.key(data)
+        records = self.cache.get(key, str(path))
+        if records is None:
+            records = self._scan_bytes(str(path), data)
+            # Results with disabled rules left out are incomplete
+            if not self.disabled:
+                self.cache.put(key, records)
+        return records
+
+    def _scan_bytes(self, path: str, data: bytes) -> List[MatchRecord]:
+        start = perf_counter()
+        deadline = None if self.file_timeout is None else start + self.file_timeout
+        tree = ast.parse(data.decode("utf-8"))
+        self._parse_time = perf_counter() - start
+        if deadline is not None and perf_counter() > deadline:
+            raise FileTimeout(path, self.file_timeout or 0.0)
+        return list(self._scan_tree(path, tree, deadline))
+
+    def scan_paths(
+        self,
+        paths: Iterable[Path],
+        on_timeout: Optional[Callable[[FileTimeout], None]] = None,
+        on_file_done: Optional[Callable[[Path], None]] = None,
+    ) -> Iterator[MatchRecord]:
+        """
+        Matches in all `paths`. With `on_timeout`, files that time out are
+        reported to it and skipped. `on_file_done` is called with each path
+        once its records have been consumed, also for files without any.
+        """
+        for path in paths:
+            try:
+                records = self.scan_file(path)
+            except FileTimeout as e:
+                if on_timeout is None:
+                    raise
+                on_timeout(e)
+                records = []
+            yield from records
+            if on_file_done is not None:
+                on_file_done(path)
+
+
+def limit_matches(
+    records: Iterable[MatchRecord],
+    limits: MatchLimits,
+    disable: Callable[[str], None],
+) -> Iterator[MatchRecord]:
+    """
+    The records that `limits` let through. Once a rule won't be reported
+    anymore it is passed to `disable`, so that the scan can stop matching
+    it. Stops consuming `records` when the total is reached.
+    """
+    if limits.max_matches is not None and limits.max_matches <= 0:
+        return
+    reported: Set[str] = set()
+    count = 0
+    for record in records:
+        if limits.first_match_per_rule:
+            if record.rule in reported:
+                continue
+            reported.add(record.rule)
+            disable(record.rule)
+        yield record
+        count += 1
+        if limits.max_matches is not None and count >= limits.max_matches:
+            return
+
+
+def group_by_rule(
+    records: Iterable[MatchRecord],
+    rule_names: Iterable[str],
+) -> Dict[str, Dict[str, List[MatchRecord]]]:
+    grouped: Dict[str, Dict[str, List[MatchRecord]]] = {name: {} for name in rule_names}
+    for record in records:
+        grouped[record.rule].setdefault(record.path, []).append(record)
+    return grouped
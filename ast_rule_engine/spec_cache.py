@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+import pickle
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from ast_rule_engine.draft import Pattern
+
+if TYPE_CHECKING:
+    from ast_rule_engine.parse import GetFFI
+
+
+# Bump this whenever parsing or optimizing starts producing different patterns
+_CACHE_FORMAT = 2
+
+
+def load_yaml(text: str) -> object:
+    """
+    `yaml.safe_load`, but with libyaml's loader when PyYAML was built with it.
+    """
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(text, Loader=loader)
+
+
+def _parse(
+    data: bytes, get_ffi: GetFFI, optimized: bool
+) -> Tuple[object, Dict[str, Pattern]]:
+    # Only needed on a cache miss, and slow to import
+    from ast_rule_engine.optimize import optimize
+    from ast_rule_engine.parse import parse
+
+    raw_spec = load_yaml(data.decode("utf-8"))
+    patterns = parse(raw_spec, get_ffi)
+    return raw_spec, optimize(patterns) if optimized else dict(patterns)
+
+
+def load_patterns(
+    spec_path: Path,
+    get_ffi: GetFFI,
+    cache_dir: Optional[Path] = None,
+    optimized: bool = True,
+) -> Tuple[object, Dict[str, Pattern]]:
+    """
+    The raw spec and all of its rules, parsed and (unless not `optimized`)
+    optimized. With `cache_dir`, the result is pickled into
+    `cache_dir/specs`, keyed by the contents of the spec, and later loads of
+    the same spec unpickle it instead. Specs whose `get_ffi` can't be
+    pickled aren't cached.
+    """
+    data = spec_path.read_bytes()
+    if cache_dir is None:
+        return _parse(data, get_ffi, optimized)
+
+    try:
+        ffi_key = pickle.dumps(get_ffi)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return _parse(data, get_ffi, optimized)
+
+    digest = hashlib.sha256(
+        "{0}:{1}:{2}:{3}:".format(
+            _CACHE_FORMAT, sys.implementation.name, sys.version_info[:3], optimized
+        ).encode("utf-8")
+    )
+    digest.update(ffi_key)
+    digest.update(data)
+    entry = cache_dir / "specs" / "{0}.pickle".format(digest.hexdigest())
+
+    try:
+        with entry.open("rb") as f:
+            result = pickle.load(f)
+        # The result cache evicts least recently used files first
+        os.utime(entry)
+        return result
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        pass
+
+    result = _parse(data, get_ffi, optimized)
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+    except OSError:
+        return result
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, entry)
+    except (OSError, pickle.PicklingError, AttributeError, TypeError):
+        # The cache is only an optimization
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+    return result
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import ast
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ast_rule_engine.traverse import preorder
+
+
+class TreeIndex:
+    """
+    Where the nodes of one tree are, for `:has` and `:inside`: the parent of
+    each node, and its subtree as the interval of pre-order positions
+    between the node and the end of its subtree. Descendants of a type are
+    found by bisecting the sorted positions of the nodes of that type
+    instead of walking the subtree.
+
+    Like `Memo`, it has to be `load`ed with each tree and `clear`ed before
+    the tree goes away. Nodes that aren't part of the loaded tree have no
+    known ancestors, and their descendants are found by walking them. The
+    parser shares expression contexts and operators between nodes; those
+    count as being where they first occur.
+    """
+
+    def __init__(self) -> None:
+        self.nodes: List[ast.AST] = []
+        self._parents: List[int] = []
+        self._ends: List[int] = []
+        self._positions: Optional[Dict[int, int]] = None
+        self._by_type: Optional[Dict[type, List[int]]] = None
+        self._buckets: Dict[Tuple[type, ...], Optional[List[List[int]]]] = {}
+
+    def load(self, nodes: List[ast.AST], parents: List[int], ends: List[int]) -> None:
+        """
+        Index a tree from its nodes in pre-order, the position of each
+        node's parent and the position just past the end of each node's
+        subtree (see `NodeClassIndex.summarize`).
+        """
+        self.clear()
+        self.nodes = nodes
+        self._parents = parents
+        self._ends = ends
+
+    def load_tree(self, tree: ast.AST) -> None:
+        nodes, parents = preorder(tree)
+        ends = list(range(1, len(nodes) + 1))
+        for index in range(len(nodes) - 1, 0, -1):
+            parent = parents[index]
+            if ends[index] > ends[parent]:
+                ends[parent] = ends[index]
+        self.load(nodes, parents, ends)
+
+    def clear(self) -> None:
+        self.nodes = []
+        self._parents = []
+        self._ends = []
+        self._positions = None
+        self._by_type = None
+        self._buckets.clear()
+
+    def _position(self, node: object) -> Optional[int]:
+        # Most scans never ask, so positions are only worked out on demand
+        if self._positions is None:
+            nodes = self.nodes
+            self._positions = {id(nodes[i]): i for i in range(len(nodes) - 1, -1, -1)}
+        position = self._positions.get(id(node))
+        if position is None or self.nodes[position] is not node:
+            return None
+        return position
+
+    def _buckets_for(self, types: Tuple[type, ...]) -> Optional[List[List[int]]]:
+        """
+        Sorted positions of the nodes of each loaded node type that is one
+        of `types`, or `None` if `types` can't be told from the node types.
+        """
+        if types in self._buckets:
+            return self._buckets[types]
+
+        if self._by_type is None:
+            self._by_type = {}
+            for position, node in enumerate(self.nodes):
+                self._by_type.setdefault(type(node), []).append(position)
+
+        buckets: Optional[List[List[int]]]
+        if any(type(cls) is not type for cls in types):
+            # The deprecated `Num`, `Str` & co. fake their isinstance checks
+            buckets = None
+        else:
+            buckets = [
+                positions
+                for node_type, positions in self._by_type.items()
+                if issubclass(node_type, types)
+            ]
+        self._buckets[types] = buckets
+        return buckets
+
+    def descendants(
+        self, node: ast.AST, types: Optional[Tuple[type, ...]] = None
+    ) -> List[ast.AST]:
+        """
+        All nodes below `node` in pre-order, or only those that are an
+        instance of one of `types`.
+        """
+        position = self._position(node)
+        if position is None:
+            below, _ = preorder(node)
+            return [
+                other
+                for other in below[1:]
+                if types is None or isinstance(other, types)
+            ]
+
+        start = position + 1
+        end = self._ends[position]
+        buckets = None if types is None else self._buckets_for(types)
+        if buckets is None:
+            below = self.nodes[start:end]
+            if types is None:
+                return below
+            return [other for other in below if isinstance(other, types)]
+
+        found: List[int] = []
+        for bucket in buckets:
+            found.extend(bucket[bisect_left(bucket, start) : bisect_left(bucket, end)])
+        if len(buckets) > 1:
+            found.sort()
+        nodes = self.nodes
+        return [nodes[i] for i in found]
+
+    def ancestors(self, node: ast.AST) -> Iterator[ast.AST]:
+        """
+        The nodes above `node`, nearest first.
+        """
+        position = self._position(node)
+        if position is None:
+            return
+        nodes = self.nodes
+        parents = self._parents
+        parent = parents[position]
+        while parent >= 0:
+            yield nodes[parent]
+            parent = parents[parent]
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import ast
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ast_rule_engine.analysis import Requirement, RootTypes
+from ast_rule_engine.traverse import preorder
+
+
+# Node types that aren't known up front all share this bit, which is part
+# of every mask, so they can never cause a node to be skipped.
+_OTHER = 1
+
+
+def _node_classes() -> List[type]:
+    classes: List[type] = []
+    stack = [ast.AST]
+    while stack:
+        cls = stack.pop()
+        classes.append(cls)
+        stack.extend(cls.__subclasses__())
+    return sorted(set(classes), key=lambda cls: (cls.__module__, cls.__qualname__))
+
+
+class NodeClassIndex:
+    """
+    Gives every `ast` node class a bit, so that the classes occurring in a
+    subtree can be summarized in a single int.
+    """
+
+    def __init__(self) -> None:
+        self._bits: Dict[type, int] = {
+            cls: 1 << i for i, cls in enumerate(_node_classes(), start=1)
+        }
+        self.everything = _OTHER
+        for bit in self._bits.values():
+            self.everything |= bit
+        self._masks: Dict[type, int] = {}
+
+    def bit(self, node_type: type) -> int:
+        return self._bits.get(node_type, _OTHER)
+
+    def mask(self, classes: Iterable[type]) -> int:
+        """
+        Bits of all node types that are one of `classes` or a subclass.
+        """
+        result = _OTHER
+        for cls in classes:
+            if cls not in self._masks:
+                self._masks[cls] = self._mask_of(cls)
+            result |= self._masks[cls]
+        return result
+
+    def _mask_of(self, cls: type) -> int:
+        if type(cls) is not type:
+            # The deprecated `Num`, `Str` & co. fake their isinstance checks
+            return self.everything
+        result = 0
+        for node_type, bit in self._bits.items():
+            if issubclass(node_type, cls):
+                result |= bit
+        return result
+
+    def clauses(self, requirement: Requirement) -> Tuple[int, ...]:
+        """
+        The requirement as masks; a subtree summary satisfies it if it
+        overlaps with all of them.
+        """
+        return tuple(
+            sorted(self.mask(clause) if clause else 0 for clause in requirement)
+        )
+
+    def root_mask(self, types: RootTypes) -> Optional[int]:
+        return None if types is None else self.mask(types)
+
+    def summarize(
+        self, tree: ast.AST
+    ) -> Tuple[List[ast.AST], List[int], List[int], List[int]]:
+        """
+        All nodes of `tree` in pre-order, together with the index of each
+        node's parent, the summary of the node classes in each node's
+        subtree and the index just past the end of that subtree.
+        """
+        nodes, parents = preorder(tree)
+        bits = self._bits
+        masks = [bits.get(type(node), _OTHER) for node in nodes]
+        ends = list(range(1, len(nodes) + 1))
+
+        # Children come after their parents, so going backwards every
+        # subtree is complete by the time it's added to its parent
+        for index in range(len(nodes) - 1, 0, -1):
+            parent = parents[index]
+            masks[parent] |= masks[index]
+            if ends[index] > ends[parent]:
+                ends[parent] = ends[index]
+
+        return nodes, parents, masks, ends
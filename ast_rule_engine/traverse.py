@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import ast
+from typing import Dict, List, Tuple
+
+from ast_rule_engine.patch_const import NEEDS_REWRITE, to_constant
+
+
+# Fields of each node type, last one first
+_reversed_fields: Dict[type, Tuple[str, ...]] = {}
+
+
+def _rewrite_children(node: ast.AST, fields: Tuple[str, ...]) -> None:
+    for field in fields:
+        value = getattr(node, field, None)
+        if isinstance(value, ast.AST):
+            setattr(node, field, to_constant(value))
+        elif isinstance(value, list):
+            value[:] = [
+                to_constant(item) if isinstance(item, ast.AST) else item
+                for item in value
+            ]
+
+
+def preorder(tree: ast.AST) -> Tuple[List[ast.AST], List[int]]:
+    """
+    All nodes of `tree` in the order `ast.NodeVisitor` would visit them,
+    and the index of each node's parent (-1 for `tree`). Uses an explicit
+    stack, so deeply nested trees don't hit the recursion limit. On old
+    Pythons, deprecated constant nodes are replaced with `Constant` on the
+    way.
+    """
+    nodes: List[ast.AST] = []
+    parents: List[int] = []
+    stack: List[Tuple[ast.AST, int]] = [(tree, -1)]
+    push = stack.append
+    AST = ast.AST
+
+    while stack:
+        node, parent = stack.pop()
+        index = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+
+        node_type = type(node)
+        try:
+            fields = _reversed_fields[node_type]
+        except KeyError:
+            fields = _reversed_fields[node_type] = tuple(reversed(node_type._fields))
+
+        if NEEDS_REWRITE:
+            _rewrite_children(node, fields)
+
+        for field in fields:
+            value = getattr(node, field, None)
+            if isinstance(value, AST):
+                push((value, index))
+            elif isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, AST):
+                        push((item, index))
+
+    return nodes, parents
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ast_rule_engine.compile import LeftRecursionError
+from ast_rule_engine.scan import FileTimeout, MatchRecord, Scanner
+
+
+FileState = Tuple[int, int]
+
+
+def file_state(path: Path) -> Optional[FileState]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Watcher:
+    """
+    Keeps the results of the last scan in memory and, on `refresh`, only
+    re-scans the files whose modification time or size changed. Results for
+    files that went away are dropped, and a change to the spec reloads the
+    scanner and re-scans everything. Files that fail to scan keep their old
+    results and are retried on every refresh; each failure is reported
+    once per version of the file.
+    """
+
+    def __init__(
+        self,
+        load_scanner: Callable[[], Scanner],
+        find_paths: Callable[[], Iterable[Path]],
+        spec_path: Path,
+        on_error: Callable[[Path, Exception], None],
+    ) -> None:
+        self._load_scanner = load_scanner
+        self._find_paths = find_paths
+        self._spec_path = spec_path
+        self._on_error = on_error
+        self._spec_state: Optional[FileState] = None
+        self._states: Dict[Path, FileState] = {}
+        self._failed: Dict[Path, FileState] = {}
+        self.scanner: Optional[Scanner] = None
+        self.results: Dict[Path, List[MatchRecord]] = {}
+
+    def refresh(self) -> Tuple[List[MatchRecord], List[MatchRecord]]:
+        """
+        Matches that appeared and disappeared since the last refresh. The
+        first refresh is a full scan.
+        """
+        spec_state = file_state(self._spec_path)
+        if self.scanner is None or spec_state != self._spec_state:
+            self._spec_state = spec_state
+            self.scanner = self._load_scanner()
+            self._states.clear()
+            self._failed.clear()
+
+        added: List[MatchRecord] = []
+        removed: List[MatchRecord] = []
+        seen: Set[Path] = set()
+        for path in self._find_paths():
+            seen.add(path)
+            state = file_state(path)
+            if state is None or self._states.get(path) == state:
+                continue
+
+            old = self.results.get(path, [])
+            try:
+                new = self.scanner.scan_file(path)
+            except (
+                OSError,
+                SyntaxError,
+                ValueError,
+                FileTimeout,
+                LeftRecursionError,
+            ) as e:
+                # Half-edited files keep their old results until they parse,
+                # and files replaced while being read until they can be read
+                if self._failed.get(path) != state:
+                    self._failed[path] = state
+                    self._on_error(path, e)
+                continue
+            self._failed.pop(path, None)
+            self._states[path] = state
+            self.results[path] = new
+
+            old_set = set(old)
+            new_set = set(new)
+            added.extend(record for record in new if record not in old_set)
+            removed.extend(record for record in old if record not in new_set)
+
+        for path in list(self.results):
+            if path not in seen:
+                removed.extend(self.results.pop(path))
+                self._states.pop(path, None)
+        for path in list(self._failed):
+            if path not in seen:
+                del self._failed[path]
+
+        return added, removed
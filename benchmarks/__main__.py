@@ -0,0 +1,135 @@
+import argparse
+from pathlib import Path
+import sys
+import tempfile
+
+from ast_rule_engine.spec_cache import load_patterns
+from benchmarks.corpus import SHAPES, generate_corpus
+from benchmarks.runner import (
+    best_of,
+    find_regressions,
+    format_table,
+    load_baseline,
+    measure_startup,
+    run_phases,
+    save_baseline,
+)
+
+
+_DEFAULT_SPEC = Path(__file__).parent / "specs" / "rule-kinds.yaml"
+
+
+parser = argparse.ArgumentParser("benchmarks")
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+generate_parser = subparsers.add_parser("generate", help="Write a synthetic corpus")
+generate_parser.add_argument("out", type=Path, help="Directory to write the corpus to")
+
+run_parser = subparsers.add_parser("run", help="Benchmark the engine")
+run_parser.add_argument(
+    "--corpus",
+    type=Path,
+    default=None,
+    help="Benchmark the `.py` files in this directory instead of generated ones",
+)
+run_parser.add_argument(
+    "--spec", type=Path, default=_DEFAULT_SPEC, help="YAML spec to match with"
+)
+run_parser.add_argument(
+    "--repeat", type=int, default=3, help="Report the best of this many runs"
+)
+run_parser.add_argument(
+    "--startup-budget",
+    type=float,
+    default=0.5,
+    help="Fail if starting the CLI with a warm spec cache takes longer (seconds)",
+)
+run_parser.add_argument(
+    "--save-baseline", type=Path, default=None, help="Write the results as JSON"
+)
+run_parser.add_argument(
+    "--baseline",
+    type=Path,
+    default=None,
+    help="Fail if the results are worse than this baseline",
+)
+run_parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=0.15,
+    help="Allowed slowdown relative to the baseline, as a fraction",
+)
+
+for subparser in (generate_parser, run_parser):
+    subparser.add_argument(
+        "--shape",
+        action="append",
+        choices=sorted(SHAPES),
+        help="Corpus shape (can be repeated, all shapes by default)",
+    )
+    subparser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier for the number of files"
+    )
+    subparser.add_argument("--seed", type=int, default=0)
+
+
+def main() -> int:
+    args = parser.parse_args()
+    shapes = args.shape or sorted(SHAPES)
+
+    if args.command == "generate":
+        for shape in shapes:
+            paths = generate_corpus(args.out, shape, args.scale, args.seed)
+            print("{0}: {1} files".format(shape, len(paths)))
+        return 0
+
+    _, patterns = load_patterns(args.spec, {}.__getitem__)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus is not None:
+            corpora = {str(args.corpus): sorted(args.corpus.glob("**/*.py"))}
+        else:
+            corpora = {
+                shape: generate_corpus(Path(tmp), shape, args.scale, args.seed)
+                for shape in shapes
+            }
+
+        for name, paths in corpora.items():
+            runs = [run_phases(paths, patterns) for _ in range(args.repeat)]
+            results[name] = best_of(runs)
+
+    print(format_table(results))
+
+    startup = measure_startup(args.spec, args.repeat)
+    print(
+        "Startup: {0:.3f}s cold, {1:.3f}s with a warm spec cache".format(
+            startup["cold"], startup["warm"]
+        )
+    )
+    over_budget = startup["warm"] > args.startup_budget
+    if over_budget:
+        print(
+            "Startup takes {0:.3f}s, budget {1:.3f}s".format(
+                startup["warm"], args.startup_budget
+            ),
+            file=sys.stderr,
+        )
+
+    if args.save_baseline is not None:
+        save_baseline(args.save_baseline, results)
+
+    if args.baseline is not None:
+        regressions = find_regressions(
+            results, load_baseline(args.baseline), args.tolerance
+        )
+        for regression in regressions:
+            print("Regression: {0}".format(regression), file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Deterministic generator of synthetic Python code to benchmark against.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import random
+from typing import Callable, Dict, List
+
+
+@dataclass(frozen=True)
+class CorpusShape:
+    files: int
+    statements: int
+    depth: int
+
+
+SHAPES: Dict[str, CorpusShape] = {
+    "many-small": CorpusShape(files=400, statements=20, depth=3),
+    "few-huge": CorpusShape(files=3, statements=4000, depth=3),
+    "deep-expressions": CorpusShape(files=20, statements=30, depth=60),
+    "assert-heavy": CorpusShape(files=100, statements=60, depth=4),
+}
+
+_NAMES = ["foo", "bar", "baz", "spam", "eggs", "x", "y", "items", "self"]
+_BUILTINS = ["len", "str", "sorted", "abs", "max", "repr", "int", "tuple"]
+_OPS = ["+", "-", "*", "%", "//"]
+_CMP_OPS = ["==", "!=", "<", ">=", "in", "is not"]
+
+
+def _constant(rng: random.Random) -> str:
+    return rng.choice(
+        [
+            str(rng.randint(0, 100)),
+            repr(rng.choice(_NAMES)),
+            "True",
+            "None",
+            "...",
+            '""',
+            "0",
+        ]
+    )
+
+
+def _expression(rng: random.Random, depth: int) -> str:
+    if depth <= 0:
+        return rng.choice([_constant(rng), rng.choice(_NAMES)])
+
+    kind = rng.randrange(8)
+    sub = depth - 1
+    if kind == 0:
+        return "({0} {1} {2})".format(
+            _expression(rng, sub), rng.choice(_OPS), _expression(rng, sub)
+        )
+    elif kind == 1:
+        return "{0}({1})".format(
+            rng.choice(_BUILTINS),
+            ", ".join(_expression(rng, sub) for _ in range(rng.randint(0, 2))),
+        )
+    elif kind == 2:
+        return "({0} if {1} else {2})".format(
+            _expression(rng, sub), _expression(rng, sub), _expression(rng, sub)
+        )
+    elif kind == 3:
+        return "[{0}]".format(
+            ", ".join(_expression(rng, sub) for _ in range(rng.randint(0, 3)))
+        )
+    elif kind == 4:
+        return "{0} {1} {2}".format(
+            _expression(rng, sub), rng.choice(_CMP_OPS), _expression(rng, sub)
+        )
+    elif kind == 5:
+        return "{0!r}.format({1})".format(
+            "{0} " + rng.choice(_NAMES), _expression(rng, sub)
+        )
+    elif kind == 6:
+        return 'f"{{{0}}}"'.format(rng.choice(_NAMES))
+    else:
+        return "{0}.{1}".format(rng.choice(_NAMES), rng.choice(_NAMES))
+
+
+def _deep_expression(rng: random.Random, depth: int) -> str:
+    expr = _constant(rng)
+    for _ in range(depth):
+        expr = rng.choice(
+            [
+                "({0} + {1})".format(expr, _constant(rng)),
+                "({0} if {1} else {2})".format(_constant(rng), expr, _constant(rng)),
+                "abs({0})".format(expr),
+            ]
+        )
+    return expr
+
+
+def _statement(rng: random.Random, depth: int, asserts: float) -> str:
+    if rng.random() < asserts:
+        return "assert {0}".format(_expression(rng, depth))
+
+    kind = rng.randrange(4)
+    if kind == 0:
+        return "{0} = {1}".format(rng.choice(_NAMES), _expression(rng, depth))
+    elif kind == 1:
+        return "{0}.append({1})".format(rng.choice(_NAMES), _expression(rng, depth))
+    elif kind == 2:
+        return "if {0}:\n        {1} = {2}".format(
+            _expression(rng, depth), rng.choice(_NAMES), _expression(rng, depth)
+        )
+    else:
+        return "for {0} in {1}:\n        print({2})".format(
+            rng.choice(_NAMES), _expression(rng, depth), _expression(rng, depth)
+        )
+
+
+def _module(rng: random.Random, shape: CorpusShape, name: str) -> str:
+    asserts = 0.8 if name == "assert-heavy" else 0.1
+    statement: Callable[[], str]
+    if name == "deep-expressions":
+        statement = lambda: "x = {0}".format(  # noqa: E731
+            _deep_expression(rng, shape.depth)
+        )
+    else:
+        statement = lambda: _statement(rng, shape.depth, asserts)  # noqa: E731
+
+    lines: List[str] = []
+    per_function = 20
+    for i in range(0, shape.statements, per_function):
+        lines.append("def test_{0}(foo, bar):".format(i))
+        for _ in range(min(per_function, shape.statements - i)):
+            lines.append("    " + statement())
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(
+    out_dir: Path,
+    shape_name: str,
+    scale: float = 1.0,
+    seed: int = 0,
+) -> List[Path]:
+    """
+    Write a corpus of the given shape into `out_dir`. The same arguments
+    always produce byte-identical files.
+    """
+    base = SHAPES[shape_name]
+    shape = CorpusShape(
+        files=max(1, int(base.files * scale)),
+        statements=base.statements,
+        depth=base.depth,
+    )
+    rng = random.Random("{0}:{1}".format(shape_name, seed))
+
+    paths: List[Path] = []
+    for i in range(shape.files):
+        path = out_dir / shape_name / "module_{0:05}.py".format(i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(_module(rng, shape, shape_name), "utf-8")
+        paths.append(path)
+    return paths
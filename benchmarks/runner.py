@@ -0,0 +1,213 @@
+"""
+Times the parse, traverse and match phases of a scan separately.
+"""
+
+from __future__ import annotations
+
+import ast
+from dataclasses import asdict, dataclass
+import json
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from ast_rule_engine.draft import Pattern
+from ast_rule_engine.scan import Scanner, get_all_nodes
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+
+PHASES = ("parse", "traverse", "match")
+
+
+@dataclass(frozen=True)
+class PhaseResult:
+    seconds: float
+    files_per_s: float
+    nodes_per_s: float
+    matches_per_s: float
+    peak_rss_mb: Optional[float]
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _result(
+    seconds: float,
+    files: int,
+    nodes: int,
+    matches: int,
+    rss: Optional[float],
+) -> PhaseResult:
+    seconds = max(seconds, 1e-9)
+    return PhaseResult(
+        seconds=seconds,
+        files_per_s=files / seconds,
+        nodes_per_s=nodes / seconds,
+        matches_per_s=matches / seconds,
+        peak_rss_mb=rss,
+    )
+
+
+def run_phases(
+    paths: Sequence[Path],
+    patterns: Mapping[str, Pattern],
+) -> Dict[str, PhaseResult]:
+    """
+    Run each phase over the whole corpus before starting the next one, so
+    that they can be timed separately. The match phase runs what a scan
+    does after parsing: the token prefilter, the scanner's own traversal
+    with its subtree summaries, and all rules matched together. Peak RSS
+    is that of the whole process at the end of the phase.
+    """
+    scanner = Scanner(patterns)
+
+    start = time.perf_counter()
+    sources = [path.read_bytes() for path in paths]
+    trees = [ast.parse(source.decode("utf-8")) for source in sources]
+    parse_time = time.perf_counter() - start
+    parse_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    node_lists = [get_all_nodes(tree) for tree in trees]
+    traverse_time = time.perf_counter() - start
+    traverse_rss = peak_rss_mb()
+
+    nodes = sum(len(node_list) for node_list in node_lists)
+    prefilter = scanner.prefilter
+    matches = 0
+    start = time.perf_counter()
+    for path, source, tree in zip(paths, sources, trees):
+        if prefilter is not None and not prefilter.might_match(source):
+            continue
+        for _ in scanner.scan_tree(str(path), tree):
+            matches += 1
+    match_time = time.perf_counter() - start
+
+    files = len(paths)
+    return {
+        "parse": _result(parse_time, files, nodes, 0, parse_rss),
+        "traverse": _result(traverse_time, files, nodes, 0, traverse_rss),
+        "match": _result(match_time, files, nodes, matches, peak_rss_mb()),
+    }
+
+
+def measure_startup(spec: Path, repeat: int) -> Dict[str, float]:
+    """
+    Best wall-clock time of running the CLI on an empty directory, both
+    without a spec cache ("cold") and with a warm one ("warm").
+    """
+    times: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        empty = Path(tmp, "empty")
+        empty.mkdir()
+        cold = [sys.executable, "-m", "ast_rule_engine", str(empty)]
+        cold += ["--spec", str(spec)]
+        warm = cold + ["--cache-dir", str(Path(tmp, "cache"))]
+        quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+        # The first warm run fills the cache
+        subprocess.run(warm, check=True, **quiet)
+        for name, args in (("cold", cold), ("warm", warm)):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(args, check=True, **quiet)
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+    return times
+
+
+def best_of(runs: List[Dict[str, PhaseResult]]) -> Dict[str, PhaseResult]:
+    return {
+        phase: min((run[phase] for run in runs), key=lambda result: result.seconds)
+        for phase in PHASES
+    }
+
+
+def format_table(results: Mapping[str, Mapping[str, PhaseResult]]) -> str:
+    lines = [
+        "{0:<20} {1:<9} {2:>10} {3:>12} {4:>14} {5:>14} {6:>10}".format(
+            "corpus", "phase", "seconds", "files/s", "nodes/s", "matches/s", "rss MB"
+        )
+    ]
+    for corpus, phases in results.items():
+        for phase, result in phases.items():
+            lines.append(
+                "{0:<20} {1:<9} {2:>10.3f} {3:>12.1f} {4:>14.1f} {5:>14.1f} {6:>10}".format(
+                    corpus,
+                    phase,
+                    result.seconds,
+                    result.files_per_s,
+                    result.nodes_per_s,
+                    result.matches_per_s,
+                    "-"
+                    if result.peak_rss_mb is None
+                    else "{0:.1f}".format(result.peak_rss_mb),
+                )
+            )
+    return "\n".join(lines)
+
+
+def save_baseline(
+    path: Path,
+    results: Mapping[str, Mapping[str, PhaseResult]],
+) -> None:
+    raw = {
+        corpus: {phase: asdict(result) for phase, result in phases.items()}
+        for corpus, phases in results.items()
+    }
+    path.write_text(json.dumps(raw, indent=2, sort_keys=True) + "\n", "utf-8")
+
+
+def load_baseline(path: Path) -> Dict[str, Dict[str, PhaseResult]]:
+    raw = json.loads(path.read_text("utf-8"))
+    return {
+        corpus: {phase: PhaseResult(**result) for phase, result in phases.items()}
+        for corpus, phases in raw.items()
+    }
+
+
+def find_regressions(
+    results: Mapping[str, Mapping[str, PhaseResult]],
+    baseline: Mapping[str, Mapping[str, PhaseResult]],
+    tolerance: float,
+) -> List[str]:
+    """
+    Compare node throughput and peak RSS against a baseline. A phase
+    regresses when it is more than `tolerance` (a fraction) worse.
+    """
+    regressions: List[str] = []
+    for corpus, phases in results.items():
+        for phase, result in phases.items():
+            old = baseline.get(corpus, {}).get(phase)
+            if old is None:
+                continue
+
+            if result.nodes_per_s < old.nodes_per_s * (1 - tolerance):
+                regressions.append(
+                    "{0}/{1}: {2:.1f} nodes/s, baseline {3:.1f}".format(
+                        corpus, phase, result.nodes_per_s, old.nodes_per_s
+                    )
+                )
+            if (
+                result.peak_rss_mb is not None
+                and old.peak_rss_mb is not None
+                and result.peak_rss_mb > old.peak_rss_mb * (1 + tolerance)
+            ):
+                regressions.append(
+                    "{0}/{1}: peak RSS {2:.1f} MB, baseline {3:.1f} MB".format(
+                        corpus, phase, result.peak_rss_mb, old.peak_rss_mb
+                    )
+                )
+    return regressions
@@ -0,0 +1,5 @@
+from ast_rule_engine.parse import parse
+
+
+def parse_rules(**rules):
+    return parse({"stmt-rules": rules}, {}.__getitem__)
@@ -0,0 +1,75 @@
+import ast
+
+import pytest
+
+from ast_rule_engine.analysis import required_types, root_types
+from ast_rule_engine.dispatch import DispatchTable
+from tests.helpers import parse_rules
+
+
+def test_root_types():
+    patterns = parse_rules(
+        a={"is(Assert)": {"test": "is(Constant)"}},
+        b={":or": ["is(Tuple)", "is(List)", "~a"]},
+        c={":and": ["is(expr)", {":or": ["is(Constant)", "is(Assert)"]}]},
+        d="not(is(Constant))",
+        e={":or": ["is(Constant)", "~e"]},
+        f="=None",
+    )
+
+    assert root_types(patterns["a"]) == {ast.Assert}
+    assert root_types(patterns["b"]) == {ast.Tuple, ast.List, ast.Assert}
+    assert root_types(patterns["c"]) == {ast.Constant}
+    assert root_types(patterns["d"]) is None
+    assert root_types(patterns["e"]) is None
+    assert root_types(patterns["f"]) == frozenset()
+
+
+def test_dispatch_table_follows_subclasses():
+    table = DispatchTable({"a": frozenset([ast.expr]), "b": None, "c": frozenset()})
+
+    assert table.rules_for(ast.Constant) == ("a", "b")
+    assert table.rules_for(ast.Assert) == ("b",)
+
+
+@pytest.mark.skipif(not hasattr(ast, "Str"), reason="No deprecated node classes")
+def test_dispatch_table_keeps_deprecated_node_classes():
+    patterns = parse_rules(a="is(Str)", b={":or": ["is(Num)", "is(Name)"]})
+    table = DispatchTable({name: root_types(p) for name, p in patterns.items()})
+    node = ast.parse("'a'").body[0].value
+
+    # `Constant` isn't a subclass of `Str`, but an instance of it
+    assert table.rules_for(type(node)) == ("a", "b")
+    assert patterns["a"].match(node) == {}
+
+
+def test_required_types():
+    patterns = parse_rules(
+        a={"is(Assert)": {"test": {"is(Call)": {"func": "is(Name)"}}}},
+        b={":or": [{"is(Return)": {"value": "is(Call)"}}, "is(Yield)"]},
+        c={"is(FunctionDef)": {"body": {":forall": "is(Pass)"}}},
+        d={"is(FunctionDef)": {"body": {":exists": "~b"}}},
+        e="is(NoSuchNode)",
+        f={":and": ["is(For)", {":has": {"is(Await)": {"value": "is(Call)"}}}]},
+        g={":and": ["is(Await)", {":inside": "is(For)"}]},
+    )
+
+    assert required_types(patterns["a"]) == {
+        frozenset([ast.Assert]),
+        frozenset([ast.Call]),
+        frozenset([ast.Name]),
+    }
+    assert required_types(patterns["b"]) == {frozenset([ast.Call, ast.Yield])}
+    assert required_types(patterns["c"]) == {frozenset([ast.FunctionDef])}
+    assert required_types(patterns["d"]) == {
+        frozenset([ast.FunctionDef]),
+        frozenset([ast.Call, ast.Yield]),
+    }
+    assert required_types(patterns["e"]) == {frozenset()}
+    assert required_types(patterns["f"]) == {
+        frozenset([ast.For]),
+        frozenset([ast.Await]),
+        frozenset([ast.Call]),
+    }
+    # The loop is outside of the subtree
+    assert required_types(patterns["g"]) == {frozenset([ast.Await])}
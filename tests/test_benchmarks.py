@@ -0,0 +1,53 @@
+import ast
+import importlib
+
+import pytest
+
+from ast_rule_engine.parse import parse
+from benchmarks.corpus import SHAPES, generate_corpus
+from benchmarks.runner import PhaseResult, find_regressions, run_phases
+
+
+def test_corpus_is_deterministic(tmp_path):
+    for shape in SHAPES:
+        first = generate_corpus(tmp_path / "a", shape, scale=0.01)
+        second = generate_corpus(tmp_path / "b", shape, scale=0.01)
+        assert [p.read_bytes() for p in first] == [p.read_bytes() for p in second]
+        for path in first:
+            ast.parse(path.read_text("utf-8"))
+
+
+def test_find_regressions():
+    def result(nodes_per_s, rss):
+        return PhaseResult(1.0, 1.0, nodes_per_s, 0.0, rss)
+
+    baseline = {"corpus": {"match": result(1000.0, 100.0)}}
+
+    fine = {"corpus": {"match": result(900.0, 105.0)}}
+    worse = {"corpus": {"match": result(800.0, 200.0)}}
+
+    assert find_regressions(fine, baseline, 0.15) == []
+    assert len(find_regressions(worse, baseline, 0.15)) == 2
+
+
+def test_match_phase_runs_the_scanner(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("for x in y:\n    f(x)\n", "utf-8")
+    patterns = parse(
+        {
+            "stmt-rules": {
+                "Call-In-Loop": {":and": ["is(Call)", {":inside": "is(For)"}]}
+            }
+        },
+        {}.__getitem__,
+    )
+
+    results = run_phases([path], patterns)
+
+    match = results["match"]
+    assert match.matches_per_s * match.seconds == pytest.approx(1)
+
+
+def test_importing_the_cli_does_not_run_it():
+    module = importlib.import_module("benchmarks.__main__")
+    assert module.parser.prog == "benchmarks"
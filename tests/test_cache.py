@@ -0,0 +1,61 @@
+import os
+
+from ast_rule_engine.cache import ResultCache, spec_hash
+from ast_rule_engine.scan import MatchRecord
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(tmp_path, spec_hash({"stmt-rules": {}}, []), 1 << 20)
+    record = MatchRecord("rule", "a.py", 3, 4, "Call", (("x", "foo()"),))
+
+    key = cache.key(b"foo()")
+    assert cache.get(key, "a.py") is None
+    cache.put(key, [record])
+
+    assert cache.get(key, "b.py") == [
+        MatchRecord("rule", "b.py", 3, 4, "Call", (("x", "foo()"),))
+    ]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_spec(tmp_path):
+    a = ResultCache(tmp_path, spec_hash({"stmt-rules": {"a": "is(Pass)"}}, ["a"]), 1)
+    b = ResultCache(tmp_path, spec_hash({"stmt-rules": {"a": "is(Del)"}}, ["a"]), 1)
+    assert a.key(b"pass") != b.key(b"pass")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path, "spec", 0)
+    record = MatchRecord("rule", "a.py", 1, 0, "Pass", ())
+    for i, data in enumerate([b"old", b"new"]):
+        key = cache.key(data)
+        cache.put(key, [record] * 10)
+        os.utime(cache._entry_path(key), (i, i))
+
+    size = cache._entry_path(cache.key(b"new")).stat().st_size
+    cache.max_bytes = size
+
+    assert cache.evict() == 1
+    assert cache.get(cache.key(b"old"), "a.py") is None
+    assert cache.get(cache.key(b"new"), "a.py") == [record] * 10
+
+
+def test_eviction_counts_specs_and_temporary_files(tmp_path):
+    cache = ResultCache(tmp_path, "spec", 0)
+    key = cache.key(b"pass")
+    cache.put(key, [MatchRecord("rule", "a.py", 1, 0, "Pass", ())])
+    os.utime(cache._entry_path(key), (3, 3))
+    specs = tmp_path / "specs"
+    specs.mkdir()
+    (specs / "old.pickle").write_bytes(b"x" * 100)
+    os.utime(specs / "old.pickle", (2, 2))
+    (specs / "orphan.tmp").write_bytes(b"x" * 100)
+    os.utime(specs / "orphan.tmp", (1, 1))
+    (specs / "writing.tmp").write_bytes(b"x" * 100)
+
+    cache.max_bytes = cache._entry_path(key).stat().st_size + 100
+
+    # Only the file that is still being written is spared
+    assert cache.evict() == 2
+    assert sorted(path.name for path in specs.iterdir()) == ["writing.tmp"]
+    assert cache.get(key, "a.py") is not None
@@ -0,0 +1,123 @@
+import subprocess
+
+from ast_rule_engine.changes import (
+    changed_files,
+    in_changed_lines,
+    parse_diff,
+    parse_name_status,
+)
+from ast_rule_engine.scan import MatchRecord
+
+
+DIFF = """\
+diff --git a/a.py b/a.py
+--- a/a.py
++++ b/a.py
+@@ -2,0 +3,2 @@ def f():
++    x = 1
++    y = 2
+@@ -10 +12 @@ def g():
+-    pass
++    return 1
+@@ -20,3 +22,0 @@
+-    a
+-    b
+-    c
+diff --git a/gone.py b/gone.py
+deleted file mode 100644
+--- a/gone.py
++++ /dev/null
+@@ -1 +0,0 @@
+-x = 1
+diff --git "a/sp\\303\\244ce.py" "b/sp\\303\\244ce.py"
+--- "a/sp\\303\\244ce.py"
++++ "b/sp\\303\\244ce.py"
+@@ -1 +1 @@
+-x = 1
++x = 2
+"""
+
+
+def test_parse_diff():
+    assert parse_diff(DIFF) == {
+        "a.py": [(3, 4), (12, 12)],
+        "späce.py": [(1, 1)],
+    }
+
+
+def _git(cwd, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t"] + list(args),
+        cwd=str(cwd),
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def test_parse_name_status():
+    output = "M\0a.py\0R100\0old.py\0new.py\0A\0sp\u00e4ce.py\0"
+    assert parse_name_status(output) == ["a.py", "new.py", "späce.py"]
+
+
+def test_changed_files(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "kept.py").write_text("a = 1\n")
+    (tmp_path / "edited.py").write_text("a = 1\nb = 2\nc = 3\n")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+
+    (tmp_path / "edited.py").write_text("a = 1\nb = 20\nc = 3\n")
+    (tmp_path / "new.py").write_text("d = 4\n")
+    (tmp_path / "staged.py").write_text("e = 5\n")
+    _git(tmp_path, "add", "staged.py")
+
+    root = tmp_path.resolve()
+    changes = changed_files(tmp_path, "HEAD")
+    assert changes == {
+        root / "edited.py": [(2, 2)],
+        root / "new.py": None,
+        root / "staged.py": [(1, 1)],
+    }
+    assert changed_files(tmp_path, staged=True) == {root / "staged.py": [(1, 1)]}
+
+    records = [
+        MatchRecord("r", str(tmp_path / "edited.py"), line, 0, "Assign", ())
+        for line in (1, 2, 3)
+    ] + [MatchRecord("r", str(tmp_path / "new.py"), 1, 0, "Assign", ())]
+    assert [(r.path, r.line) for r in in_changed_lines(records, changes)] == [
+        (str(tmp_path / "edited.py"), 2),
+        (str(tmp_path / "new.py"), 1),
+    ]
+
+
+def test_changed_files_include_renames(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("b = 1\n")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+
+    _git(tmp_path, "mv", "a.py", "c.py")
+    root = tmp_path.resolve()
+    assert changed_files(tmp_path, staged=True) == {root / "c.py": []}
+    assert changed_files(tmp_path, "HEAD") == {root / "c.py": []}
+
+
+def test_changed_files_ignore_diff_prefix_and_relative_config(tmp_path):
+    _git(tmp_path, "init", "-q")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("a = 1\nb = 2\n")
+    (tmp_path / "top.py").write_text("c = 3\n")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "init")
+    _git(tmp_path, "config", "diff.noprefix", "true")
+    _git(tmp_path, "config", "diff.relative", "true")
+
+    (tmp_path / "pkg" / "a.py").write_text("a = 1\nb = 20\n")
+    (tmp_path / "top.py").write_text("c = 30\n")
+    _git(tmp_path, "add", "top.py")
+
+    root = tmp_path.resolve()
+    expected = {root / "pkg" / "a.py": [(2, 2)], root / "top.py": [(1, 1)]}
+    assert changed_files(tmp_path / "pkg", "HEAD") == expected
+    assert changed_files(tmp_path / "pkg", staged=True) == {root / "top.py": [(1, 1)]}
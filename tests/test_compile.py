@@ -0,0 +1,188 @@
+import ast
+from pathlib import Path
+
+import pytest
+import yaml
+
+from ast_rule_engine.compile import (
+    LeftRecursionError,
+    Memo,
+    RuleCompiler,
+    compile_patterns,
+    compile_rules,
+)
+from ast_rule_engine.draft import RefRule, VarRule
+from ast_rule_engine.parse import parse
+from ast_rule_engine.patch_const import LegacyConstantRewriter
+from ast_rule_engine.structure import TreeIndex
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def _all_nodes():
+    for path in sorted((ROOT / "samples").glob("*.py")):
+        tree = ast.parse(path.read_text("utf-8"))
+        LegacyConstantRewriter().visit(tree)
+        yield from ast.walk(tree)
+
+
+def test_compiled_matches_interpreter():
+    spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    patterns = parse(spec, {}.__getitem__)
+    matchers = compile_patterns(patterns)
+
+    for node in _all_nodes():
+        for name, pattern in patterns.items():
+            assert matchers[name](node) == pattern.match(node), name
+
+
+def test_captures():
+    patterns = parse(
+        yaml.safe_load(
+            r"""
+stmt-rules:
+  call:
+    is(Call):
+      func: $func
+      args:
+        =: [$arg]
+"""
+        ),
+        {}.__getitem__,
+    )
+    node = ast.parse("f(x)").body[0].value
+    assert compile_patterns(patterns)["call"](node) == {
+        "func": node.func,
+        "arg": node.args[0],
+    }
+
+
+def test_unknown_ref_fails_lazily():
+    spec = {"stmt-rules": {"a": {":or": ["is(Pass)", "~b"]}}}
+    patterns = parse(spec, {}.__getitem__)
+    matcher = compile_patterns(patterns)["a"]
+    assert matcher(ast.Pass()) == {}
+
+
+def test_unknown_capturing_ref_fails_lazily():
+    defined = {}
+    capture = RuleCompiler()._capture_ref(RefRule("later", defined.__getitem__))
+    node = ast.Pass()
+    with pytest.raises(KeyError):
+        capture(node)
+
+    defined["later"] = VarRule("x")
+    assert capture(node) == {"x": node}
+
+
+CAPTURING = r"""
+stmt-rules:
+  name-or-call:
+    :or:
+      - is(Name):
+          id: $name
+      - is(Call):
+          func: ~name-or-call
+          args:
+            :exists:
+              :and: [is(Constant), $const]
+      - :and:
+          - not(is(Call))
+          - is(Attribute):
+              value: ~name-or-call
+              attr: $attr
+"""
+
+
+def test_fast_rules_agree_with_interpreter():
+    spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    spec["stmt-rules"].update(yaml.safe_load(CAPTURING)["stmt-rules"])
+    patterns = parse(spec, {}.__getitem__)
+    rules = compile_rules(patterns)
+
+    assert rules["ULA001"].capture is None
+    assert rules["name-or-call"].capture is not None
+
+    extra = ast.parse("a.b(1, 2).c\nf(g, 'x')")
+    for node in [*_all_nodes(), *ast.walk(extra)]:
+        for name, pattern in patterns.items():
+            expected = pattern.match(node)
+            expected = None if isinstance(expected, str) else expected
+            assert rules[name].match(node) == expected, name
+            assert rules[name].test(node) == (expected is not None), name
+
+
+def test_memo_agrees_with_interpreter():
+    spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    patterns = parse(spec, {}.__getitem__)
+    memo = Memo()
+    rules = compile_rules(patterns, memo)
+
+    for node in _all_nodes():
+        expected = not isinstance(patterns["const-computation"].match(node), str)
+        assert rules["const-computation"].test(node) == expected
+    memo.clear()
+
+
+def test_left_recursion_is_reported():
+    spec = {"stmt-rules": {"loop": {":or": ["is(Pass)", "~loop"]}}}
+    rules = compile_rules(parse(spec, {}.__getitem__), Memo())
+
+    assert rules["loop"].test(ast.Pass())
+    with pytest.raises(LeftRecursionError) as info:
+        rules["loop"].test(ast.Break())
+    assert info.value.rule == "loop"
+
+
+def test_left_recursion_is_reported_when_the_memo_is_full():
+    spec = {
+        "stmt-rules": {
+            "loop": {
+                ":or": [
+                    {"is(Expr)": {"value": "~loop"}},
+                    {":and": ["is(Expr)", "~loop"]},
+                ]
+            }
+        }
+    }
+    rules = compile_rules(parse(spec, {}.__getitem__), Memo(max_size=1))
+
+    with pytest.raises(LeftRecursionError):
+        rules["loop"].test(ast.parse("1").body[0])
+
+
+def test_fast_path_reads_raw_attributes(monkeypatch):
+    spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    rules = compile_rules(parse(spec, {}.__getitem__))
+
+    def no_terms(obj):
+        raise AssertionError("to_term({0!r}) called".format(obj))
+
+    monkeypatch.setattr("ast_rule_engine.compile.to_term", no_terms)
+    assert [
+        name for name, rule in rules.items() if rule.test(ast.parse("assert 1").body[0])
+    ] == ["ULA001"]
+
+
+def test_has_and_inside_need_the_tree_only_for_ancestors():
+    patterns = parse(
+        {
+            "stmt-rules": {
+                "has": {":has": {"is(Name)": {"id": "$name"}}},
+                "inside": {":inside": "is(Call)"},
+            }
+        },
+        {}.__getitem__,
+    )
+    tree = ast.parse("f(x)\n")
+    call = tree.body[0].value
+    trees = TreeIndex()
+    trees.load_tree(tree)
+    matchers = compile_patterns(patterns, trees)
+
+    for node in ast.walk(tree):
+        assert matchers["has"](node) == patterns["has"].match(node)
+    assert matchers["inside"](call.args[0]) == {}
+    assert isinstance(matchers["inside"](call), str)
+    assert isinstance(patterns["inside"].match(call.args[0]), str)
@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from ast_rule_engine import client
+from ast_rule_engine.daemon import Daemon
+
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    path = str(tmp_path / "daemon.sock")
+    daemon = Daemon()
+    thread = threading.Thread(target=daemon.serve, args=(path, 2))
+    thread.start()
+    while not os.path.exists(path):
+        time.sleep(0.01)
+    yield path
+    client.request(path, {"command": "shutdown"})
+    thread.join()
+
+
+def test_scan_requests(socket_path):
+    spec = str(ROOT / "draft.yaml")
+    paths = [str(path) for path in sorted((ROOT / "samples").glob("*.py"))]
+
+    response = client.request(
+        socket_path, {"command": "scan", "spec": spec, "paths": paths}
+    )
+    again = client.request(
+        socket_path, {"command": "scan", "spec": spec, "paths": paths}
+    )
+    assert response == again
+    assert {record["rule"] for record in response["records"]} == {
+        "ULA001",
+        "ULA002",
+        "ULA003",
+        "ULA004",
+        "ULA005",
+        "ULA006",
+    }
+
+    response = client.request(
+        socket_path,
+        {
+            "command": "scan_source",
+            "spec": spec,
+            "path": "buffer.py",
+            "source": "def f():\n    assert 'yes'\n",
+            "select": "ULA001",
+        },
+    )
+    assert [(r["rule"], r["path"], r["line"]) for r in response["records"]] == [
+        ("ULA001", "buffer.py", 2)
+    ]
+
+    response = client.request(socket_path, {"command": "scan", "spec": "nope.yaml"})
+    assert "error" in response
+
+
+def test_client_forwards_cli_arguments(socket_path, monkeypatch, capsys):
+    monkeypatch.chdir(ROOT)
+    status = client.main(["--socket", socket_path, "samples/", "--spec", "draft.yaml"])
+
+    assert status == 0
+    out = capsys.readouterr().out
+    assert out.startswith("Matches for 'ULA001':\n  In samples/asserts_example0.py:\n")
+
+
+def test_unexpected_errors_are_replied_to(socket_path, tmp_path):
+    spec = tmp_path / "spec.yaml"
+    spec.write_text("stmt-rules:\n  Checked: ffi(check)\n")
+
+    response = client.request(
+        socket_path,
+        {
+            "command": "scan_source",
+            "spec": str(spec),
+            "path": "buffer.py",
+            "source": "pass\n",
+        },
+    )
+    assert response == {"error": "NotImplementedError: FFI is not supported yet"}
+    assert client.request(socket_path, {"command": "ping"}) == {"ok": True}
@@ -0,0 +1,104 @@
+import io
+import os
+from pathlib import Path
+import re
+
+from ast_rule_engine.discover import discover, read_file_list
+
+
+def _make_tree(root):
+    for name in [
+        "a.py",
+        "b.txt",
+        "pkg/__init__.py",
+        "pkg/sub/c.py",
+        "pkg/sub/d.pyi",
+        ".venv/lib/site.py",
+        "build/gen.py",
+        "build/keep.py",
+        "docs/conf.py",
+    ]:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x = 1\n")
+
+
+def _glob(root, pattern, exclude):
+    return [
+        path
+        for path in root.glob(pattern)
+        if not exclude.fullmatch(str(path)) and path.is_file()
+    ]
+
+
+def test_same_files_and_order_as_glob(tmp_path):
+    _make_tree(tmp_path)
+    for pattern in ["**/*.py", "*.py", "pkg/**/*.py", "**/[cd].py*", "*/sub/*"]:
+        for exclude in [r"^\b$", r".*/\.venv/.*", r".*/gen\.py"]:
+            exclude = re.compile(exclude)
+            assert list(discover(tmp_path, pattern, exclude)) == _glob(
+                tmp_path, pattern, exclude
+            ), (pattern, exclude)
+
+
+def test_excluded_directories_are_not_listed(tmp_path, monkeypatch):
+    _make_tree(tmp_path)
+    listed = []
+    scandir = os.scandir
+
+    def spy(path):
+        listed.append(os.path.relpath(path, tmp_path))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", spy)
+    paths = list(discover(tmp_path, "**/*.py", re.compile(r".*/(\.venv|build)/.*")))
+
+    assert ".venv" not in listed and "build" not in listed
+    assert tmp_path / "pkg" / "sub" / "c.py" in paths
+
+    listed.clear()
+    list(discover(tmp_path, "*.py", re.compile(r"^\b$")))
+    assert listed == ["."]
+
+
+def test_directories_are_only_pruned_if_everything_in_them_is_excluded(tmp_path):
+    _make_tree(tmp_path)
+    (tmp_path / "build" / "sub").mkdir()
+    (tmp_path / "build" / "sub" / "c.py").write_text("x = 1\n")
+    for exclude in [
+        r".*/build/[^/]*",
+        r".*/build/|.*/x/.*",
+        r"(?!.*/sub/).*/build/.*",
+    ]:
+        exclude = re.compile(exclude)
+        paths = list(discover(tmp_path, "**/*.py", exclude))
+        assert paths == _glob(tmp_path, "**/*.py", exclude), exclude
+        assert tmp_path / "build" / "sub" / "c.py" in paths, exclude
+
+
+def test_gitignore(tmp_path):
+    _make_tree(tmp_path)
+    (tmp_path / ".gitignore").write_text(
+        "# comment\n.venv/\n/build/*\n!/build/keep.py\n"
+    )
+    (tmp_path / "pkg" / ".gitignore").write_text("sub/c.py\n")
+
+    paths = discover(tmp_path, "**/*.py", re.compile(r"^\b$"), gitignore=True)
+
+    assert sorted(str(path.relative_to(tmp_path)) for path in paths) == [
+        "a.py",
+        "build/keep.py",
+        "docs/conf.py",
+        "pkg/__init__.py",
+    ]
+
+
+def test_read_file_list(tmp_path, monkeypatch):
+    _make_tree(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    stream = io.StringIO("a.py\n\nbuild/gen.py\nmissing.py\npkg/sub/c.py\n")
+
+    assert list(read_file_list(stream, re.compile(r"build/.*"))) == [
+        Path("a.py"),
+        Path("pkg/sub/c.py"),
+    ]
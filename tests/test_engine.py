@@ -0,0 +1,101 @@
+import argparse
+import ast
+from pathlib import Path
+import re
+
+from ast_rule_engine import flake8_plugin
+from ast_rule_engine.engine import Engine
+from ast_rule_engine.flake8_plugin import Plugin
+
+
+ROOT = Path(__file__).parent.parent
+SPEC = {
+    "stmt-rules": {
+        "call": {"is(Call)": {"func": "$func"}},
+        "Returned-Call": {"is(Return)": {"value": "~call"}},
+        "Pass": "is(Pass)",
+    }
+}
+
+
+def test_engine_scans_trees_sources_and_paths(tmp_path):
+    engine = Engine.from_spec(SPEC, unselect=re.compile("Pass"))
+    source = "def f():\n    pass\n    return g()\n"
+    path = tmp_path / "a.py"
+    path.write_text(source, "utf-8")
+
+    from_tree = list(engine.scan_tree(ast.parse(source), "a.py"))
+    assert [(r.rule, r.line, r.captures) for r in from_tree] == [
+        ("Returned-Call", 3, (("func", "g"),))
+    ]
+    assert list(engine.scan_source(source, "a.py")) == from_tree
+    assert [r.rule for r in engine.scan_paths([path])] == ["Returned-Call"]
+
+
+def test_interleaved_scans_keep_their_own_tree():
+    engine = Engine.from_spec(
+        {
+            "stmt-rules": {
+                "Await-In-Loop": {":and": ["is(Await)", {":inside": "is(For)"}]}
+            }
+        }
+    )
+    source = "async def f():\n    for x in y:\n        await a\n        await b\n"
+
+    pairs = list(zip(engine.scan_source(source, "a"), engine.scan_source(source, "b")))
+
+    assert [(a.path, a.line, b.path, b.line) for a, b in pairs] == [
+        ("a", 3, "b", 3),
+        ("a", 4, "b", 4),
+    ]
+
+
+def test_flake8_plugin_reuses_the_tree_and_the_engine(monkeypatch):
+    monkeypatch.setattr(flake8_plugin, "_engines", {})
+    Plugin.parse_options(
+        argparse.Namespace(
+            ast_rule_spec=str(ROOT / "draft.yaml"), ast_rule_cache_dir=None
+        )
+    )
+    try:
+        tree = ast.parse("def test():\n    assert 'yes'\n")
+        results = list(Plugin(tree, "t.py").run())
+        list(Plugin(tree, "u.py").run())
+    finally:
+        Plugin.parse_options(
+            argparse.Namespace(ast_rule_spec=None, ast_rule_cache_dir=None)
+        )
+
+    assert results == [(2, 4, "ULA001 Assert matches this rule", Plugin)]
+    assert len(flake8_plugin._engines) == 1
+
+
+def test_flake8_plugin_leaves_flake8s_tree_alone(monkeypatch):
+    from ast_rule_engine import traverse
+
+    def rewrite(node):
+        # Stands in for the rewrite of deprecated constants on old Pythons
+        if isinstance(node, ast.Constant):
+            return ast.copy_location(ast.Constant(value=node.value), node)
+        return node
+
+    monkeypatch.setattr(traverse, "NEEDS_REWRITE", True)
+    monkeypatch.setattr(traverse, "to_constant", rewrite)
+    monkeypatch.setattr(flake8_plugin, "NEEDS_REWRITE", True)
+    monkeypatch.setattr(flake8_plugin, "_engines", {})
+    Plugin.parse_options(
+        argparse.Namespace(
+            ast_rule_spec=str(ROOT / "draft.yaml"), ast_rule_cache_dir=None
+        )
+    )
+    try:
+        tree = ast.parse("def test():\n    assert 'yes'\n")
+        constant = tree.body[0].body[0].test
+        results = list(Plugin(tree, "t.py").run())
+    finally:
+        Plugin.parse_options(
+            argparse.Namespace(ast_rule_spec=None, ast_rule_cache_dir=None)
+        )
+
+    assert results == [(2, 4, "ULA001 Assert matches this rule", Plugin)]
+    assert tree.body[0].body[0].test is constant
@@ -0,0 +1,72 @@
+import ast
+from pathlib import Path
+
+import yaml
+
+from ast_rule_engine.compile import RuleCompiler
+from ast_rule_engine.multi import MultiMatcher
+from ast_rule_engine.parse import parse
+
+
+ROOT = Path(__file__).parent.parent
+
+SOURCE = """
+assert foo(1, x)
+assert "{0}".format(bar)
+assert 0
+x = foo.bar(1) if y else [1, 2]
+print(len(x), f"{x}")
+"""
+
+
+def _check_agrees(spec):
+    patterns = parse(spec, {}.__getitem__)
+    compiler = RuleCompiler()
+    rules = compiler.compile_rules(patterns)
+    multi = MultiMatcher(patterns, rules, compiler)
+
+    trees = [ast.parse(SOURCE)]
+    trees += [ast.parse(p.read_text("utf-8")) for p in (ROOT / "samples").glob("*.py")]
+    for tree in trees:
+        for node in ast.walk(tree):
+            expected = [
+                (name, captures)
+                for name, rule in rules.items()
+                for captures in [rule.match(node)]
+                if captures is not None
+            ]
+            assert sorted(multi.match(node), key=repr) == sorted(expected, key=repr)
+
+
+def test_agrees_with_single_rules_on_draft():
+    _check_agrees(yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8")))
+
+
+def test_agrees_with_single_rules_on_rule_kinds():
+    path = ROOT / "benchmarks" / "specs" / "rule-kinds.yaml"
+    _check_agrees(yaml.safe_load(path.read_text("utf-8")))
+
+
+def test_shared_prefix_is_checked_once():
+    spec = {
+        "stmt-rules": {
+            "A": {"is(Assert)": {"test": {"is(Constant)": {"value": "=0"}}}},
+            "B": {"is(Assert)": {"test": {"is(Constant)": {"value": "=None"}}}},
+            "C": {"is(Assert)": {"test": "is(Call)"}},
+        }
+    }
+    patterns = parse(spec, {}.__getitem__)
+    compiler = RuleCompiler()
+    multi = MultiMatcher(patterns, compiler.compile_rules(patterns), compiler)
+
+    fetched = []
+
+    class Spy(ast.Assert):
+        def __getattribute__(self, name):
+            if name == "test":
+                fetched.append(name)
+            return super().__getattribute__(name)
+
+    node = Spy(test=ast.Constant(value=None))
+    assert multi.match(node) == [("B", {})]
+    assert fetched == ["test"]
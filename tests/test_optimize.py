@@ -0,0 +1,141 @@
+import ast
+from pathlib import Path
+
+import yaml
+
+from ast_rule_engine.compile import compile_rules
+from ast_rule_engine.draft import (
+    AndRule,
+    BoxValueRule,
+    BoxValueSetRule,
+    IsAnyRule,
+    IsRule,
+    NotRule,
+    OrRule,
+    RefRule,
+    VarRule,
+)
+from ast_rule_engine.optimize import optimize
+from ast_rule_engine.parse import parse
+from ast_rule_engine.patch_const import LegacyConstantRewriter
+from ast_rule_engine.scan import Scanner
+from tests.helpers import parse_rules
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_constants_and_bare_types_are_collapsed():
+    patterns = optimize(
+        parse_rules(
+            names={":or": ['="a"', '="b"', "=1", '="c"', "=..."]},
+            types={":or": ["is(Name)", "is(Constant)", "is(Attribute)"]},
+        )
+    )
+
+    names = patterns["names"]
+    assert isinstance(names, OrRule)
+    assert names.patterns[0] == BoxValueSetRule(str, frozenset("abc"))
+    assert len(names.patterns) == 3
+    assert patterns["types"] == IsAnyRule(("Name", "Constant", "Attribute"))
+
+
+def test_branches_do_not_move_past_captures():
+    patterns = optimize(parse_rules(a={":or": ['="a"', "$x", '="b"', '="c"']}))
+
+    branches = patterns["a"].patterns
+    assert branches[0].value == "a"
+    assert branches[1] == VarRule("x")
+    assert branches[2] == BoxValueSetRule(str, frozenset("bc"))
+
+
+def test_cheap_branches_run_first():
+    patterns = optimize(
+        parse_rules(
+            other="is(Name)",
+            a={
+                ":or": [
+                    "~other",
+                    {"is(Call)": {"func": {"is(Name)": {"id": '="a"'}}}},
+                    "is(Name)",
+                ]
+            },
+        )
+    )
+
+    branches = patterns["a"].patterns
+    assert branches[0] == IsRule("Name", {})
+    assert branches[1].class_name == "Call"
+    assert isinstance(branches[2], RefRule)
+
+
+def test_captures_keep_their_order_in_and():
+    patterns = optimize(
+        parse_rules(a={":and": [{"is(Call)": {"func": "$f"}}, "$x", "is(Call)"]})
+    )
+
+    pattern = patterns["a"]
+    assert isinstance(pattern, AndRule)
+    assert pattern.patterns[0] == IsRule("Call", {})
+    assert pattern.patterns[1].attribute_rules == {"func": VarRule("f")}
+    assert pattern.patterns[2] == VarRule("x")
+
+
+def test_optimized_rules_match_the_same():
+    spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    spec["stmt-rules"]["flags"] = {
+        "is(Constant)": {"value": {":or": ["=True", "=1", "=0", "=None"]}}
+    }
+    patterns = parse(spec, {}.__getitem__)
+    plain = compile_rules(patterns)
+    optimized = compile_rules(optimize(patterns))
+
+    source = "x = 1\ny = True\nz = None\nlen(x)\nfoo(x)\n"
+    trees = [ast.parse(source)] + [
+        ast.parse(path.read_text("utf-8"))
+        for path in sorted((ROOT / "samples").glob("*.py"))
+    ]
+    for tree in trees:
+        LegacyConstantRewriter().visit(tree)
+        for node in ast.walk(tree):
+            for name in patterns:
+                assert optimized[name].match(node) == plain[name].match(node), name
+
+
+def test_adaptive_order_matches_the_same():
+    spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    patterns = {
+        name: pattern
+        for name, pattern in optimize(parse(spec, {}.__getitem__)).items()
+        if name[0].isupper()
+    }
+    trees = [
+        ast.parse(path.read_text("utf-8"))
+        for path in sorted((ROOT / "samples").glob("*.py"))
+    ]
+    plain = Scanner(patterns)
+    adaptive = Scanner(patterns, adaptive_order=True)
+
+    # Enough rounds for the adaptive predicates to settle on an order
+    for _ in range(20):
+        for tree in trees:
+            assert list(adaptive.scan_tree("x.py", tree)) == list(
+                plain.scan_tree("x.py", tree)
+            )
+
+
+def test_branches_do_not_move_past_ffi():
+    patterns = optimize(
+        parse(
+            {"stmt-rules": {"a": {":or": ['="a"', "not(ffi(check))", '="b"']}}},
+            {}.__getitem__,
+        )
+    )
+
+    branches = patterns["a"].patterns
+    # Captures under `:not` are thrown away, but the call still happens
+    assert [type(branch) for branch in branches] == [
+        BoxValueRule,
+        NotRule,
+        BoxValueRule,
+    ]
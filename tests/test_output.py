@@ -0,0 +1,97 @@
+import io
+import json
+
+from ast_rule_engine.output import make_renderer
+from ast_rule_engine.parse import parse
+from ast_rule_engine.scan import MatchRecord, Scanner
+
+
+RECORDS = [
+    MatchRecord("b", "pkg/x.py", 1, 0, "Call", (("func", "f"),), 1, 3),
+    MatchRecord("a", "pkg/x.py", 2, 4, "Pass", (), 2, 8),
+    MatchRecord("b", "y.py", 3, 0, "Call", (("func", "g"),), 4, 1),
+]
+
+
+class _Stream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.flushed_at = []
+
+    def flush(self):
+        self.flushed_at.append(len(self.getvalue().splitlines()))
+
+
+def _render(output_format, stream):
+    renderer = make_renderer(output_format, stream, ["a", "b"])
+    for i, record in enumerate(RECORDS):
+        renderer.add(record)
+        if i + 1 == len(RECORDS) or RECORDS[i + 1].path != record.path:
+            renderer.file_done(record.path)
+    renderer.close()
+    return stream.getvalue()
+
+
+def test_text_is_grouped_by_rule():
+    assert _render("text", io.StringIO()) == (
+        "Matches for 'a':\n"
+        "  In pkg/x.py:\n"
+        "    at line 2, col 4: Pass\n"
+        "Matches for 'b':\n"
+        "  In pkg/x.py:\n"
+        "    at line 1, col 0: Call\n"
+        "      - func: f\n"
+        "  In y.py:\n"
+        "    at line 3, col 0: Call\n"
+        "      - func: g\n"
+    )
+
+
+def test_json_lines_are_flushed_per_file():
+    stream = _Stream()
+    lines = _render("jsonl", stream).splitlines()
+
+    assert [json.loads(line) for line in lines][0] == {
+        "path": "pkg/x.py",
+        "rule": "b",
+        "line": 1,
+        "col": 0,
+        "end_line": 1,
+        "end_col": 3,
+        "node_type": "Call",
+        "captures": {"func": "f"},
+    }
+    assert stream.flushed_at == [2, 3, 3]
+
+
+def test_json_lines_are_flushed_when_a_file_is_done(tmp_path):
+    (tmp_path / "a.py").write_text("pass\n")
+    (tmp_path / "b.py").write_text("x = 1\n")
+    (tmp_path / "c.py").write_text("x = 2\n")
+    scanner = Scanner(parse({"stmt-rules": {"Pass": "is(Pass)"}}, {}.__getitem__))
+    stream = _Stream()
+    renderer = make_renderer("jsonl", stream, ["Pass"])
+    scanned = []
+
+    def on_file_done(path):
+        renderer.file_done(str(path))
+        scanned.append((path.name, list(stream.flushed_at)))
+
+    paths = [tmp_path / name for name in ["a.py", "b.py", "c.py"]]
+    for record in scanner.scan_paths(paths, on_file_done=on_file_done):
+        renderer.add(record)
+
+    assert scanned == [("a.py", [1]), ("b.py", [1, 1]), ("c.py", [1, 1, 1])]
+
+
+def test_sarif():
+    log = json.loads(_render("sarif", io.StringIO()))
+
+    (run,) = log["runs"]
+    assert log["version"] == "2.1.0"
+    assert run["tool"]["driver"]["rules"] == [{"id": "a"}, {"id": "b"}]
+    assert [result["ruleId"] for result in run["results"]] == ["b", "a", "b"]
+    assert run["results"][2]["locations"][0]["physicalLocation"] == {
+        "artifactLocation": {"uri": "y.py"},
+        "region": {"startLine": 3, "startColumn": 1, "endLine": 4, "endColumn": 2},
+    }
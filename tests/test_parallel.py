@@ -0,0 +1,25 @@
+from pathlib import Path
+
+import yaml
+
+from ast_rule_engine.parallel import scan_paths_parallel
+from ast_rule_engine.parse import parse
+from ast_rule_engine.scan import Scanner
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_parallel_output_is_identical_to_serial():
+    raw_spec = yaml.safe_load((ROOT / "draft.yaml").read_text("utf-8"))
+    paths = sorted((ROOT / "samples").glob("*.py"))
+
+    serial = list(Scanner(parse(raw_spec, {}.__getitem__)).scan_paths(paths))
+    parallel = list(
+        scan_paths_parallel(
+            raw_spec, list(raw_spec["stmt-rules"]), {}.__getitem__, paths, jobs=2
+        )
+    )
+
+    assert parallel == serial
+    assert serial
@@ -0,0 +1,65 @@
+from ast_rule_engine.analysis import required_tokens
+from ast_rule_engine.optimize import optimize
+from ast_rule_engine.prefilter import TokenFilter
+from ast_rule_engine.scan import Scanner
+from tests.helpers import parse_rules
+
+
+def test_required_tokens():
+    patterns = optimize(
+        parse_rules(
+            fmt={"is(Attribute)": {"attr": '="format"'}},
+            imports={"is(ImportFrom)": {"module": '="os.path"'}},
+            names={"is(Name)": {"id": {":or": ['="len"', '="print"']}}},
+            untyped="$x",
+            strings={"is(Constant)": {"value": '="assert"'}},
+        )
+    )
+
+    assert required_tokens(patterns["fmt"]) == {
+        frozenset(["."]),
+        frozenset(["format"]),
+    }
+    assert required_tokens(patterns["imports"]) == {
+        frozenset(["from"]),
+        frozenset(["import"]),
+        frozenset(["os"]),
+        frozenset(["path"]),
+    }
+    assert required_tokens(patterns["names"]) == {frozenset(["len", "print"])}
+    assert required_tokens(patterns["untyped"]) == frozenset()
+    # String constants can be spelt with escapes
+    assert required_tokens(patterns["strings"]) == frozenset()
+
+
+def test_filter_is_off_if_any_rule_needs_no_text():
+    patterns = optimize(parse_rules(a="is(Assert)", b="not(is(Pass))"))
+    assert TokenFilter.for_patterns(patterns) is None
+
+
+def test_might_match():
+    patterns = optimize(
+        parse_rules(a="is(Assert)", b={"is(Attribute)": {"attr": '="format"'}})
+    )
+    token_filter = TokenFilter.for_patterns(patterns)
+
+    assert token_filter.might_match(b"assert x")
+    assert token_filter.might_match(b"'{}'.format(1)")
+    assert not token_filter.might_match(b"format(1)")
+    assert not token_filter.might_match(b"")
+    # Identifiers are normalized, so non-ASCII files always need parsing
+    assert token_filter.might_match("ﬁle = 1".encode("utf-8"))
+
+
+def test_scanner_skips_files_that_cannot_match(tmp_path):
+    skipped = tmp_path / "skipped.py"
+    skipped.write_text("x = 1\n")
+    empty = tmp_path / "empty.py"
+    empty.write_text("")
+    scanned = tmp_path / "scanned.py"
+    scanned.write_text("assert x\n")
+    scanner = Scanner(optimize(parse_rules(a="is(Assert)")))
+
+    assert not scanner.prefilter.might_match_file(skipped)
+    assert not scanner.prefilter.might_match_file(empty)
+    assert [record.line for record in scanner.scan_file(scanned)] == [1]
@@ -0,0 +1,70 @@
+import ast
+import json
+
+from ast_rule_engine.__main__ import options_from_args, parser
+from ast_rule_engine.cli import run_cli
+from ast_rule_engine.compile import compile_rules
+from ast_rule_engine.parse import parse
+from ast_rule_engine.profiling import Profiler
+
+
+def test_profiler_counts_rules_refs_and_branches():
+    spec = {
+        "stmt-rules": {
+            "const": {":or": ["is(Constant)", "is(Name)"]},
+            "Assert-Const": {"is(Assert)": {"test": "~const"}},
+        }
+    }
+    profiler = Profiler()
+    rules = compile_rules(parse(spec, {}.__getitem__), profiler=profiler)
+
+    for stmt in ast.parse("assert 1\nassert x\nassert f()").body:
+        rules["Assert-Const"].test(stmt)
+
+    top = profiler.rules["Assert-Const"]
+    assert (top.attempts, top.successes, top.failures) == (3, 2, 1)
+    assert profiler.rules["~const"].attempts == 3
+    assert top.self_time <= top.total_time
+    assert profiler.branches["const:or#0"] == [1, 1, 1]
+    assert "Assert-Const" in profiler.format_report()
+
+
+def test_startup_phases_are_reported():
+    profiler = Profiler()
+    profiler.record_startup("spec", 0.25)
+    profiler.record_startup("compile", 0.5)
+
+    assert profiler.to_json()["startup"] == {"spec": 0.25, "compile": 0.5}
+    assert "Startup: 0.7500s (spec 0.2500s, compile 0.5000s)" in (
+        profiler.format_report()
+    )
+
+
+def test_cli_profile_counts_branches_in_written_order(tmp_path):
+    # Optimizing would merge the bare types and move them to the front
+    (tmp_path / "spec.yaml").write_text(
+        "stmt-rules:\n"
+        "  Call-Or-Name:\n"
+        "    :or:\n"
+        "      - is(Call): {func: is(Attribute)}\n"
+        "      - is(Name)\n"
+        "      - is(Constant)\n",
+        "utf-8",
+    )
+    (tmp_path / "a.py").write_text("a.b()\n", "utf-8")
+    report = tmp_path / "profile.json"
+    args = parser.parse_args(
+        [
+            str(tmp_path),
+            "--spec",
+            str(tmp_path / "spec.yaml"),
+            "--profile-json",
+            str(report),
+        ]
+    )
+
+    run_cli(options_from_args(args))
+
+    # The call, the name `a` and nothing for the attribute
+    branches = json.loads(report.read_text("utf-8"))["branches"]
+    assert branches == {"Call-Or-Name:or#0": [1, 1, 0, 0]}
@@ -0,0 +1,181 @@
+import ast
+
+import pytest
+
+from ast_rule_engine.draft import Box
+from ast_rule_engine.parse import parse
+from ast_rule_engine.scan import (
+    FileTimeout,
+    MatchLimits,
+    MatchRecord,
+    Scanner,
+    group_by_rule,
+    limit_matches,
+    render_term,
+)
+
+
+def test_scan_tree_records():
+    patterns = parse(
+        {"stmt-rules": {"call": {"is(Call)": {"func": "$func", "args": "$args"}}}},
+        {}.__getitem__,
+    )
+    scanner = Scanner(patterns)
+    records = list(scanner.scan_tree("x.py", ast.parse("\nfoo.bar(1, 'a')")))
+
+    assert records == [
+        MatchRecord(
+            "call",
+            "x.py",
+            2,
+            0,
+            "Call",
+            (("func", "foo.bar"), ("args", "[1, 'a']")),
+            2,
+            15,
+        ),
+    ]
+
+
+def test_scan_tree_skips_files_and_subtrees_without_required_nodes():
+    patterns = parse(
+        {
+            "stmt-rules": {
+                "fstring": "is(JoinedStr)",
+                "returned-call": {"is(Return)": {"value": "is(Call)"}},
+            }
+        },
+        {}.__getitem__,
+    )
+    scanner = Scanner(patterns)
+    seen = []
+
+    def match_node(node):
+        seen.append(type(node))
+        return []
+
+    scanner._matchers[("returned-call",)] = match_node
+
+    assert list(scanner.scan_tree("x.py", ast.parse("x = 1\nreturn 2"))) == []
+    assert seen == []
+
+    source = "x = [a + b for a in c]\ndef f():\n    return g()"
+    assert list(scanner.scan_tree("x.py", ast.parse(source))) == []
+    assert seen == [ast.Module, ast.FunctionDef, ast.Return]
+
+    # `f` has a `Return` to start at, but nothing in it has the `Call`
+    seen.clear()
+    source = "def f():\n    return 1\ndef g():\n    return h()"
+    assert list(scanner.scan_tree("x.py", ast.parse(source))) == []
+    assert seen == [ast.Module, ast.FunctionDef, ast.Return]
+
+
+def test_render_term_box():
+    assert render_term(Box("id")) == "'id'"
+
+
+def test_group_by_rule_keeps_empty_rules():
+    record = MatchRecord("b", "x.py", 1, 0, "Pass", ())
+    assert group_by_rule([record], ["a", "b"]) == {"a": {}, "b": {"x.py": [record]}}
+
+
+def test_limit_matches_disables_rules_and_stops_early(tmp_path):
+    patterns = parse(
+        {"stmt-rules": {"pass": "is(Pass)", "name": "is(Name)"}}, {}.__getitem__
+    )
+    scanner = Scanner(patterns)
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / "{0}.py".format(i))
+        paths[-1].write_text("pass\nx\npass\n", "utf-8")
+
+    scanned = []
+
+    def scan_paths():
+        for path in paths:
+            scanned.append(path)
+            yield from scanner.scan_file(path)
+
+    first = MatchLimits(first_match_per_rule=True)
+    records = list(limit_matches(scan_paths(), first, scanner.disabled.add))
+    assert [(r.rule, r.path, r.line) for r in records] == [
+        ("pass", str(paths[0]), 1),
+        ("name", str(paths[0]), 2),
+    ]
+    assert scanner.disabled == {"pass", "name"}
+    assert scanner.scan_file(paths[1]) == []
+
+    scanner.disabled.clear()
+    scanned.clear()
+    limited = limit_matches(scan_paths(), MatchLimits(max_matches=4), lambda rule: None)
+    assert len(list(limited)) == 4
+    assert scanned == paths[:2]
+
+
+def test_file_timeout(tmp_path):
+    patterns = parse({"stmt-rules": {"pass": "is(Pass)"}}, {}.__getitem__)
+    path = tmp_path / "a.py"
+    path.write_text("pass\n", "utf-8")
+    scanner = Scanner(patterns, file_timeout=0.0)
+
+    with pytest.raises(FileTimeout):
+        scanner.scan_file(path)
+
+    skipped = []
+    assert list(scanner.scan_paths([path], skipped.append)) == []
+    assert [error.path for error in skipped] == [str(path)]
+
+
+def test_has_and_inside():
+    patterns = parse(
+        {
+            "stmt-rules": {
+                "loop-with-call": {
+                    ":and": [
+                        "is(For)",
+                        {":has": {"is(Call)": {"func": {"is(Name)": {"id": "$f"}}}}},
+                    ]
+                },
+                "name-in-call": {
+                    ":and": [
+                        "is(Name)",
+                        {":inside": {"is(Call)": {"func": "$func"}}},
+                    ]
+                },
+            }
+        },
+        {}.__getitem__,
+    )
+    source = "for x in y:\n    a(b(c))\n    d()\n"
+    scanner = Scanner(patterns)
+    records = [
+        (record.rule, record.line, record.col, record.captures)
+        for record in scanner.scan_tree("x.py", ast.parse(source))
+    ]
+
+    # The first descendant in source order, and the nearest ancestor
+    assert records == [
+        ("loop-with-call", 1, 0, (("f", "'a'"),)),
+        ("name-in-call", 2, 4, (("func", "a"),)),
+        ("name-in-call", 2, 6, (("func", "b"),)),
+        ("name-in-call", 2, 8, (("func", "b"),)),
+        ("name-in-call", 3, 4, (("func", "d"),)),
+    ]
+
+
+@pytest.mark.skipif(not hasattr(ast, "Str"), reason="No deprecated node classes")
+def test_deprecated_node_classes():
+    patterns = parse(
+        {
+            "stmt-rules": {
+                "str": "is(Str)",
+                "str-value": {"is(Str)": {"s": "$s"}},
+                "num-or-name": {":or": ["is(Num)", "is(Name)"]},
+            }
+        },
+        {}.__getitem__,
+    )
+    tree = ast.parse("x = 'a'\n")
+    records = [(r.rule, r.col) for r in Scanner(patterns).scan_tree("x.py", tree)]
+
+    assert records == [("num-or-name", 0), ("str", 4), ("str-value", 4)]
@@ -0,0 +1,60 @@
+import ast
+from pathlib import Path
+
+from ast_rule_engine import spec_cache
+from ast_rule_engine.scan import Scanner
+from ast_rule_engine.spec_cache import load_patterns
+
+
+SPEC = Path(__file__).parent.parent / "draft.yaml"
+
+
+def _no_ffi(name):
+    raise NotImplementedError(name)
+
+
+def _matches(patterns):
+    tree = ast.parse("assert 'yes'\nx == None\n")
+    return [
+        (record.rule, record.line)
+        for record in Scanner(patterns).scan_tree("a.py", tree)
+    ]
+
+
+def test_second_load_comes_from_the_cache(tmp_path, monkeypatch):
+    raw_spec, patterns = load_patterns(SPEC, _no_ffi, tmp_path)
+    assert len(list((tmp_path / "specs").iterdir())) == 1
+
+    def fail(*args):
+        raise AssertionError("parsed the spec again")
+
+    monkeypatch.setattr(spec_cache, "_parse", fail)
+    cached_raw_spec, cached = load_patterns(SPEC, _no_ffi, tmp_path)
+
+    assert cached_raw_spec == raw_spec
+    assert list(cached) == list(patterns)
+    assert _matches(cached) == _matches(patterns) != []
+
+
+def test_key_depends_on_contents(tmp_path):
+    spec = tmp_path / "spec.yaml"
+    spec.write_text("stmt-rules:\n  A: is(Pass)\n", "utf-8")
+    assert list(load_patterns(spec, _no_ffi, tmp_path / "cache")[1]) == ["A"]
+
+    spec.write_text("stmt-rules:\n  B: is(Pass)\n", "utf-8")
+    assert list(load_patterns(spec, _no_ffi, tmp_path / "cache")[1]) == ["B"]
+
+
+def test_corrupt_entries_are_misses(tmp_path):
+    load_patterns(SPEC, _no_ffi, tmp_path)
+    (entry,) = (tmp_path / "specs").iterdir()
+    entry.write_bytes(b"garbage")
+
+    _, patterns = load_patterns(SPEC, _no_ffi, tmp_path)
+    assert "ULA001" in patterns
+
+
+def test_unpicklable_ffi_is_not_cached(tmp_path):
+    _, patterns = load_patterns(SPEC, lambda name: _no_ffi, tmp_path)
+    assert "ULA001" in patterns
+    assert not (tmp_path / "specs").exists()
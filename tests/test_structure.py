@@ -0,0 +1,41 @@
+import ast
+from pathlib import Path
+
+from ast_rule_engine.structure import TreeIndex
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def _walk_below(node):
+    below = []
+    for child in ast.iter_child_nodes(node):
+        below.append(child)
+        below.extend(_walk_below(child))
+    return below
+
+
+def test_descendants_and_ancestors_agree_with_walking():
+    tree = ast.parse((ROOT / "samples" / "asserts_example0.py").read_text("utf-8"))
+    index = TreeIndex()
+    index.load_tree(tree)
+
+    for node in ast.walk(tree):
+        below = _walk_below(node)
+        assert index.descendants(node) == below
+        assert index.descendants(node, (ast.expr, ast.Return)) == [
+            other for other in below if isinstance(other, (ast.expr, ast.Return))
+        ]
+        if not isinstance(node, (ast.expr_context, ast.operator)):
+            for ancestor in index.ancestors(node):
+                assert node in _walk_below(ancestor)
+
+
+def test_unloaded_nodes_are_walked():
+    tree = ast.parse("f(x)\n")
+    index = TreeIndex()
+
+    assert index.descendants(tree, (ast.Name,)) == [
+        node for node in ast.walk(tree) if isinstance(node, ast.Name)
+    ]
+    assert list(index.ancestors(tree.body[0])) == []
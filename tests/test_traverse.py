@@ -0,0 +1,43 @@
+import ast
+from pathlib import Path
+import sys
+
+from ast_rule_engine.traverse import preorder
+
+
+ROOT = Path(__file__).parent.parent
+
+
+class _Collector(ast.NodeVisitor):
+    def __init__(self):
+        self.nodes = []
+
+    def visit(self, node):
+        self.nodes.append(node)
+        super().visit(node)
+
+
+def test_same_order_as_node_visitor():
+    for path in sorted((ROOT / "samples").glob("*.py")):
+        tree = ast.parse(path.read_text("utf-8"))
+        collector = _Collector()
+        collector.visit(tree)
+
+        nodes, parents = preorder(tree)
+
+        assert nodes == collector.nodes
+        assert parents[0] == -1
+        for node, parent in zip(nodes[1:], parents[1:]):
+            assert node in ast.iter_child_nodes(nodes[parent])
+
+
+def test_deep_trees_do_not_hit_the_recursion_limit():
+    depth = sys.getrecursionlimit() * 10
+    expr = ast.Name(id="x", ctx=ast.Load())
+    for _ in range(depth):
+        expr = ast.UnaryOp(op=ast.Not(), operand=expr)
+
+    nodes, _ = preorder(ast.Expression(body=expr))
+
+    # Each level is a UnaryOp and its Not
+    assert len(nodes) == 2 * depth + 3
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from ast_rule_engine.compile import LeftRecursionError
+from ast_rule_engine.parse import parse
+from ast_rule_engine.scan import Scanner
+from ast_rule_engine.watch import Watcher
+
+
+def _touch(path, text, tick):
+    path.write_text(text)
+    os.utime(path, ns=(tick * 10**9, tick * 10**9))
+
+
+def test_refresh_reports_changes(tmp_path):
+    spec = tmp_path / "spec.txt"
+    _touch(spec, "is(Assert)", 1)
+    a = tmp_path / "a.py"
+    _touch(a, "assert x\n", 1)
+    b = tmp_path / "b.py"
+    _touch(b, "x = 1\n", 1)
+    scanned = []
+
+    def load_scanner():
+        rule = spec.read_text()
+        scanner = Scanner(parse({"stmt-rules": {"r": rule}}, {}.__getitem__))
+        scan_file = scanner.scan_file
+
+        def spy(path):
+            scanned.append(path.name)
+            return scan_file(path)
+
+        scanner.scan_file = spy
+        return scanner
+
+    errors = []
+    watcher = Watcher(
+        load_scanner,
+        lambda: sorted(tmp_path.glob("*.py")),
+        spec,
+        lambda path, error: errors.append(path.name),
+    )
+
+    added, removed = watcher.refresh()
+    assert [(r.path, r.line) for r in added] == [(str(a), 1)]
+    assert removed == []
+
+    scanned.clear()
+    assert watcher.refresh() == ([], [])
+    assert scanned == []
+
+    _touch(b, "x = 1\nassert y\n", 2)
+    added, removed = watcher.refresh()
+    assert scanned == ["b.py"]
+    assert [(r.path, r.line) for r in added] == [(str(b), 2)]
+    assert removed == []
+
+    _touch(b, "assert (\n", 3)
+    assert watcher.refresh() == ([], [])
+    assert errors == ["b.py"]
+    _touch(b, "x = 1\nassert y\n", 4)
+    assert watcher.refresh() == ([], [])
+
+    a.unlink()
+    added, removed = watcher.refresh()
+    assert added == []
+    assert [(r.path, r.line) for r in removed] == [(str(a), 1)]
+
+    scanned.clear()
+    _touch(spec, "is(Name)", 2)
+    added, removed = watcher.refresh()
+    assert scanned == ["b.py"]
+    assert [(r.node_type, r.line) for r in added] == [("Name", 1), ("Name", 2)]
+    assert [(r.node_type, r.line) for r in removed] == [("Assert", 2)]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [LeftRecursionError("r", "Assert", 1), FileNotFoundError(2, "No such file")],
+)
+def test_files_that_fail_are_retried(tmp_path, error):
+    spec = tmp_path / "spec.txt"
+    _touch(spec, "is(Assert)", 1)
+    a = tmp_path / "a.py"
+    _touch(a, "assert x\n", 1)
+    b = tmp_path / "b.py"
+    _touch(b, "assert y\n", 1)
+    failing = {"b.py"}
+
+    def load_scanner():
+        scanner = Scanner(parse({"stmt-rules": {"r": "is(Assert)"}}, {}.__getitem__))
+        scan_file = scanner.scan_file
+
+        def flaky(path):
+            if path.name in failing:
+                raise error
+            return scan_file(path)
+
+        scanner.scan_file = flaky
+        return scanner
+
+    errors = []
+    watcher = Watcher(
+        load_scanner,
+        lambda: sorted(tmp_path.glob("*.py")),
+        spec,
+        lambda path, error: errors.append(path.name),
+    )
+
+    added, _ = watcher.refresh()
+    assert [r.path for r in added] == [str(a)]
+    assert watcher.refresh() == ([], [])
+    assert errors == ["b.py"]
+
+    failing.clear()
+    added, _ = watcher.refresh()
+    assert [r.path for r in added] == [str(b)]